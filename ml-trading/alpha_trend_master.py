@@ -24,40 +24,55 @@ import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_store import indicator_dir, load_m5, load_resampled
+from indicator_cache import indicator, persist_to, register
+from indicators import TrailingStopState, njit
+from engine import equity_curve, run_backtest, run_backtest_risks
+from metrics import batch_metrics, summarize
+from signals import LONG, SHORT, build_signals
+from result_store import cached_sweep
+
 DATA_M5 = os.path.join(os.path.dirname(__file__), 'data', 'BTCUSDT_M5.csv')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'backtest_results')
 
 
-def resample_ohlcv(df_5m, freq='30min'):
-    df = df_5m.copy()
-    df.index = pd.DatetimeIndex(df['timestamp'])
-    ohlcv = df.resample(freq).agg({
-        'open': 'first', 'high': 'max', 'low': 'min',
-        'close': 'last', 'volume': 'sum',
-    }).dropna()
-    ohlcv['timestamp'] = ohlcv.index
-    return ohlcv.reset_index(drop=True)
+@njit(cache=True)
+def _trailing_stop_kernel(c, atr, keyvalues, stops):
+    # one pass over the bars, one column per keyvalue (PineScript ATR trailing stop)
+    n, k = stops.shape
+    for j in range(k):
+        stops[0, j] = 0.0
+    for i in range(1, n):
+        for j in range(k):
+            nl = keyvalues[j] * atr[i]
+            prev_stop = stops[i-1, j]
+            if c[i] > prev_stop and c[i-1] > prev_stop:
+                v = c[i] - nl
+                stops[i, j] = v if v > prev_stop else prev_stop
+            elif c[i] < prev_stop and c[i-1] < prev_stop:
+                v = c[i] + nl
+                stops[i, j] = v if v < prev_stop else prev_stop
+            elif c[i] > prev_stop:
+                stops[i, j] = c[i] - nl
+            else:
+                stops[i, j] = c[i] + nl
 
 
-def calc_ema(values, period):
-    return pd.Series(values).ewm(span=period, adjust=False).mean().values
+def atr_trailing_stops(df, keyvalues=(50.0,), atr_period=5):
+    """
+    ATR trailing stops for several keyvalues in one pass, sharing one ATR series.
+    Returns (stops (bars x keyvalues), atr).
+    """
+    c = df['close'].values.astype(float)
+    atr = indicator(df, 'atr', atr_period)
+    stops = np.zeros((len(c), len(keyvalues)))
+    if len(c) > 0:
+        _trailing_stop_kernel(c, np.ascontiguousarray(atr, dtype=float),
+                              np.array(keyvalues, dtype=float), stops)
+    return stops, atr
 
 
-def calc_atr(df, period=5):
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    c = df['close'].values.astype(float)
-    n = len(c)
-    tr = np.zeros(n)
-    tr[0] = h[0] - l[0]
-    for i in range(1, n):
-        tr[i] = max(h[i] - l[i], abs(h[i] - c[i-1]), abs(l[i] - c[i-1]))
-    # RMA (Wilder's smoothing) like TradingView ta.atr
-    atr = np.zeros(n)
-    atr[period-1] = np.mean(tr[:period])
-    for i in range(period, n):
-        atr[i] = (atr[i-1] * (period - 1) + tr[i]) / period
-    return atr
+register('atr_trailing_stops', atr_trailing_stops, TrailingStopState)
 
 
 def calc_atr_trailing_stop(df, keyvalue=50.0, atr_period=5):
@@ -66,193 +81,92 @@ def calc_atr_trailing_stop(df, keyvalue=50.0, atr_period=5):
     nLoss = keyvalue * ATR
     Trailing stop follows price with nLoss distance
     """
-    c = df['close'].values.astype(float)
-    n = len(c)
-    atr = calc_atr(df, atr_period)
-
-    nLoss = keyvalue * atr
-    xATRTrailingStop = np.zeros(n)
-
-    for i in range(1, n):
-        nl = nLoss[i]
-        prev_stop = xATRTrailingStop[i-1]
-
-        if c[i] > prev_stop and c[i-1] > prev_stop:
-            xATRTrailingStop[i] = max(prev_stop, c[i] - nl)
-        elif c[i] < prev_stop and c[i-1] < prev_stop:
-            xATRTrailingStop[i] = min(prev_stop, c[i] + nl)
-        elif c[i] > prev_stop:
-            xATRTrailingStop[i] = c[i] - nl
-        else:
-            xATRTrailingStop[i] = c[i] + nl
-
-    return xATRTrailingStop, atr
+    stops, atr = atr_trailing_stops(df, (keyvalue,), atr_period)
+    return stops[:, 0], atr
 
 
-def generate_signals_alpha(df, keyvalue=50.0, atr_period=5, ema_period=1000):
+def generate_signals_alpha(df, keyvalue=50.0, atr_period=5, ema_period=1000, keyvalues=None):
     """
     Generate Alpha Trend Master signals
     LONG: close crosses above ATR trailing stop AND close > EMA(1000)
     SHORT: close crosses below ATR trailing stop AND close < EMA(1000)
+
+    keyvalues: optional keyvalue set (containing keyvalue) whose stops are computed
+    together and cached as one (bars x keyvalues) matrix; keyvalue picks the column.
     """
     c = df['close'].values.astype(float)
-    n = len(c)
 
-    trailing_stop, atr = calc_atr_trailing_stop(df, keyvalue, atr_period)
-    ema_filter = calc_ema(c, ema_period)
+    keyvalues = tuple(keyvalues) if keyvalues else (keyvalue,)
+    stops, atr = indicator(df, 'atr_trailing_stops', keyvalues, atr_period)
+    trailing_stop = stops[:, keyvalues.index(keyvalue)]
+    ema_filter = indicator(df, 'ema', ema_period)
 
-    signals = []
+    # Cross above / below trailing stop, EMA filter
+    c_prev = np.r_[np.nan, c[:-1]]; ts_prev = np.r_[np.nan, trailing_stop[:-1]]
+    long_mask = (c > trailing_stop) & (c_prev <= ts_prev) & (c > ema_filter)
+    short_mask = (c < trailing_stop) & (c_prev >= ts_prev) & (c < ema_filter)
     start_bar = max(ema_period, atr_period) + 10
-
-    for i in range(start_bar, n):
-        # Cross above trailing stop
-        if c[i] > trailing_stop[i] and c[i-1] <= trailing_stop[i-1]:
-            if c[i] > ema_filter[i]:  # EMA filter
-                signals.append({
-                    'bar': i, 'direction': 'LONG', 'price': c[i],
-                    'atr': atr[i], 'trailing_stop': trailing_stop[i],
-                    'timestamp': df['timestamp'].iloc[i]
-                })
-        # Cross below trailing stop
-        elif c[i] < trailing_stop[i] and c[i-1] >= trailing_stop[i-1]:
-            if c[i] < ema_filter[i]:  # EMA filter
-                signals.append({
-                    'bar': i, 'direction': 'SHORT', 'price': c[i],
-                    'atr': atr[i], 'trailing_stop': trailing_stop[i],
-                    'timestamp': df['timestamp'].iloc[i]
-                })
+    signals = build_signals(long_mask, short_mask, start_bar, c, atr, trailing_stop=trailing_stop)
 
     return signals, trailing_stop, atr, ema_filter
 
 
-def backtest_fixed_pct(df, signals, sl_pct=0.05, tp_pct=0.15, fee=0.0006, max_hold=200, risk=0.02):
-    """Backtest with fixed percentage SL/TP"""
-    c = df['close'].values.astype(float)
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    n = len(c)
-    trades = []; equity = 10000.0
-    eq_curve = [{'bar':0,'equity':equity,'timestamp':df['timestamp'].iloc[0]}]
-    i = 0
-    while i < len(signals):
-        sig = signals[i]; eb=sig['bar']; ep=sig['price']; d=sig['direction']
-        sl_dist = ep * sl_pct
-        if sl_dist <= 0: i+=1; continue
-
-        if d == 'LONG':
-            sl = ep * (1 - sl_pct)
-            tp = ep * (1 + tp_pct)
-        else:
-            sl = ep * (1 + sl_pct)
-            tp = ep * (1 - tp_pct)
-
-        rk = abs(ep - sl)
-        if rk <= 0 or rk/ep > 0.10: i+=1; continue
-        ps = (equity * risk) / rk; ec = ep * ps * fee
-
-        xb=xp=xr=None
-        for bar in range(eb+1, min(eb+max_hold, n)):
-            if d == 'LONG':
-                if l[bar] <= sl: xb,xp,xr=bar,sl,'SL'; break
-                if h[bar] >= tp: xb,xp,xr=bar,tp,'TP'; break
-            else:
-                if h[bar] >= sl: xb,xp,xr=bar,sl,'SL'; break
-                if l[bar] <= tp: xb,xp,xr=bar,tp,'TP'; break
-        if xb is None: xb=min(eb+max_hold-1,n-1); xp=c[xb]; xr='TIME'
-        xc = xp * ps * fee
-        pnl = ((xp-ep) if d=='LONG' else (ep-xp)) * ps - ec - xc
-        equity += pnl
-        if equity <= 0: equity = 0
-        eq_curve.append({'bar':xb,'equity':equity,'timestamp':df['timestamp'].iloc[min(xb,n-1)]})
-        trades.append({'entry_time':sig['timestamp'],'exit_time':df['timestamp'].iloc[min(xb,n-1)],
-                       'direction':d,'entry_price':ep,'exit_price':xp,'pnl':pnl,
-                       'exit_reason':xr,'hold_bars':xb-eb})
-        if equity <= 0: break
-        while i+1<len(signals) and signals[i+1]['bar']<=xb: i+=1
-        i+=1
-    return trades, eq_curve, equity
-
-
-def backtest_atr_based(df, signals, sl_atr_mult=2.0, tp_atr_mult=6.0, fee=0.0006, max_hold=200, risk=0.02):
-    """Backtest with ATR-based SL/TP"""
-    c = df['close'].values.astype(float)
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    n = len(c)
-    trades = []; equity = 10000.0
-    eq_curve = [{'bar':0,'equity':equity,'timestamp':df['timestamp'].iloc[0]}]
-    i = 0
-    while i < len(signals):
-        sig = signals[i]; eb=sig['bar']; ep=sig['price']; d=sig['direction']; a=sig['atr']
-        if np.isnan(a) or a <= 0: i+=1; continue
-
-        if d == 'LONG':
-            sl = ep - a * sl_atr_mult
-            tp = ep + a * tp_atr_mult
-        else:
-            sl = ep + a * sl_atr_mult
-            tp = ep - a * tp_atr_mult
-
-        rk = abs(ep - sl)
-        if rk <= 0 or rk/ep > 0.10: i+=1; continue
-        ps = (equity * risk) / rk; ec = ep * ps * fee
-
-        xb=xp=xr=None
-        for bar in range(eb+1, min(eb+max_hold, n)):
-            if d == 'LONG':
-                if l[bar] <= sl: xb,xp,xr=bar,sl,'SL'; break
-                if h[bar] >= tp: xb,xp,xr=bar,tp,'TP'; break
-            else:
-                if h[bar] >= sl: xb,xp,xr=bar,sl,'SL'; break
-                if l[bar] <= tp: xb,xp,xr=bar,tp,'TP'; break
-        if xb is None: xb=min(eb+max_hold-1,n-1); xp=c[xb]; xr='TIME'
-        xc = xp * ps * fee
-        pnl = ((xp-ep) if d=='LONG' else (ep-xp)) * ps - ec - xc
-        equity += pnl
-        if equity <= 0: equity = 0
-        eq_curve.append({'bar':xb,'equity':equity,'timestamp':df['timestamp'].iloc[min(xb,n-1)]})
-        trades.append({'entry_time':sig['timestamp'],'exit_time':df['timestamp'].iloc[min(xb,n-1)],
-                       'direction':d,'entry_price':ep,'exit_price':xp,'pnl':pnl,
-                       'exit_reason':xr,'hold_bars':xb-eb})
-        if equity <= 0: break
-        while i+1<len(signals) and signals[i+1]['bar']<=xb: i+=1
-        i+=1
-    return trades, eq_curve, equity
-
-
-def analyze(trades, label=""):
-    if not trades: return {}
-    df_t = pd.DataFrame(trades)
-    total = len(df_t)
-    wins = df_t[df_t['pnl']>0]; losses = df_t[df_t['pnl']<=0]
-    longs = df_t[df_t['direction']=='LONG']; shorts = df_t[df_t['direction']=='SHORT']
-    wr = len(wins)/total*100
-    pf = wins['pnl'].sum()/abs(losses['pnl'].sum()) if len(losses)>0 and losses['pnl'].sum()!=0 else 999
-    tp_val = df_t['pnl'].sum()
-    mdd=0; pk=10000; run=10000
-    for p in df_t['pnl']:
-        run+=p; pk=max(pk,run)
-        dd=(pk-run)/pk*100 if pk>0 else 0
-        mdd=max(mdd,dd)
-    lwr = len(longs[longs['pnl']>0])/len(longs)*100 if len(longs)>0 else 0
-    swr = len(shorts[shorts['pnl']>0])/len(shorts)*100 if len(shorts)>0 else 0
-    mc=cc=0
-    for p in df_t['pnl']:
-        if p<=0: cc+=1; mc=max(mc,cc)
-        else: cc=0
-    aw = wins['pnl'].mean() if len(wins)>0 else 0
-    al = abs(losses['pnl'].mean()) if len(losses)>0 else 0
-    # yearly
-    df_t['year'] = pd.to_datetime(df_t['entry_time']).dt.year
-    yearly = {}
-    for yr, grp in df_t.groupby('year'):
-        yr_w = grp[grp['pnl']>0]; yr_l = grp[grp['pnl']<=0]
-        yr_pf = yr_w['pnl'].sum()/abs(yr_l['pnl'].sum()) if len(yr_l)>0 and yr_l['pnl'].sum()!=0 else 999
-        yearly[yr] = {'trades':len(grp),'wr':len(yr_w)/len(grp)*100,'pf':yr_pf,'pnl':grp['pnl'].sum(),
-                       'longs':len(grp[grp['direction']=='LONG']),'shorts':len(grp[grp['direction']=='SHORT'])}
-    return {'label':label,'total':total,'wr':wr,'lc':len(longs),'sc':len(shorts),
-            'lwr':lwr,'swr':swr,'pf':pf,'pnl':tp_val,'eq':10000+tp_val,'mdd':mdd,
-            'ah':df_t['hold_bars'].mean(),'max_consec_loss':mc,'aw':aw,'al':al,'yearly':yearly}
+def backtest_fixed_pct(df, signals, sl_pct=0.05, tp_pct=0.15, fee=0.0006, max_hold=200, risk=0.02,
+                       exit_grid=None, intrabar=None):
+    """Backtest with fixed percentage SL/TP (exit_grid / intrabar: see engine.run_backtest)"""
+    trades, equity = run_backtest(df, signals, 'pct', sl_pct, tp_pct, fee=fee,
+                                  max_hold=max_hold, risk=risk, max_risk=0.10, exit_grid=exit_grid,
+                                  intrabar=intrabar)
+    return trades, equity_curve(df, trades), equity
+
+
+def backtest_atr_based(df, signals, sl_atr_mult=2.0, tp_atr_mult=6.0, fee=0.0006, max_hold=200, risk=0.02,
+                       exit_grid=None, intrabar=None):
+    """Backtest with ATR-based SL/TP (exit_grid / intrabar: see engine.run_backtest)"""
+    trades, equity = run_backtest(df, signals, 'atr', sl_atr_mult, tp_atr_mult, fee=fee,
+                                  max_hold=max_hold, risk=risk, max_risk=0.10, exit_grid=exit_grid,
+                                  intrabar=intrabar)
+    return trades, equity_curve(df, trades), equity
+
+
+def analyze(df, trades, label=""):
+    return summarize(df, trades, label, yearly=True)
+
+
+def config_signals(frames, cfg):
+    df = frames[cfg['tf']]
+    sigs, _, _, _ = generate_signals_alpha(df, keyvalue=cfg['keyvalue'], atr_period=5,
+                                           ema_period=cfg['ema_period'],
+                                           keyvalues=cfg.get('keyvalues'))
+    return df, sigs
+
+
+def config_exits(cfg):
+    """(exit mode, sl, tp, max_risk) a config is backtested with"""
+    return cfg['mode'], cfg['sl'], cfg['tp'], 0.10
+
+
+def run_config(frames, cfg):
+    """Sweep task: one keyvalue x SL/TP config -> (signal count, stats, equity curve, trades)"""
+    df, sigs = config_signals(frames, cfg)
+    if cfg['mode'] == 'pct':
+        trades, eq, _ = backtest_fixed_pct(df, sigs, sl_pct=cfg['sl'], tp_pct=cfg['tp'],
+                                           max_hold=cfg['max_hold'], risk=0.02,
+                                           exit_grid=cfg.get('exit_grid'), intrabar=frames.get('M5'))
+    else:
+        trades, eq, _ = backtest_atr_based(df, sigs, sl_atr_mult=cfg['sl'], tp_atr_mult=cfg['tp'],
+                                           max_hold=cfg['max_hold'], risk=0.02,
+                                           exit_grid=cfg.get('exit_grid'), intrabar=frames.get('M5'))
+    return len(sigs), analyze(df, trades, cfg['label']), eq, trades
+
+
+def risk_scaling(frames, cfg, risks):
+    """One config re-simulated at every risk fraction in one engine pass -> batch_metrics dict"""
+    df, sigs = config_signals(frames, cfg)
+    mode, sl, tp, max_risk = config_exits(cfg)
+    trade_sets, _ = run_backtest_risks(df, sigs, risks, mode, sl, tp,
+                                       max_hold=cfg['max_hold'], max_risk=max_risk, intrabar=frames.get('M5'))
+    return batch_metrics(trade_sets)
 
 
 def print_result(s, show_yearly=True):
@@ -303,19 +217,22 @@ def main():
     print("Base: ATR Trailing Stop(50, ATR5) + EMA(1000) | M30 | 2022~2026")
     print("=" * 130)
 
-    df_m5 = pd.read_csv(DATA_M5)
-    df_m5['timestamp'] = pd.to_datetime(df_m5['timestamp'])
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-    # Resample to M30
-    df_30m = resample_ohlcv(df_m5, '30min')
+    # Resample to M30 (cached per source file, see data_store.load_resampled); indicators
+    # resume from their persisted state when M5 rows have been appended
+    persist_to(indicator_dir(DATA_M5))
+    df_30m = load_resampled(DATA_M5, '30min')
     print(f"\n  M30: {len(df_30m):,} bars | {df_30m['timestamp'].iloc[0]} ~ {df_30m['timestamp'].iloc[-1]}")
 
     # Also prepare higher TF for comparison
-    df_1h = resample_ohlcv(df_m5, '1h')
-    df_2h = resample_ohlcv(df_m5, '2h')
+    df_1h = load_resampled(DATA_M5, '1h')
+    df_2h = load_resampled(DATA_M5, '2h')
     print(f"  1H:  {len(df_1h):,} bars")
     print(f"  2H:  {len(df_2h):,} bars")
+    # M5 source bars settle exits where one bar touches both SL and TP
+    df_m5 = load_m5(DATA_M5)
+    frames = {'M30': df_30m, '1H': df_1h, '2H': df_2h, 'M5': df_m5}
 
     # ============================================================
     # Phase 1: Original strategy reproduction
@@ -327,22 +244,28 @@ def main():
     # Generate signals on M30
     sigs_30m, ts_30m, atr_30m, ema_30m = generate_signals_alpha(df_30m, keyvalue=50.0, atr_period=5, ema_period=1000)
     print(f"\n  M30 signals: {len(sigs_30m)}")
-    print(f"  LONG: {sum(1 for s in sigs_30m if s['direction']=='LONG')}  SHORT: {sum(1 for s in sigs_30m if s['direction']=='SHORT')}")
+    print(f"  LONG: {(sigs_30m['direction']==LONG).sum()}  SHORT: {(sigs_30m['direction']==SHORT).sum()}")
 
     # Test each TP level as single exit
     print(f"\n  --- Original fixed % SL/TP (single exit at each TP level) ---")
     all_results = []
     all_eq = {}
+    all_cfg = {}
 
-    for tp_name, tp_pct in [("TP1(15%)", 0.15), ("TP2(25%)", 0.25), ("TP3(35%)", 0.35),
-                              ("TP4(45%)", 0.45), ("TP5(55%)", 0.55)]:
+    tp_levels = [("TP1(15%)", 0.15), ("TP2(25%)", 0.25), ("TP3(35%)", 0.35),
+                 ("TP4(45%)", 0.45), ("TP5(55%)", 0.55)]
+    # every TP level's exits come from one outcome pass over the signals
+    exit_grid = [(0.05, tp_pct) for _, tp_pct in tp_levels]
+    for tp_name, tp_pct in tp_levels:
         label = f"M30 Original SL5%/{tp_name}"
         trades, eq, _ = backtest_fixed_pct(df_30m, sigs_30m, sl_pct=0.05, tp_pct=tp_pct,
-                                            max_hold=500, risk=0.02)
-        s = analyze(trades, label)
+                                            max_hold=500, risk=0.02, exit_grid=exit_grid, intrabar=df_m5)
+        s = analyze(df_30m, trades, label)
         if s:
             all_results.append(s)
             all_eq[label] = eq
+            all_cfg[label] = {'tf': 'M30', 'keyvalue': 50.0, 'ema_period': 1000,
+                              'mode': 'pct', 'sl': 0.05, 'tp': tp_pct, 'max_hold': 500}
         print_result(s)
         print()
 
@@ -380,14 +303,17 @@ def main():
     print(header)
     print("  " + "-" * 90)
 
-    for sl_p, tp_p, rr_label in rr_configs:
-        label = f"M30 {rr_label}"
-        trades, eq, _ = backtest_fixed_pct(df_30m, sigs_30m, sl_pct=sl_p, tp_pct=tp_p,
-                                            max_hold=500, risk=0.02)
-        s = analyze(trades, label)
+    # all SL/TP pairs share one outcome matrix over the same M30 signals
+    exit_grid = [(sl_p, tp_p) for sl_p, tp_p, _ in rr_configs]
+    grid = [{'label': f"M30 {rr_label}", 'tf': 'M30', 'keyvalue': 50.0, 'ema_period': 1000,
+             'mode': 'pct', 'sl': sl_p, 'tp': tp_p, 'max_hold': 500, 'exit_grid': exit_grid}
+            for sl_p, tp_p, rr_label in rr_configs]
+    for _, cfg, (_, s, eq, _) in cached_sweep(run_config, grid, frames, 'alpha_trend'):
+        label = cfg['label']
         if s:
             all_results.append(s)
             all_eq[label] = eq
+            all_cfg[label] = cfg
             pf_s = f"{s['pf']:.2f}" if s['pf'] < 100 else "INF"
             print(f"  {label:<40s} {s['total']:>4d} {s['wr']:>4.1f}% {pf_s:>6s} "
                   f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} {s['ah']:>4.0f}b")
@@ -420,14 +346,16 @@ def main():
     print(header)
     print("  " + "-" * 90)
 
-    for sl_m, tp_m, atr_label in atr_configs:
-        label = f"M30 {atr_label}"
-        trades, eq, _ = backtest_atr_based(df_30m, sigs_30m, sl_atr_mult=sl_m, tp_atr_mult=tp_m,
-                                            max_hold=500, risk=0.02)
-        s = analyze(trades, label)
+    exit_grid = [(sl_m, tp_m) for sl_m, tp_m, _ in atr_configs]
+    grid = [{'label': f"M30 {atr_label}", 'tf': 'M30', 'keyvalue': 50.0, 'ema_period': 1000,
+             'mode': 'atr', 'sl': sl_m, 'tp': tp_m, 'max_hold': 500, 'exit_grid': exit_grid}
+            for sl_m, tp_m, atr_label in atr_configs]
+    for _, cfg, (_, s, eq, _) in cached_sweep(run_config, grid, frames, 'alpha_trend'):
+        label = cfg['label']
         if s:
             all_results.append(s)
             all_eq[label] = eq
+            all_cfg[label] = cfg
             pf_s = f"{s['pf']:.2f}" if s['pf'] < 100 else "INF"
             print(f"  {label:<40s} {s['total']:>4d} {s['wr']:>4.1f}% {pf_s:>6s} "
                   f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} {s['ah']:>4.0f}b")
@@ -451,15 +379,19 @@ def main():
         print(f"\n  {tf_name} (EMA{ema_p}): {len(sigs)} signals")
 
         # Test best configs from Phase 2/3
-        for sl_p, tp_p, rr_label in [(0.03, 0.12, "SL3%/TP12%"), (0.03, 0.15, "SL3%/TP15%"),
-                                      (0.05, 0.15, "SL5%/TP15%"), (0.05, 0.25, "SL5%/TP25%")]:
+        tf_configs = [(0.03, 0.12, "SL3%/TP12%"), (0.03, 0.15, "SL3%/TP15%"),
+                      (0.05, 0.15, "SL5%/TP15%"), (0.05, 0.25, "SL5%/TP25%")]
+        exit_grid = [(sl_p, tp_p) for sl_p, tp_p, _ in tf_configs]
+        for sl_p, tp_p, rr_label in tf_configs:
             label = f"{tf_name} {rr_label}"
             trades, eq, _ = backtest_fixed_pct(df_tf, sigs, sl_pct=sl_p, tp_pct=tp_p,
-                                                max_hold=mh, risk=0.02)
-            s = analyze(trades, label)
+                                                max_hold=mh, risk=0.02, exit_grid=exit_grid, intrabar=df_m5)
+            s = analyze(df_tf, trades, label)
             if s:
                 all_results.append(s)
                 all_eq[label] = eq
+                all_cfg[label] = {'tf': tf_name, 'keyvalue': 50.0, 'ema_period': ema_p,
+                                  'mode': 'pct', 'sl': sl_p, 'tp': tp_p, 'max_hold': mh}
                 pf_s = f"{s['pf']:.2f}" if s['pf'] < 100 else "INF"
                 print(f"    {label:<40s} {s['total']:>4d} {s['wr']:>4.1f}% {pf_s:>6s} "
                       f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} {s['ah']:>4.0f}b")
@@ -471,20 +403,25 @@ def main():
     print("PHASE 5: SENSITIVITY (keyvalue) OPTIMIZATION on M30")
     print("=" * 130)
 
-    for kv in [20, 30, 40, 50, 60, 80, 100]:
-        sigs_kv, _, _, _ = generate_signals_alpha(df_30m, keyvalue=kv, atr_period=5, ema_period=1000)
-        # Test with best TP from Phase 2
-        for sl_p, tp_p, rr_label in [(0.03, 0.12, "SL3/TP12"), (0.05, 0.15, "SL5/TP15")]:
-            label = f"M30 KV{kv} {rr_label}"
-            trades, eq, _ = backtest_fixed_pct(df_30m, sigs_kv, sl_pct=sl_p, tp_pct=tp_p,
-                                                max_hold=500, risk=0.02)
-            s = analyze(trades, label)
-            if s:
-                all_results.append(s)
-                all_eq[label] = eq
-                pf_s = f"{s['pf']:.2f}" if s['pf'] < 100 else "INF"
-                print(f"  {label:<40s} sigs:{len(sigs_kv):>3d} {s['total']:>4d}t {s['wr']:>4.1f}% {pf_s:>6s} "
-                      f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d}")
+    # Test with best TP from Phase 2
+    # all keyvalues' stops come from one (bars x keyvalues) pass per process
+    keyvalues = [20, 30, 40, 50, 60, 80, 100]
+    kv_configs = [(0.03, 0.12, "SL3/TP12"), (0.05, 0.15, "SL5/TP15")]
+    exit_grid = [(sl_p, tp_p) for sl_p, tp_p, _ in kv_configs]
+    grid = [{'label': f"M30 KV{kv} {rr_label}", 'tf': 'M30', 'keyvalue': kv, 'ema_period': 1000,
+             'keyvalues': keyvalues, 'mode': 'pct', 'sl': sl_p, 'tp': tp_p, 'max_hold': 500,
+             'exit_grid': exit_grid}
+            for kv in keyvalues
+            for sl_p, tp_p, rr_label in kv_configs]
+    for _, cfg, (n_sigs, s, eq, _) in cached_sweep(run_config, grid, frames, 'alpha_trend'):
+        label = cfg['label']
+        if s:
+            all_results.append(s)
+            all_eq[label] = eq
+            all_cfg[label] = cfg
+            pf_s = f"{s['pf']:.2f}" if s['pf'] < 100 else "INF"
+            print(f"  {label:<40s} sigs:{n_sigs:>3d} {s['total']:>4d}t {s['wr']:>4.1f}% {pf_s:>6s} "
+                  f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d}")
 
     # ============================================================
     # FINAL RANKINGS
@@ -501,6 +438,15 @@ def main():
         print(f"\n  #{i}")
         print_result(s, show_yearly=True)
 
+    # --- Rank by risk-adjusted return (bar-level equity, compounding) ---
+    print(f"\n\n  --- TOP 15 BY SHARPE (mark-to-market per-bar returns, annualised) ---")
+    print(f"  {'#':>3s} {'Strategy':<40s} {'Sharpe':>6s} {'Sortino':>7s} {'Calmar':>6s} {'CAGR%':>6s} {'BarDD%':>6s} {'Ulcer':>5s} {'Expo%':>5s}")
+    print("  " + "-" * 96)
+    by_sharpe = sorted(valid, key=lambda x: x['sharpe'], reverse=True)
+    for i, s in enumerate(by_sharpe[:15], 1):
+        print(f"  {i:>3d} {s['label']:<40s} {s['sharpe']:>6.2f} {s['sortino']:>7.2f} {s['calmar']:>6.2f} "
+              f"{s['cagr']:>5.1f}% {s['bar_mdd']:>5.1f}% {s['ulcer']:>5.1f} {s['exposure']:>4.1f}%")
+
     # Find strategies profitable in 3+ years
     print(f"\n\n  --- STRATEGIES PROFITABLE IN 3+ YEARS ---")
     for s in by_pnl:
@@ -517,14 +463,15 @@ def main():
 
     # Risk scaling for top 3
     print(f"\n\n  --- RISK SCALING (Top 3) ---")
+    # exact compounding per risk (one engine pass per strategy), not the 2% result scaled
     for s in by_pnl[:3]:
         if not s: continue
-        monthly = s['pnl'] / 48
+        m = risk_scaling(frames, all_cfg[s['label']], [0.02, 0.03, 0.05])
         print(f"\n  {s['label']}")
         print(f"  {'Risk%':>8s} {'Monthly$':>10s} {'Annual%':>8s} {'MDD':>7s}")
-        for rp in [2, 3, 5]:
-            m = rp / 2.0
-            print(f"  {rp:>7d}% ${monthly*m:>9.0f} {monthly*m*12/100:>7.1f}% {s['mdd']*m:>6.1f}%")
+        for j, rp in enumerate([2, 3, 5]):
+            monthly = m['pnl'][j] / 48
+            print(f"  {rp:>7d}% ${monthly:>9.0f} {monthly*12/100:>7.1f}% {m['mdd'][j]:>6.1f}%")
 
     # Charts
     print("\n\n[Charts] Generating...")
@@ -0,0 +1,315 @@
+"""
+M5 Data Store - Columnar binary cache
+=====================================
+BTCUSDT_M5.csv is parsed once and written to data/cache/<name>/ as one
+.npy file per column (timestamp as int64 epoch-ns, OHLCV as float64).
+Later runs open the columns with np.load(mmap_mode='r') and hand back
+zero-copy views, so a backtest starts in milliseconds instead of
+re-parsing the full CSV.
+
+Cache validation against the source CSV:
+  size + mtime match            -> cache used as-is
+  size matches, mtime differs   -> sha1 re-checked (touch/copy keeps cache)
+  file grew, old bytes intact   -> only the new rows are parsed and appended
+  anything else                 -> cache rebuilt
+
+Resampled timeframes (M30/1H/90min/2H/4H/1D ...) are cached the same way,
+keyed on (source sha1, freq, date range): on disk under
+data/cache/<name>/resampled/ and in an in-process LRU, so a timeframe is
+aggregated from the M5 history only once per source file. When rows are
+appended, the full-history frames are extended from their last (possibly
+partial) bar instead of being re-aggregated; date-range frames are re-cut
+from them on demand.
+
+indicator_dir(path) is where indicator_cache.persist_to() keeps resumable
+indicator snapshots for this source, so a nightly append only runs the
+indicator recursions over the new bars.
+
+Usage:
+  from data_store import load_m5, load_resampled
+  df_m5 = load_m5(DATA_M5)
+  df_2h = load_resampled(DATA_M5, '2h')
+  df_1h = load_resampled(DATA_M5, '1h', start='2024-01-01', end='2025-12-31')
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'cache')
+OHLCV_COLS = ('open', 'high', 'low', 'close', 'volume')
+CACHE_VERSION = 1
+RESAMPLE_LRU_SIZE = 16
+
+_resample_lru = OrderedDict()
+
+
+def _file_sha1(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _cache_dir(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, name)
+
+
+def indicator_dir(path):
+    """Directory for persisted indicator snapshots of this source (see indicator_cache.persist_to)."""
+    return os.path.join(_cache_dir(path), 'indicators')
+
+
+def _read_meta(cdir):
+    try:
+        with open(os.path.join(cdir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cdir, meta):
+    tmp = os.path.join(cdir, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, os.path.join(cdir, 'meta.json'))
+
+
+def _write_column(cdir, name, values):
+    tmp = os.path.join(cdir, f'{name}.tmp.npy')
+    np.save(tmp, np.ascontiguousarray(values))
+    os.replace(tmp, os.path.join(cdir, f'{name}.npy'))
+
+
+def build_cache(path):
+    """Parse the CSV once and write the columnar cache. Returns meta dict."""
+    cdir = _cache_dir(path)
+    os.makedirs(cdir, exist_ok=True)
+    shutil.rmtree(os.path.join(cdir, 'resampled'), ignore_errors=True)
+    shutil.rmtree(indicator_dir(path), ignore_errors=True)
+    st = os.stat(path)
+    sha1 = _file_sha1(path)
+
+    df = pd.read_csv(path)
+    ts = pd.to_datetime(df['timestamp']).values.astype('datetime64[ns]').view('int64')
+    _write_column(cdir, 'timestamp', ts)
+    for col in OHLCV_COLS:
+        _write_column(cdir, col, df[col].values.astype(float))
+
+    meta = {'version': CACHE_VERSION, 'source': os.path.abspath(path),
+            'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1,
+            'rows': int(len(df))}
+    # meta is written last: a cache without meta.json is never trusted
+    _write_meta(cdir, meta)
+    return meta
+
+
+def _read_tail(path, meta, chunk_size=1 << 20):
+    # (header line, bytes after the cached size, sha1 of the whole file) if the
+    # first meta['size'] bytes are unchanged and ended on a line break, else None
+    sha = hashlib.sha1(); chunk = b''
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(0)
+        remaining = meta['size']
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                return None
+            sha.update(chunk); remaining -= len(chunk)
+        if sha.hexdigest() != meta['sha1'] or not chunk.endswith(b'\n'):
+            return None
+        tail = f.read()
+    sha.update(tail)
+    return header, tail, sha.hexdigest()
+
+
+def append_cache(path, meta):
+    """
+    Append the rows added to the CSV since the cache was built (the old bytes must be
+    unchanged and the new timestamps later than the cached ones) and extend the cached
+    full-history resampled frames. Returns the new meta, or None if the file was
+    rewritten and needs build_cache().
+    """
+    st = os.stat(path)
+    if st.st_size <= meta['size']:
+        return None
+    read = _read_tail(path, meta)
+    if read is None:
+        return None
+    header, tail, sha1 = read
+    cdir = _cache_dir(path)
+    old = _load_columns(cdir)
+    if tail.strip():
+        df = pd.read_csv(io.BytesIO(header + tail))
+        ts = pd.to_datetime(df['timestamp']).values.astype('datetime64[ns]').view('int64')
+        if len(old['timestamp']) == 0 or np.any(np.diff(ts) <= 0) or ts[0] <= old['timestamp'][-1]:
+            return None
+        new = {'timestamp': ts, **{col: df[col].values.astype(float) for col in OHLCV_COLS}}
+        for col, values in new.items():
+            _write_column(cdir, col, np.concatenate([old[col], values]))
+        _extend_resampled(path, _m5_frame(_load_columns(cdir)), meta['sha1'], sha1)
+
+    meta = dict(meta, size=st.st_size, mtime_ns=st.st_mtime_ns, sha1=sha1,
+                rows=int(meta['rows'] + (len(df) if tail.strip() else 0)))
+    _write_meta(cdir, meta)
+    return meta
+
+
+def ensure_cache(path):
+    """
+    Validate the cache against the source CSV (size/mtime/sha1): appended rows are
+    added incrementally, anything else stale is rebuilt.
+    """
+    cdir = _cache_dir(path)
+    meta = _read_meta(cdir)
+    st = os.stat(path)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return build_cache(path)
+    if meta.get('size') != st.st_size:
+        return append_cache(path, meta) or build_cache(path)
+    if meta.get('mtime_ns') == st.st_mtime_ns:
+        return meta
+    if _file_sha1(path) == meta.get('sha1'):
+        meta['mtime_ns'] = st.st_mtime_ns
+        _write_meta(cdir, meta)
+        return meta
+    return build_cache(path)
+
+
+def fingerprint(path):
+    """Content hash of the source CSV (sha1), as recorded in the cache meta."""
+    return ensure_cache(path)['sha1']
+
+
+def _load_columns(cdir):
+    return {col: np.load(os.path.join(cdir, f'{col}.npy'), mmap_mode='r')
+            for col in ('timestamp',) + OHLCV_COLS}
+
+
+def _m5_frame(arrays):
+    data = {'timestamp': arrays['timestamp'].view('datetime64[ns]')}
+    for col in OHLCV_COLS:
+        data[col] = arrays[col]
+    return pd.DataFrame(data, copy=False)
+
+
+def load_arrays(path):
+    """Memory-mapped, read-only column arrays: {'timestamp': int64 epoch-ns, 'open': ..., ...}"""
+    ensure_cache(path)
+    return _load_columns(_cache_dir(path))
+
+
+def load_m5(path):
+    """
+    Drop-in replacement for pd.read_csv + pd.to_datetime on the M5 file.
+    All columns are zero-copy views over the memory-mapped cache.
+    """
+    return _m5_frame(load_arrays(path))
+
+
+def resample_ohlcv(df_5m, freq='2h', origin='start_day'):
+    df = df_5m.copy()
+    df.index = pd.DatetimeIndex(df['timestamp'])
+    ohlcv = df.resample(freq, origin=origin).agg({
+        'open': 'first', 'high': 'max', 'low': 'min',
+        'close': 'last', 'volume': 'sum',
+    }).dropna()
+    ohlcv['timestamp'] = ohlcv.index
+    return ohlcv.reset_index(drop=True)
+
+
+def _range_tag(ts):
+    return 'all' if ts is None else pd.Timestamp(ts).strftime('%Y%m%dT%H%M%S')
+
+
+def _resampled_dir(path, sha1, freq, start, end):
+    name = f"{sha1[:16]}_{freq}_{_range_tag(start)}_{_range_tag(end)}"
+    return os.path.join(_cache_dir(path), 'resampled', name)
+
+
+def _save_frame(rdir, df, freq=None):
+    os.makedirs(rdir, exist_ok=True)
+    _write_column(rdir, 'timestamp', df['timestamp'].values.astype('datetime64[ns]').view('int64'))
+    for col in OHLCV_COLS:
+        _write_column(rdir, col, df[col].values.astype(float))
+    _write_meta(rdir, {'version': CACHE_VERSION, 'rows': int(len(df)), 'freq': freq})
+
+
+def _load_frame(rdir):
+    meta = _read_meta(rdir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return None
+    data = {'timestamp': np.load(os.path.join(rdir, 'timestamp.npy'), mmap_mode='r').view('datetime64[ns]')}
+    for col in OHLCV_COLS:
+        data[col] = np.load(os.path.join(rdir, f'{col}.npy'), mmap_mode='r')
+    return pd.DataFrame(data, copy=False)
+
+
+def _extend_resampled(path, m5, old_sha1, new_sha1):
+    # Full-history frames of the old file: re-aggregate from their last bar (which
+    # may have been partial) with the same bin origin, save under the new sha1.
+    # Everything else of the old file (date-range frames) is dropped.
+    root = os.path.join(_cache_dir(path), 'resampled')
+    if not os.path.isdir(root):
+        return
+    start_day = m5['timestamp'].iloc[0].normalize()
+    prefix = f"{old_sha1[:16]}_"
+    for name in os.listdir(root):
+        rdir = os.path.join(root, name)
+        meta = _read_meta(rdir)
+        if (name.startswith(prefix) and meta is not None and meta.get('freq')
+                and rdir == _resampled_dir(path, old_sha1, meta['freq'], None, None)):
+            df = _load_frame(rdir)
+            if df is not None and len(df):
+                last = df['timestamp'].values[-1]
+                rows = m5.iloc[int(np.searchsorted(m5['timestamp'].values, last, side='left')):]
+                # calendar frequencies ('1D', ...) bin on their own boundaries
+                tick = isinstance(pd.tseries.frequencies.to_offset(meta['freq']), pd.offsets.Tick)
+                df = pd.concat([df.iloc[:-1], resample_ohlcv(rows, meta['freq'],
+                                                             origin=start_day if tick else 'start_day')],
+                               ignore_index=True)
+                _save_frame(_resampled_dir(path, new_sha1, meta['freq'], None, None), df, meta['freq'])
+        if name.startswith(prefix):
+            shutil.rmtree(rdir, ignore_errors=True)
+
+
+def load_resampled(path, freq, start=None, end=None):
+    """
+    Resampled OHLCV bars for the M5 source file, cached per (sha1, freq, start, end).
+    start/end filter on bar timestamp (inclusive), applied after resampling the full
+    history - same as masking the output of resample_ohlcv.
+    Returned frames are shared between callers and read-only: do not mutate them.
+    """
+    sha1 = fingerprint(path)
+    key = (sha1, freq, _range_tag(start), _range_tag(end))
+    if key in _resample_lru:
+        _resample_lru.move_to_end(key)
+        return _resample_lru[key]
+
+    rdir = _resampled_dir(path, sha1, freq, start, end)
+    df = _load_frame(rdir)
+    if df is None:
+        if start is None and end is None:
+            df = resample_ohlcv(load_m5(path), freq)
+        else:
+            df = load_resampled(path, freq)
+            mask = np.ones(len(df), dtype=bool)
+            if start is not None: mask &= (df['timestamp'] >= pd.Timestamp(start)).values
+            if end is not None: mask &= (df['timestamp'] <= pd.Timestamp(end)).values
+            df = df[mask].reset_index(drop=True)
+        _save_frame(rdir, df, freq)
+        df = _load_frame(rdir)
+
+    _resample_lru[key] = df
+    while len(_resample_lru) > RESAMPLE_LRU_SIZE:
+        _resample_lru.popitem(last=False)
+    return df
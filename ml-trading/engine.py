@@ -0,0 +1,376 @@
+"""
+Trade Simulation Engine
+=======================
+One compiled engine behind backtest_fixed / backtest_fixed_pct / backtest_atr_based.
+
+Per signal (in bar order, one position at a time):
+  - SL/TP levels come from the exit spec: fixed % of entry, ATR multiple, or
+    custom per-signal price arrays
+  - skipped if the risk distance rk = |entry - SL| is <= 0 or rk/entry > max_risk
+  - size = equity * risk / rk, fee charged on entry and exit notional
+  - first SL/TP touch within max_hold bars via the exit_index sparse tables
+    (O(log max_hold) per signal): SL wins if both are hit on the same bar,
+    otherwise TIME exit at the close of bar min(entry + max_hold - 1, n - 1)
+  - with intrabar (the M5 frame the bars were resampled from), a bar that
+    touches both SL and TP is settled by the M5 rows inside it instead; only
+    those ambiguous bars are drilled into (mtf.bar_ranges offsets)
+  - equity floored at 0 (ruin stops the run); signals up to the exit bar are skipped
+
+Position sizing is the only thing that depends on the risk fraction, so
+simulate_risks / run_backtest_risks compound a whole vector of risks over one
+walk of the signals: exact per-risk equity paths instead of scaling the 2%
+results linearly.
+
+Exits do not depend on sizing or on which earlier trades were taken, so a
+sweep over SL/TP pairs on one signal set can resolve them up front:
+exit_outcomes() walks each signal's forward window once and fills a
+(signals x exit configs) outcome matrix for the whole grid;
+run_backtest(..., exit_grid=pairs) then only replays the sequential
+position / equity pass on the config's column.
+
+Trades are written into preallocated arrays and returned as a TRADE_DTYPE
+structured array; metrics.summarize() works on it directly. equity_curve gives
+the per-exit curve used by the equity plots, trades_to_dicts the legacy
+per-trade dicts.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from exit_index import (build_exit_tables, first_exit, first_run_ge, first_run_le, intrabar_hit,
+                        levels_for)
+from indicator_cache import dataset_fingerprint, indicator
+from indicators import njit
+from mtf import bar_ranges
+from signals import LONG
+
+EXIT_SL, EXIT_TP, EXIT_TIME = 0, 1, 2
+EXIT_REASONS = ('SL', 'TP', 'TIME')
+EXIT_PENDING = -1  # outcome not resolved yet (looked up by the kernel on entry)
+
+OUTCOME_LRU_SIZE = 8
+
+_outcome_lru = OrderedDict()
+
+INITIAL_EQUITY = 10000.0
+
+TRADE_DTYPE = np.dtype([
+    ('sig', np.int64), ('entry_bar', np.int64), ('exit_bar', np.int64),
+    ('direction', np.int8), ('entry_price', np.float64), ('exit_price', np.float64),
+    ('sl', np.float64), ('tp', np.float64), ('size', np.float64),
+    ('pnl', np.float64), ('equity', np.float64), ('exit_reason', np.int8),
+])
+
+
+def exit_levels(signals, mode, sl, tp):
+    """
+    SL/TP prices per signal.
+      mode 'pct'    : sl/tp are fractions of entry price (0.05 = 5%)
+      mode 'atr'    : sl/tp are multiples of the signal ATR
+      mode 'custom' : sl/tp are per-signal price arrays
+    Returns (sl_px, tp_px, valid); invalid signals are never entered.
+    """
+    ep = signals['price']
+    is_long = signals['direction'] == LONG
+    if mode == 'pct':
+        valid = ep * sl > 0
+        sl_px = np.where(is_long, ep * (1 - sl), ep * (1 + sl))
+        tp_px = np.where(is_long, ep * (1 + tp), ep * (1 - tp))
+    elif mode == 'atr':
+        a = signals['atr']
+        valid = ~np.isnan(a) & (a > 0)
+        sl_px = np.where(is_long, ep - a * sl, ep + a * sl)
+        tp_px = np.where(is_long, ep + a * tp, ep - a * tp)
+    elif mode == 'custom':
+        sl_px = np.asarray(sl, dtype=float); tp_px = np.asarray(tp, dtype=float)
+        valid = ~np.isnan(sl_px) & ~np.isnan(tp_px)
+    else:
+        raise ValueError(f"unknown exit mode: {mode}")
+    return sl_px, tp_px, valid
+
+
+@njit(cache=True)
+def _settle_sl(h, l, xb, d, sl, tp, fh, fl, f_start, f_end):
+    # SL is touched on bar xb; if TP is too, the fine bars inside xb decide the
+    # order (0 = SL, 1 = TP). Without fine bars (f_start empty) SL wins.
+    if len(f_start) == 0 or not (h[xb] >= tp if d == 1 else l[xb] <= tp):
+        return 0
+    return intrabar_hit(fh, fl, f_start[xb], f_end[xb], d, sl, tp)
+
+
+@njit(cache=True)
+def _simulate_kernel(hmax, lmin, c, sig_bar, sig_dir, sig_price, sl_px, tp_px, valid,
+                     fh, fl, f_start, f_end,
+                     x_bar, x_price, x_reason, fee, max_hold, risks, max_risk, equity0,
+                     t_sig, t_exit_bar, t_exit_price, t_reason, t_size, t_pnl, t_equity, n_taken):
+    # trade selection and exits do not depend on equity, so one walk over the
+    # signals serves every risk fraction; each risk column compounds on its own
+    # equity and stops at its own ruin (the walk ends once all are ruined)
+    n = len(c); ns = len(sig_bar); nr = len(risks)
+    equity = np.full(nr, equity0)
+    alive = nr
+    k = 0
+    i = 0
+    while i < ns:
+        if not valid[i]:
+            i += 1; continue
+        eb = sig_bar[i]; ep = sig_price[i]; d = sig_dir[i]
+        sl = sl_px[i]; tp = tp_px[i]
+        rk = abs(ep - sl)
+        if rk <= 0 or rk / ep > max_risk:
+            i += 1; continue
+
+        if x_reason[i] == EXIT_PENDING:
+            xb, hit = first_exit(hmax, lmin, eb + 1, min(eb + max_hold, n), d, sl, tp)
+            if hit == 0: hit = _settle_sl(hmax[0], lmin[0], xb, d, sl, tp, fh, fl, f_start, f_end)
+            if hit == 0: xp = sl; xr = EXIT_SL
+            elif hit == 1: xp = tp; xr = EXIT_TP
+            else: xb = min(eb + max_hold - 1, n - 1); xp = c[xb]; xr = EXIT_TIME
+            x_bar[i] = xb; x_price[i] = xp; x_reason[i] = xr
+        xb = x_bar[i]; xp = x_price[i]; xr = x_reason[i]
+        t_sig[k] = i; t_exit_bar[k] = xb; t_exit_price[k] = xp; t_reason[k] = xr
+
+        for r in range(nr):
+            if equity[r] <= 0:  # ruined earlier
+                t_size[k, r] = 0.0; t_pnl[k, r] = 0.0; t_equity[k, r] = 0.0
+                continue
+            ps = (equity[r] * risks[r]) / rk; ec = ep * ps * fee
+            xc = xp * ps * fee
+            pnl = ((xp - ep) if d == 1 else (ep - xp)) * ps - ec - xc
+            equity[r] += pnl
+            if equity[r] <= 0:
+                equity[r] = 0.0; alive -= 1
+            t_size[k, r] = ps; t_pnl[k, r] = pnl; t_equity[k, r] = equity[r]
+            n_taken[r] = k + 1
+        k += 1
+        if alive == 0: break
+        while i + 1 < ns and sig_bar[i + 1] <= xb: i += 1
+        i += 1
+    return equity
+
+
+_NO_INTRABAR = (np.empty(0), np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def intrabar_arrays(df, df_fine):
+    """(fine high, fine low, start, end) for simulate(intrabar=...): df_fine rows [start[i], end[i]) form bar i."""
+    start, end = bar_ranges(df, df_fine)
+    return (df_fine['high'].values.astype(float), df_fine['low'].values.astype(float),
+            np.ascontiguousarray(start), np.ascontiguousarray(end))
+
+
+def simulate_risks(h, l, c, signals, sl_px, tp_px, valid, risks, fee=0.0006, max_hold=60,
+                   max_risk=0.05, equity0=INITIAL_EQUITY, tables=None, outcomes=None, intrabar=None):
+    """
+    Run the engine for several risk fractions at once. Returns (list of TRADE_DTYPE
+    arrays, one per risk, each cut at its own ruin; array of final equities).
+    Every path is bit-identical to a separate simulate() run with that risk.
+    outcomes: (exit_bar, exit_price, exit_reason) per signal, e.g. one column of
+    exit_outcomes(); exits are then read instead of looked up.
+    intrabar: intrabar_arrays() of the finer source bars, to settle same-bar SL/TP.
+    """
+    ns = len(signals)
+    if outcomes is None:
+        x_bar = np.empty(ns, dtype=np.int64); x_price = np.empty(ns)
+        x_reason = np.full(ns, EXIT_PENDING, dtype=np.int8)
+    else:
+        x_bar, x_price, x_reason = (np.array(o) for o in outcomes)
+    if tables is None:
+        if outcomes is None:
+            tables = build_exit_tables(np.asarray(h, dtype=float), np.asarray(l, dtype=float),
+                                       levels_for(max_hold))
+        else:
+            tables = (np.empty((1, 0)), np.empty((1, 0)))  # every exit is already resolved
+    hmax, lmin = tables
+    risks = np.atleast_1d(np.asarray(risks, dtype=float))
+    nr = len(risks)
+    t_sig = np.empty(ns, dtype=np.int64); t_exit_bar = np.empty(ns, dtype=np.int64)
+    t_exit_price = np.empty(ns); t_reason = np.empty(ns, dtype=np.int8)
+    t_size = np.empty((ns, nr)); t_pnl = np.empty((ns, nr)); t_equity = np.empty((ns, nr))
+    n_taken = np.zeros(nr, dtype=np.int64)
+    equity = _simulate_kernel(
+        hmax, lmin, np.ascontiguousarray(c, dtype=float),
+        np.ascontiguousarray(signals['bar']), np.ascontiguousarray(signals['direction']),
+        np.ascontiguousarray(signals['price']),
+        np.ascontiguousarray(sl_px, dtype=float), np.ascontiguousarray(tp_px, dtype=float),
+        np.ascontiguousarray(valid, dtype=np.bool_), *(intrabar or _NO_INTRABAR),
+        x_bar, x_price, x_reason, float(fee), int(max_hold), risks, float(max_risk), float(equity0),
+        t_sig, t_exit_bar, t_exit_price, t_reason, t_size, t_pnl, t_equity, n_taken)
+
+    sl_px = np.asarray(sl_px); tp_px = np.asarray(tp_px)
+    trade_sets = []
+    for r in range(nr):
+        k = n_taken[r]
+        trades = np.empty(k, dtype=TRADE_DTYPE)
+        idx = t_sig[:k]
+        trades['sig'] = idx
+        trades['entry_bar'] = signals['bar'][idx]
+        trades['exit_bar'] = t_exit_bar[:k]
+        trades['direction'] = signals['direction'][idx]
+        trades['entry_price'] = signals['price'][idx]
+        trades['exit_price'] = t_exit_price[:k]
+        trades['sl'] = sl_px[idx]
+        trades['tp'] = tp_px[idx]
+        trades['size'] = t_size[:k, r]
+        trades['pnl'] = t_pnl[:k, r]
+        trades['equity'] = t_equity[:k, r]
+        trades['exit_reason'] = t_reason[:k]
+        trade_sets.append(trades)
+    return trade_sets, equity
+
+
+def simulate(h, l, c, signals, sl_px, tp_px, valid, fee=0.0006, max_hold=60, risk=0.02,
+             max_risk=0.05, equity0=INITIAL_EQUITY, tables=None, outcomes=None, intrabar=None):
+    """
+    Run the engine on raw arrays. Returns (trades TRADE_DTYPE array, final equity).
+    tables: (hmax, lmin) from exit_index.build_exit_tables with >= levels_for(max_hold)
+    levels; built on the fly if not given.
+    """
+    trade_sets, equity = simulate_risks(h, l, c, signals, sl_px, tp_px, valid, [risk], fee=fee,
+                                        max_hold=max_hold, max_risk=max_risk, equity0=equity0,
+                                        tables=tables, outcomes=outcomes, intrabar=intrabar)
+    return trade_sets[0], equity[0]
+
+
+@njit(cache=True)
+def _outcome_kernel(h, l, c, sig_bar, sig_dir, sl_px, tp_px, valid, max_hold,
+                    fh, fl, f_start, f_end, x_bar, x_price, x_reason):
+    # one walk over each signal's window builds its running high max / low min;
+    # every exit config is then two binary searches on those (SL wins ties)
+    n = len(c); ns, m = sl_px.shape
+    run_hi = np.empty(max(max_hold, 1)); run_lo = np.empty(max(max_hold, 1))
+    for i in range(ns):
+        eb = sig_bar[i]; d = sig_dir[i]
+        start = eb + 1; w = max(min(eb + max_hold, n) - start, 0)
+        hi = -np.inf; lo = np.inf
+        for t in range(w):
+            hi = max(hi, h[start + t]); lo = min(lo, l[start + t])
+            run_hi[t] = hi; run_lo[t] = lo
+        for j in range(m):
+            if not valid[i, j]:
+                continue
+            sl = sl_px[i, j]; tp = tp_px[i, j]
+            if d == 1:
+                t_sl = first_run_le(run_lo, w, sl); t_tp = first_run_ge(run_hi, t_sl, tp)
+            else:
+                t_sl = first_run_ge(run_hi, w, sl); t_tp = first_run_le(run_lo, t_sl, tp)
+            if t_tp < t_sl:
+                x_bar[i, j] = start + t_tp; x_price[i, j] = tp; x_reason[i, j] = EXIT_TP
+            elif t_sl < w and _settle_sl(h, l, start + t_sl, d, sl, tp, fh, fl, f_start, f_end) == 1:
+                x_bar[i, j] = start + t_sl; x_price[i, j] = tp; x_reason[i, j] = EXIT_TP
+            elif t_sl < w:
+                x_bar[i, j] = start + t_sl; x_price[i, j] = sl; x_reason[i, j] = EXIT_SL
+            else:
+                xb = min(eb + max_hold - 1, n - 1)
+                x_bar[i, j] = xb; x_price[i, j] = c[xb]; x_reason[i, j] = EXIT_TIME
+
+
+def outcome_matrix(h, l, c, signals, sl_px, tp_px, valid, max_hold=60, intrabar=None):
+    """
+    Exit of every signal under every exit config: sl_px / tp_px / valid are
+    (signals x configs); returns (exit_bar, exit_price, exit_reason) of the same
+    shape, exit_reason EXIT_PENDING where the config is invalid for the signal.
+    Matches the kernel's own lookups exactly (same first touch and tie rule).
+    """
+    shape = np.shape(sl_px)
+    x_bar = np.zeros(shape, dtype=np.int64); x_price = np.zeros(shape)
+    x_reason = np.full(shape, EXIT_PENDING, dtype=np.int8)
+    _outcome_kernel(np.ascontiguousarray(h, dtype=float), np.ascontiguousarray(l, dtype=float),
+                    np.ascontiguousarray(c, dtype=float),
+                    np.ascontiguousarray(signals['bar']), np.ascontiguousarray(signals['direction']),
+                    np.ascontiguousarray(sl_px, dtype=float), np.ascontiguousarray(tp_px, dtype=float),
+                    np.ascontiguousarray(valid, dtype=np.bool_), int(max_hold),
+                    *(intrabar or _NO_INTRABAR), x_bar, x_price, x_reason)
+    return x_bar, x_price, x_reason
+
+
+def _ohlc(df):
+    return (df['high'].values.astype(float), df['low'].values.astype(float),
+            df['close'].values.astype(float))
+
+
+def exit_outcomes(df, signals, mode, pairs, max_hold=60, intrabar=None):
+    """
+    exit_levels + outcome_matrix for a grid of (sl, tp) pairs on one signal set:
+    (sl_px, tp_px, valid, exit_bar, exit_price, exit_reason), each (signals x
+    pairs), read-only. Cached per (frame, signals, mode, pairs, max_hold,
+    intrabar frame) so every cell of an SL/TP sweep shares one pass.
+    """
+    pairs = tuple((float(sl), float(tp)) for sl, tp in pairs)
+    sig_fp = hashlib.sha1(np.ascontiguousarray(signals).tobytes()).hexdigest()
+    fine_fp = dataset_fingerprint(intrabar) if intrabar is not None else None
+    key = (dataset_fingerprint(df), sig_fp, mode, pairs, int(max_hold), fine_fp)
+    if key in _outcome_lru:
+        _outcome_lru.move_to_end(key)
+        return _outcome_lru[key]
+    h, l, c = _ohlc(df)
+    levels = [exit_levels(signals, mode, sl, tp) for sl, tp in pairs]
+    sl_px, tp_px, valid = (np.stack([lv[k] for lv in levels], axis=1) for k in range(3))
+    fine = intrabar_arrays(df, intrabar) if intrabar is not None else None
+    out = (sl_px, tp_px, valid) + outcome_matrix(h, l, c, signals, sl_px, tp_px, valid, max_hold, fine)
+    for a in out:
+        a.setflags(write=False)
+    _outcome_lru[key] = out
+    while len(_outcome_lru) > OUTCOME_LRU_SIZE:
+        _outcome_lru.popitem(last=False)
+    return out
+
+
+def run_backtest(df, signals, mode='atr', sl=2.0, tp=6.0, fee=0.0006, max_hold=60,
+                 risk=0.02, max_risk=0.05, equity0=INITIAL_EQUITY, exit_grid=None, intrabar=None):
+    """
+    exit_levels + simulate on a resampled OHLCV frame (exit tables cached per frame).
+    exit_grid: the sweep's (sl, tp) pairs, including (sl, tp); exits then come from
+    the shared exit_outcomes() matrix of the whole grid.
+    intrabar: the M5 frame df was resampled from; settles bars touching both SL and TP.
+    """
+    h, l, c = _ohlc(df)
+    if exit_grid is not None:
+        sl_px, tp_px, valid, x_bar, x_price, x_reason = exit_outcomes(df, signals, mode, exit_grid,
+                                                                      max_hold, intrabar)
+        j = [(float(a), float(b)) for a, b in exit_grid].index((float(sl), float(tp)))
+        return simulate(h, l, c, signals, sl_px[:, j], tp_px[:, j], valid[:, j], fee=fee,
+                        max_hold=max_hold, risk=risk, max_risk=max_risk, equity0=equity0,
+                        outcomes=(x_bar[:, j], x_price[:, j], x_reason[:, j]))
+    sl_px, tp_px, valid = exit_levels(signals, mode, sl, tp)
+    tables = indicator(df, 'exit_tables', levels_for(max_hold))
+    fine = intrabar_arrays(df, intrabar) if intrabar is not None else None
+    return simulate(h, l, c, signals, sl_px, tp_px, valid, fee=fee, max_hold=max_hold,
+                    risk=risk, max_risk=max_risk, equity0=equity0, tables=tables, intrabar=fine)
+
+
+def run_backtest_risks(df, signals, risks, mode='atr', sl=2.0, tp=6.0, fee=0.0006, max_hold=60,
+                       max_risk=0.05, equity0=INITIAL_EQUITY, intrabar=None):
+    """run_backtest for a vector of risk fractions in one engine pass (see simulate_risks)."""
+    h, l, c = _ohlc(df)
+    sl_px, tp_px, valid = exit_levels(signals, mode, sl, tp)
+    tables = indicator(df, 'exit_tables', levels_for(max_hold))
+    fine = intrabar_arrays(df, intrabar) if intrabar is not None else None
+    return simulate_risks(h, l, c, signals, sl_px, tp_px, valid, risks, fee=fee, max_hold=max_hold,
+                          max_risk=max_risk, equity0=equity0, tables=tables, intrabar=fine)
+
+
+def trades_to_dicts(df, trades, signals):
+    """Legacy trade dicts (entry_time/exit_time/direction/.../adx_at_entry)."""
+    ts = pd.DatetimeIndex(df['timestamp'].values)
+    entry_ts = ts[trades['entry_bar']]; exit_ts = ts[trades['exit_bar']]
+    adx = signals['adx'][trades['sig']]
+    return [{'entry_time': entry_ts[k], 'exit_time': exit_ts[k],
+             'direction': 'LONG' if t['direction'] == LONG else 'SHORT',
+             'entry_price': t['entry_price'], 'exit_price': t['exit_price'], 'pnl': t['pnl'],
+             'exit_reason': EXIT_REASONS[t['exit_reason']],
+             'hold_bars': int(t['exit_bar'] - t['entry_bar']), 'adx_at_entry': adx[k]}
+            for k, t in enumerate(trades)]
+
+
+def equity_curve(df, trades, equity0=INITIAL_EQUITY):
+    """Legacy equity curve: [{'bar', 'equity', 'timestamp'}], one point per exit."""
+    ts = pd.DatetimeIndex(df['timestamp'].values)
+    curve = [{'bar': 0, 'equity': equity0, 'timestamp': ts[0]}]
+    exit_ts = ts[trades['exit_bar']]
+    curve.extend({'bar': int(t['exit_bar']), 'equity': t['equity'], 'timestamp': exit_ts[k]}
+                 for k, t in enumerate(trades))
+    return curve
@@ -0,0 +1,124 @@
+"""
+Exit Index - first-touch SL/TP lookup
+=====================================
+Sparse tables over the high/low arrays (range max of high, range min of low,
+block sizes 1, 2, 4, ... 2^(levels-1)) answer "first bar in [start, end) where
+low <= X / high >= Y" with a greedy binary descent in O(log max_hold),
+instead of scanning every bar after the entry.
+
+first_exit() combines the SL and TP lookups for one position and keeps the
+backtests' tie-break: if SL and TP are touched on the same bar, SL wins.
+intrabar_hit() settles such a bar from the finer bars it was resampled from
+(M5 rows of a 2H bar): whichever level they touch first, SL if the same row.
+
+Tables only need log2(max_hold) levels, so they stay small; they are cached
+per dataset through the indicator registry (name 'exit_tables').
+
+first_run_le() / first_run_ge() answer the same questions on one position's
+running low minimum / high maximum (monotone, so a plain binary search); the
+engine's outcome matrix walks each signal's window once and resolves every
+SL/TP pair with them.
+"""
+
+import numpy as np
+
+from indicator_cache import register
+from indicators import njit
+
+
+def levels_for(max_hold):
+    return max(1, int(max_hold).bit_length())
+
+
+def build_exit_tables(h, l, levels):
+    """(hmax, lmin), each (levels x n): hmax[k, i] = max(h[i : i + 2^k])"""
+    n = len(h)
+    hmax = np.full((levels, n), -np.inf); lmin = np.full((levels, n), np.inf)
+    hmax[0] = h; lmin[0] = l
+    for k in range(1, levels):
+        half = 1 << (k - 1); m = n - (1 << k) + 1
+        if m <= 0: break
+        hmax[k, :m] = np.maximum(hmax[k-1, :m], hmax[k-1, half:half+m])
+        lmin[k, :m] = np.minimum(lmin[k-1, :m], lmin[k-1, half:half+m])
+    return hmax, lmin
+
+
+def _df_exit_tables(df, levels):
+    return build_exit_tables(df['high'].values.astype(float), df['low'].values.astype(float), levels)
+
+
+register('exit_tables', _df_exit_tables)
+
+
+@njit(cache=True)
+def first_low_le(lmin, start, end, x):
+    """First bar in [start, end) with low <= x, or end if none."""
+    pos = start; k = lmin.shape[0] - 1
+    while k >= 0 and pos < end:
+        step = 1 << k
+        if pos + step <= end and lmin[k, pos] > x: pos += step
+        else: k -= 1
+    return pos
+
+
+@njit(cache=True)
+def first_high_ge(hmax, start, end, y):
+    """First bar in [start, end) with high >= y, or end if none."""
+    pos = start; k = hmax.shape[0] - 1
+    while k >= 0 and pos < end:
+        step = 1 << k
+        if pos + step <= end and hmax[k, pos] < y: pos += step
+        else: k -= 1
+    return pos
+
+
+@njit(cache=True)
+def first_exit(hmax, lmin, start, end, direction, sl, tp):
+    """
+    (bar, hit) of the first SL/TP touch in [start, end).
+    hit: 0 = SL, 1 = TP, -1 = none (bar == end). SL wins ties on the same bar.
+    """
+    if direction == 1:
+        b_sl = first_low_le(lmin, start, end, sl)
+        b_tp = first_high_ge(hmax, start, min(b_sl, end), tp)
+    else:
+        b_sl = first_high_ge(hmax, start, end, sl)
+        b_tp = first_low_le(lmin, start, min(b_sl, end), tp)
+    if b_tp < b_sl: return b_tp, 1
+    if b_sl < end: return b_sl, 0
+    return end, -1
+
+
+@njit(cache=True)
+def first_run_le(run, end, x):
+    """First t in [0, end) with run[t] <= x on a non-increasing run (running low), or end."""
+    lo = 0; hi = end
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if run[mid] <= x: hi = mid
+        else: lo = mid + 1
+    return lo
+
+
+@njit(cache=True)
+def first_run_ge(run, end, y):
+    """First t in [0, end) with run[t] >= y on a non-decreasing run (running high), or end."""
+    lo = 0; hi = end
+    while lo < hi:
+        mid = (lo + hi) >> 1
+        if run[mid] >= y: hi = mid
+        else: lo = mid + 1
+    return lo
+
+
+@njit(cache=True)
+def intrabar_hit(h, l, start, end, direction, sl, tp):
+    """0 = SL / 1 = TP: first level touched by the fine bars [start, end); SL on a tie or if neither."""
+    for k in range(start, end):
+        if direction == 1:
+            if l[k] <= sl: return 0
+            if h[k] >= tp: return 1
+        else:
+            if h[k] >= sl: return 0
+            if l[k] <= tp: return 1
+    return 0
@@ -0,0 +1,150 @@
+"""
+HTF Trend Filters
+=================
+Higher-timeframe filters for the MTF strategy as small composable objects.
+Each filter computes (long_ok, short_ok) boolean masks on the HTF bars with
+NumPy expressions (NaN anywhere -> not ok) and maps them onto the entry
+timeframe with the cached mtf.htf_index:
+
+  EMADirection(df_1d, 200)           close above/below the HTF EMA
+  EMATrendAlign(df_1d, 200, 5)       ... and the EMA rising/falling over slope_bars
+  DualEMA(df_1d, 50, 200)            golden / dead cross state
+  TripleEMA(df_1d)                   relaxed: close vs EMA200 (once EMA50 exists)
+  f1 & f2, f1 | f2                   AND / OR composition
+
+HTF masks go through the indicator registry, so they are computed once per
+(HTF frame, filter params): the same D-EMA200 mask is shared by every entry
+timeframe and ADX threshold that uses it.
+
+filter_from_config() builds filters from the dict configs used by
+generate_signals_mtf ({'type': 'direction', 'htf': '1D', 'ema_period': 200},
+{'type': 'and', 'filters': [...]}, ...).
+"""
+
+import numpy as np
+
+from indicator_cache import emas, indicator, register
+from mtf import htf_index
+
+
+def _close(df):
+    return df['close'].values.astype(float)
+
+
+def _ema_direction_masks(df, period):
+    c = _close(df); e = indicator(df, 'ema', period)
+    return c > e, c < e
+
+
+def _ema_trend_align_masks(df, period, slope_bars):
+    c = _close(df); e = indicator(df, 'ema', period)
+    lagged = np.full(len(e), np.nan)
+    lagged[slope_bars:] = e[:len(e) - slope_bars]
+    return (c > e) & (e > lagged), (c < e) & (e < lagged)
+
+
+def _dual_ema_masks(df, fast, slow):
+    e1, e2 = emas(df, fast, slow)
+    return e1 > e2, e1 < e2
+
+
+def _triple_ema_masks(df, fast, slow):
+    # Relaxed: price above/below the slow EMA, once the fast EMA exists
+    c = _close(df); e_fast, e = emas(df, fast, slow); ok = ~np.isnan(e_fast)
+    return ok & (c > e), ok & (c < e)
+
+
+register('htf_ema_direction', _ema_direction_masks)
+register('htf_ema_trend_align', _ema_trend_align_masks)
+register('htf_dual_ema', _dual_ema_masks)
+register('htf_triple_ema', _triple_ema_masks)
+
+
+class HTFFilter:
+    """Base class: subclasses set self.htf_df, self.name (registry name) and self.params."""
+
+    def htf_masks(self):
+        return indicator(self.htf_df, self.name, *self.params)
+
+    def masks(self, df_ltf, align='close', lag=None):
+        """(long_ok, short_ok) on the LTF bars; bars before the first visible HTF bar are not ok."""
+        idx = htf_index(df_ltf, self.htf_df, align, lag)
+        long_ok, short_ok = self.htf_masks()
+        # trailing False: idx == -1 picks it up
+        return np.append(long_ok, False)[idx], np.append(short_ok, False)[idx]
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+
+class NoFilter(HTFFilter):
+    def masks(self, df_ltf, align='close', lag=None):
+        n = len(df_ltf)
+        return np.ones(n, dtype=bool), np.ones(n, dtype=bool)
+
+
+class EMADirection(HTFFilter):
+    def __init__(self, htf_df, ema_period):
+        self.htf_df, self.name, self.params = htf_df, 'htf_ema_direction', (ema_period,)
+
+
+class EMATrendAlign(HTFFilter):
+    def __init__(self, htf_df, ema_period, slope_bars=5):
+        self.htf_df, self.name, self.params = htf_df, 'htf_ema_trend_align', (ema_period, slope_bars)
+
+
+class DualEMA(HTFFilter):
+    def __init__(self, htf_df, ema_period, ema_period2):
+        self.htf_df, self.name, self.params = htf_df, 'htf_dual_ema', (ema_period, ema_period2)
+
+
+class TripleEMA(HTFFilter):
+    def __init__(self, htf_df, fast=50, slow=200):
+        self.htf_df, self.name, self.params = htf_df, 'htf_triple_ema', (fast, slow)
+
+
+class AllOf(HTFFilter):
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def masks(self, df_ltf, align='close', lag=None):
+        parts = [f.masks(df_ltf, align, lag) for f in self.filters]
+        return (np.logical_and.reduce([p[0] for p in parts]),
+                np.logical_and.reduce([p[1] for p in parts]))
+
+
+class AnyOf(HTFFilter):
+    def __init__(self, *filters):
+        self.filters = filters
+
+    def masks(self, df_ltf, align='close', lag=None):
+        parts = [f.masks(df_ltf, align, lag) for f in self.filters]
+        return (np.logical_or.reduce([p[0] for p in parts]),
+                np.logical_or.reduce([p[1] for p in parts]))
+
+
+def filter_from_config(cfg, frames=None):
+    """
+    Dict config -> HTFFilter. The HTF frame is cfg['htf_df'] or frames[cfg['htf']].
+    Types: none, direction, trend_align, dual_ema, triple_ema, and, or
+    ('and' / 'or' take a list of sub-configs under 'filters').
+    """
+    kind = cfg.get('type', 'none')
+    if kind == 'none':
+        return NoFilter()
+    if kind in ('and', 'or'):
+        subs = [filter_from_config(c, frames) for c in cfg['filters']]
+        return AllOf(*subs) if kind == 'and' else AnyOf(*subs)
+    htf_df = cfg['htf_df'] if 'htf_df' in cfg else frames[cfg['htf']]
+    if kind == 'direction':
+        return EMADirection(htf_df, cfg['ema_period'])
+    if kind == 'trend_align':
+        return EMATrendAlign(htf_df, cfg['ema_period'], cfg.get('slope_bars', 5))
+    if kind == 'dual_ema':
+        return DualEMA(htf_df, cfg['ema_period'], cfg['ema_period2'])
+    if kind == 'triple_ema':
+        return TripleEMA(htf_df)
+    raise ValueError(f"unknown HTF filter type: {kind}")
@@ -0,0 +1,257 @@
+"""
+Indicator Registry - memoized indicator series
+==============================================
+Every indicator series is keyed on (dataset fingerprint, indicator name, params)
+and computed once per process: the same Supertrend / EMA / ADX on the same bars
+is shared by all signal generators and configs (e.g. the 8 SL/TP combos x ADX
+thresholds of the freq optimizer, or the HTF EMAs shared by every MTF filter).
+
+Memory is bounded (max_bytes); least recently used series are evicted first.
+Cached arrays are returned read-only since they are shared between callers.
+
+Indicators registered with a stepper (an O(1) per-bar state from indicators.py:
+EMA, RMA ATR, Supertrend, ADX, ATR trailing stops) can also be persisted with
+persist_to(dir): the result is saved with the stepper state at the second-to-last
+bar (the last bar may still be partial). When the same series comes back with
+appended bars - first bars unchanged, checked by fingerprint - only the new bars
+are stepped, so a nightly refresh costs O(new bars) instead of O(history).
+
+Usage:
+  from indicator_cache import indicator
+  trend, up, dn, st_buy, st_sell, atr = indicator(df, 'supertrend', 10, 3.0)
+  ema_s = indicator(df, 'ema', 50)
+  ema_f, ema_s = emas(df, 20, 50)     # same 'ema' entries, missing spans batched
+  persist_to(data_store.indicator_dir(DATA_M5))   # resume on appended M5 data
+"""
+
+import copy
+import hashlib
+import os
+import pickle
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from indicators import (ADXState, ATRState, EMAState, SupertrendState, calc_adx, calc_atr, calc_ema,
+                        calc_supertrend, ema_batch)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_fp_by_id = {}
+
+
+def _columns(df):
+    return (df['timestamp'].values.astype('datetime64[ns]').view('int64'),
+            df['high'].values, df['low'].values, df['close'].values)
+
+
+def _fingerprint(ts, high, low, close):
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(ts).tobytes())
+    for col in (high, low, close):
+        sha.update(np.ascontiguousarray(col, dtype=float).tobytes())
+    return sha.hexdigest()
+
+
+def dataset_fingerprint(df):
+    """sha1 over timestamp/high/low/close; memoized per DataFrame object."""
+    entry = _fp_by_id.get(id(df))
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+    fp = _fingerprint(*_columns(df))
+    key = id(df)
+    _fp_by_id[key] = (weakref.ref(df, lambda _, k=key: _fp_by_id.pop(k, None)), fp)
+    return fp
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def _head(value, k):
+    if isinstance(value, tuple):
+        return tuple(np.array(v[:k]) for v in value)
+    return np.array(value[:k])
+
+
+def _extend(value, rows):
+    # rows: one stepper output per new bar, shaped like one row of value
+    if isinstance(value, tuple):
+        return tuple(_extend(v, [r[i] for r in rows]) for i, v in enumerate(value))
+    new = np.array(rows, dtype=value.dtype).reshape((len(rows),) + value.shape[1:])
+    return np.concatenate([value, new])
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+
+def _write_snapshot(path, snap):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, tuple):
+        for v in value: _freeze(v)
+    return value
+
+
+class IndicatorCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.registry = {}
+        self.steppers = {}
+        self.persist_dir = None
+        self._store = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name, fn, stepper=None):
+        """
+        fn(df, *params) -> ndarray or tuple of ndarrays
+        stepper(*params) -> state whose update(high, low, close) returns one bar of fn's
+        output (scalars / rows in the same structure); makes the indicator resumable.
+        """
+        self.registry[name] = fn
+        if stepper is not None:
+            self.steppers[name] = stepper
+
+    def get(self, df, name, *params):
+        key = (dataset_fingerprint(df), name, params)
+        if key in self._store:
+            self._store.move_to_end(key)
+            self.hits += 1
+            return self._store[key][0]
+        self.misses += 1
+        if self.persist_dir is not None and name in self.steppers:
+            return self.put(df, name, params, self._resume(df, name, params))
+        return self.put(df, name, params, self.registry[name](df, *params))
+
+    def _snapshot_path(self, df, name, params):
+        # one snapshot per (indicator, params, series): a series is known by its first bars
+        first = df['timestamp'].values[:2].astype('datetime64[ns]').view('int64').tolist()
+        key = hashlib.sha1(repr((name, params, first)).encode()).hexdigest()[:20]
+        return os.path.join(self.persist_dir, name, f'{key}.pkl')
+
+    def _resume(self, df, name, params):
+        """fn(df, *params), stepping only the bars after a matching persisted snapshot."""
+        path = self._snapshot_path(df, name, params)
+        cols = _columns(df)
+        n = len(cols[0])
+        h, l, c = (np.asarray(col, dtype=float).tolist() for col in cols[1:])
+        snap = _read_snapshot(path)
+        if (snap is not None and snap['rows'] <= n
+                and _fingerprint(*(col[:snap['rows']] for col in cols)) == snap['fp']):
+            k, state, rows = snap['rows'], snap['state'], []
+            for i in range(k, n):
+                if i == n - 1:
+                    keep = copy.deepcopy(state)
+                rows.append(state.update(h[i], l[i], c[i]))
+            value = _extend(snap['value'], rows) if rows else snap['value']
+        else:
+            k, value, keep = 0, self.registry[name](df, *params), self.steppers[name](*params)
+            for i in range(n - 1):
+                keep.update(h[i], l[i], c[i])
+        if n - 1 > k:
+            _write_snapshot(path, {'rows': n - 1, 'fp': _fingerprint(*(col[:n - 1] for col in cols)),
+                                   'value': _head(value, n - 1), 'state': keep})
+        return value
+
+    def contains(self, df, name, *params):
+        return (dataset_fingerprint(df), name, params) in self._store
+
+    def put(self, df, name, params, value):
+        """Store a value computed outside the registry function (e.g. by a batch kernel)."""
+        key = (dataset_fingerprint(df), name, tuple(params))
+        value = _freeze(value)
+        if key in self._store:
+            self.nbytes -= self._store.pop(key)[1]
+        size = _nbytes(value)
+        self._store[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes and len(self._store) > 1:
+            _, (_, old_size) = self._store.popitem(last=False)
+            self.nbytes -= old_size
+        return value
+
+    def clear(self):
+        self._store.clear()
+        self.nbytes = 0
+
+
+def _ema_close(df, period):
+    return calc_ema(df['close'].values.astype(float), period)
+
+
+def _close_emas(cache, df, periods):
+    # spans not cached yet are computed together in one pass, then cached one by one
+    # (persisted spans resume one by one instead)
+    missing = [p for p in dict.fromkeys(periods) if not cache.contains(df, 'ema', p)]
+    if missing and cache.persist_dir is None:
+        for p, row in zip(missing, ema_batch(df['close'].values.astype(float), missing)):
+            cache.put(df, 'ema', (p,), row)
+    return tuple(cache.get(df, 'ema', p) for p in periods)
+
+
+class _EMAStep:
+    def __init__(self, period):
+        self.ema = EMAState(period)
+
+    def update(self, high, low, close):
+        return self.ema.update(close)
+
+
+class _SupertrendStep:
+    def __init__(self, atr_period=10, multiplier=3.0):
+        self.st = SupertrendState(atr_period, multiplier)
+
+    def update(self, high, low, close):
+        trend, flip, atr = self.st.update(high, low, close)
+        return trend, self.st.up, self.st.dn, flip > 0, flip < 0, atr
+
+
+_default = IndicatorCache()
+_default.register('supertrend', calc_supertrend, _SupertrendStep)
+_default.register('adx', calc_adx, ADXState)
+_default.register('atr', calc_atr, ATRState)
+_default.register('ema', _ema_close, _EMAStep)
+
+
+def register(name, fn, stepper=None):
+    _default.register(name, fn, stepper)
+
+
+def persist_to(directory):
+    """Persist / resume stepper-backed indicators under directory (None turns it off)."""
+    _default.persist_dir = directory
+
+
+def indicator(df, name, *params):
+    """Memoized indicator on df from the process-wide registry."""
+    return _default.get(df, name, *params)
+
+
+def emas(df, *periods):
+    """EMA(close) for several periods (tuple, in order); uncached spans share one batch pass."""
+    return _close_emas(_default, df, periods)
+
+
+def cache_stats():
+    return {'hits': _default.hits, 'misses': _default.misses,
+            'entries': len(_default._store), 'nbytes': _default.nbytes}
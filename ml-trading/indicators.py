@@ -0,0 +1,528 @@
+"""
+Shared Indicator Kernels
+========================
+True range is fully vectorized with NumPy; the Wilder/RMA recursions run in
+Numba-compiled kernels when numba is installed, otherwise the very same
+kernels run as plain Python loops (identical results, just slower).
+
+Outputs are bit-for-bit identical to the original per-bar loops in
+alpha_trend_master.py / supertrend_*.py: seeds that use np.mean/np.sum are
+computed with NumPy outside the kernels, or with pairwise_sum() (NumPy's
+summation order) inside them.
+
+ADX/+DI/-DI come from one per-bar step function: calc_adx() runs it over the
+whole frame in a compiled loop, ADXState.update() runs it bar by bar in O(1)
+for live evaluation, so both give identical numbers. EMAState, RMAState,
+ATRState, RollingMeanState, SupertrendState and TrailingStopState are the O(1)
+bar-by-bar counterparts of calc_ema, rma, calc_atr, pandas rolling().mean(),
+calc_supertrend and the Alpha Trend ATR trailing stop, with the same
+floating-point operations in the same order (see streaming.py, and
+indicator_cache.persist_to for resuming indicators on appended bars).
+
+supertrend_batch() evaluates many (atr_period, multiplier) pairs in a single
+pass over the bars, sharing TR/ATR across all parameter columns; ema_batch()
+does the same for a set of EMA spans.
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:  # optional accelerator
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+def _ohlc(df):
+    h = df['high'].values.astype(float)
+    l = df['low'].values.astype(float)
+    c = df['close'].values.astype(float)
+    return h, l, c
+
+
+def true_range(h, l, c):
+    """TR[0] = H-L, TR[i] = max(H-L, |H-C[i-1]|, |L-C[i-1]|)"""
+    tr = h - l
+    if len(tr) > 1:
+        tr[1:] = np.maximum(np.maximum(tr[1:], np.abs(h[1:] - c[:-1])), np.abs(l[1:] - c[:-1]))
+    return tr
+
+
+@njit(cache=True)
+def _rma_kernel(x, period, seed_idx, seed, out):
+    # out[seed_idx] = seed, then Wilder: (prev*(p-1) + x) / p
+    out[seed_idx] = seed
+    for i in range(seed_idx + 1, len(x)):
+        out[i] = (out[i-1] * (period - 1) + x[i]) / period
+    return out
+
+
+def rma(x, period):
+    """Wilder's smoothing like TradingView ta.rma: zeros before bar period-1, SMA seed."""
+    x = np.ascontiguousarray(x, dtype=float)
+    out = np.zeros(len(x))
+    if period > len(x):
+        return out
+    return _rma_kernel(x, period, period - 1, np.mean(x[:period]), out)
+
+
+@njit(cache=True)
+def _ema_batch_kernel(x, alphas, out):
+    # pandas ewm(adjust=False) recursion, one row of out per span, NaN inputs
+    # hold the last value (ignore_na=False weighting, like pandas)
+    k = len(alphas); n = len(x)
+    for j in range(k):
+        w = x[0] if n > 0 else np.nan
+        old_wt = 1.0
+        if n > 0: out[j, 0] = w
+        for i in range(1, n):
+            cur = x[i]
+            is_obs = cur == cur
+            if w == w:
+                old_wt *= 1.0 - alphas[j]
+                if is_obs:
+                    if w != cur:
+                        w = (old_wt * w + alphas[j] * cur) / (old_wt + alphas[j])
+                    old_wt = 1.0
+            elif is_obs:
+                w = cur
+            out[j, i] = w
+    return out
+
+
+def ema_batch(values, periods):
+    """EMA for several spans over the same input -> (len(periods) x n), same as calc_ema per row."""
+    x = np.ascontiguousarray(values, dtype=float)
+    alphas = np.array([2.0 / (float(p) + 1.0) for p in periods])
+    return _ema_batch_kernel(x, alphas, np.empty((len(alphas), len(x))))
+
+
+def calc_ema(values, period):
+    """EMA like pd.Series(values).ewm(span=period, adjust=False).mean()"""
+    return ema_batch(values, (period,))[0]
+
+
+def calc_atr(df, period=5):
+    """ATR with RMA (Wilder's smoothing) like TradingView ta.atr"""
+    h, l, c = _ohlc(df)
+    return rma(true_range(h, l, c), period)
+
+
+@njit(cache=True)
+def _supertrend_kernel(c, src, a, multiplier, up, dn, trend):
+    n = len(c)
+    up[0] = src[0] - multiplier * a[0]
+    dn[0] = src[0] + multiplier * a[0]
+    for i in range(1, n):
+        up[i] = src[i] - multiplier * a[i]
+        if c[i-1] > up[i-1] and up[i-1] > up[i]: up[i] = up[i-1]
+        dn[i] = src[i] + multiplier * a[i]
+        if c[i-1] < dn[i-1] and dn[i-1] < dn[i]: dn[i] = dn[i-1]
+        if trend[i-1] == -1 and c[i] > dn[i-1]: trend[i] = 1
+        elif trend[i-1] == 1 and c[i] < up[i-1]: trend[i] = -1
+        else: trend[i] = trend[i-1]
+
+
+@njit(cache=True)
+def _supertrend_batch_kernel(c, src, a, col_period, col_mult, trend, flip):
+    # one pass over the bars, every (atr_period, multiplier) column updated per bar;
+    # a is (n x n_periods), col_period maps each output column to its ATR column
+    n, k = trend.shape
+    up = np.empty(k); dn = np.empty(k)
+    for j in range(k):
+        aj = a[0, col_period[j]]
+        up[j] = src[0] - col_mult[j] * aj
+        dn[j] = src[0] + col_mult[j] * aj
+        trend[0, j] = 1
+    for i in range(1, n):
+        for j in range(k):
+            aj = a[i, col_period[j]]
+            prev_up = up[j]; prev_dn = dn[j]
+            u = src[i] - col_mult[j] * aj
+            if c[i-1] > prev_up and prev_up > u: u = prev_up
+            d = src[i] + col_mult[j] * aj
+            if c[i-1] < prev_dn and prev_dn < d: d = prev_dn
+            t = trend[i-1, j]
+            if t == -1 and c[i] > prev_dn: t = 1
+            elif t == 1 and c[i] < prev_up: t = -1
+            trend[i, j] = t
+            flip[i, j] = t - trend[i-1, j] if t != trend[i-1, j] else 0
+            up[j] = u; dn[j] = d
+
+
+def _supertrend_atr(tr, atr_period):
+    # SMA of TR (not RMA), NaN warm-up falls back to raw TR inside the bands
+    atr = pd.Series(tr).rolling(atr_period).mean().values
+    return atr, np.where(np.isnan(atr), tr, atr)
+
+
+def calc_supertrend(df, atr_period=10, multiplier=3.0):
+    h, l, c = _ohlc(df)
+    n = len(c)
+    tr = true_range(h, l, c)
+    atr, a = _supertrend_atr(tr, atr_period)
+    src = (h + l) / 2
+    up = np.zeros(n); dn = np.zeros(n)
+    trend = np.ones(n, dtype=int)
+    if n > 0:
+        _supertrend_kernel(c, src, a, float(multiplier), up, dn, trend)
+    st_buy = np.zeros(n, dtype=bool); st_sell = np.zeros(n, dtype=bool)
+    st_buy[1:] = (trend[1:] == 1) & (trend[:-1] == -1)
+    st_sell[1:] = (trend[1:] == -1) & (trend[:-1] == 1)
+    return trend, up, dn, st_buy, st_sell, atr
+
+
+def supertrend_batch(df, atr_periods=(10,), multipliers=(3.0,)):
+    """
+    Supertrend for every (atr_period, multiplier) pair in one pass over the bars.
+    TR is computed once, each ATR period once, shared by all multipliers.
+
+    Returns (trend, flip, atr, params):
+      trend  int8 (n x k)  +1 / -1, same as calc_supertrend()[0]
+      flip   int8 (n x k)  +2 = st_buy, -2 = st_sell, 0 = no flip
+      atr    float (n x len(atr_periods))  SMA ATR (NaN warm-up), as calc_supertrend()[5]
+      params list of (atr_period, multiplier), one per column (period-major order)
+    """
+    h, l, c = _ohlc(df)
+    n = len(c)
+    tr = true_range(h, l, c)
+    atr = np.empty((n, len(atr_periods))); a = np.empty((n, len(atr_periods)))
+    for p, period in enumerate(atr_periods):
+        atr[:, p], a[:, p] = _supertrend_atr(tr, period)
+    params = [(period, float(m)) for period in atr_periods for m in multipliers]
+    col_period = np.array([p for p in range(len(atr_periods)) for _ in multipliers], dtype=np.int64)
+    col_mult = np.array([m for _, m in params], dtype=float)
+    trend = np.ones((n, len(params)), dtype=np.int8)
+    flip = np.zeros((n, len(params)), dtype=np.int8)
+    if n > 0:
+        _supertrend_batch_kernel(c, (h + l) / 2, a, col_period, col_mult, trend, flip)
+    return trend, flip, atr, params
+
+
+@njit(cache=True)
+def _pairwise_block(x, start, n):
+    if n < 8:
+        res = 0.0
+        for i in range(start, start + n):
+            res += x[i]
+        return res
+    r0 = x[start]; r1 = x[start+1]; r2 = x[start+2]; r3 = x[start+3]
+    r4 = x[start+4]; r5 = x[start+5]; r6 = x[start+6]; r7 = x[start+7]
+    m = n - n % 8
+    for i in range(start + 8, start + m, 8):
+        r0 += x[i]; r1 += x[i+1]; r2 += x[i+2]; r3 += x[i+3]
+        r4 += x[i+4]; r5 += x[i+5]; r6 += x[i+6]; r7 += x[i+7]
+    res = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    for i in range(start + m, start + n):
+        res += x[i]
+    return res
+
+
+@njit(cache=True)
+def pairwise_sum(x, start, n):
+    """
+    sum(x[start:start+n]) in NumPy's pairwise order (same bits as np.sum / np.mean).
+    Blocks of <= 128 are summed directly; larger ranges split in halves like
+    NumPy, with an explicit stack (recursive kernels break Numba's on-disk cache).
+    """
+    if n <= 128:
+        return _pairwise_block(x, start, n)
+    ss = np.empty(64, np.int64); ns = np.empty(64, np.int64)
+    st = np.zeros(64, np.int8); vs = np.empty(64)
+    top = 0; ss[0] = start; ns[0] = n
+    ret = 0.0
+    while top >= 0:
+        s = ss[top]; m = ns[top]
+        half = m // 2
+        half -= half % 8
+        if m <= 128:
+            ret = _pairwise_block(x, s, m); top -= 1
+        elif st[top] == 0:
+            st[top] = 1
+            top += 1; ss[top] = s; ns[top] = half; st[top] = 0
+        elif st[top] == 1:
+            vs[top] = ret; st[top] = 2
+            top += 1; ss[top] = s + half; ns[top] = m - half; st[top] = 0
+        else:
+            ret = vs[top] + ret; top -= 1
+    return ret
+
+
+@njit(cache=True)
+def _max_nan(x, y):
+    # np.maximum semantics: NaN wins
+    return x if (x >= y or x != x) else y
+
+
+# ADX state vector slots
+_ADX_I, _ADX_H, _ADX_L, _ADX_C, _ADX_TR, _ADX_PDM, _ADX_MDM, _ADX_ADX = range(8)
+
+
+@njit(cache=True)
+def _adx_step(state, buf, period, h, l, c, out):
+    """
+    One bar of ADX/+DI/-DI (Wilder). state: 8 floats (_ADX_* slots), buf: (4 x period)
+    seed windows for TR, +DM, -DM and DX. Writes (adx, +di, -di) into out.
+    """
+    i = int(state[_ADX_I])
+    if i == 0:
+        tr = h - l; pdm = 0.0; mdm = 0.0
+    else:
+        pc = state[_ADX_C]
+        tr = _max_nan(_max_nan(h - l, abs(h - pc)), abs(l - pc))
+        up_move = h - state[_ADX_H]; down_move = state[_ADX_L] - l
+        pdm = up_move if (up_move > down_move and up_move > 0) else 0.0
+        mdm = down_move if (down_move > up_move and down_move > 0) else 0.0
+    if 1 <= i <= period:
+        buf[0, i-1] = tr; buf[1, i-1] = pdm; buf[2, i-1] = mdm
+    if i == period:
+        state[_ADX_TR] = pairwise_sum(buf[0], 0, period)
+        state[_ADX_PDM] = pairwise_sum(buf[1], 0, period)
+        state[_ADX_MDM] = pairwise_sum(buf[2], 0, period)
+    elif i > period:
+        state[_ADX_TR] = state[_ADX_TR] - (state[_ADX_TR] / period) + tr
+        state[_ADX_PDM] = state[_ADX_PDM] - (state[_ADX_PDM] / period) + pdm
+        state[_ADX_MDM] = state[_ADX_MDM] - (state[_ADX_MDM] / period) + mdm
+
+    atr_s = state[_ADX_TR]
+    pdi = 0.0; mdi = 0.0
+    if atr_s > 0:
+        pdi = 100*state[_ADX_PDM]/atr_s; mdi = 100*state[_ADX_MDM]/atr_s
+    di_sum = pdi + mdi
+    dx = 100*abs(pdi - mdi)/di_sum if di_sum > 0 else 0.0
+
+    start = period*2
+    if period < i <= start:
+        buf[3, i-period-1] = dx
+    if i == start:
+        state[_ADX_ADX] = pairwise_sum(buf[3], 0, period) / period
+    elif i > start:
+        state[_ADX_ADX] = (state[_ADX_ADX] * (period - 1) + dx) / period
+
+    state[_ADX_I] = i + 1; state[_ADX_H] = h; state[_ADX_L] = l; state[_ADX_C] = c
+    out[0] = state[_ADX_ADX]; out[1] = pdi; out[2] = mdi
+
+
+@njit(cache=True)
+def _adx_kernel(h, l, c, period, adx, plus_di, minus_di):
+    state = np.zeros(8); buf = np.zeros((4, period)); out = np.zeros(3)
+    for i in range(len(c)):
+        _adx_step(state, buf, period, h[i], l[i], c[i], out)
+        adx[i] = out[0]; plus_di[i] = out[1]; minus_di[i] = out[2]
+
+
+def calc_adx(df, period=14):
+    """(adx, plus_di, minus_di) in one compiled pass; same math as ADXState bar by bar."""
+    h, l, c = _ohlc(df)
+    n = len(c)
+    adx = np.zeros(n); plus_di = np.zeros(n); minus_di = np.zeros(n)
+    _adx_kernel(h, l, c, int(period), adx, plus_di, minus_di)
+    return adx, plus_di, minus_di
+
+
+class ADXState:
+    """
+    Incremental ADX: update(high, low, close) -> (adx, +di, -di) in O(1) per bar,
+    identical to calc_adx() on the same bars.
+    """
+
+    def __init__(self, period=14):
+        self.period = int(period)
+        self.state = np.zeros(8)
+        self.buf = np.zeros((4, self.period))
+        self._out = np.zeros(3)
+
+    @property
+    def bars(self):
+        return int(self.state[_ADX_I])
+
+    def update(self, high, low, close):
+        _adx_step(self.state, self.buf, self.period, float(high), float(low), float(close), self._out)
+        return self._out[0], self._out[1], self._out[2]
+
+
+class EMAState:
+    """Incremental EMA: update(x) -> value, identical to calc_ema() on the same inputs."""
+
+    def __init__(self, period):
+        self.alpha = 2.0 / (float(period) + 1.0)
+        self.value = math.nan
+        self.bars = 0
+        self._old_wt = 1.0
+
+    def update(self, x):
+        # same recursion as _ema_batch_kernel
+        cur = float(x); w = self.value
+        if self.bars == 0:
+            w = cur
+        elif w == w:
+            self._old_wt *= 1.0 - self.alpha
+            if cur == cur:
+                if w != cur:
+                    w = (self._old_wt * w + self.alpha * cur) / (self._old_wt + self.alpha)
+                self._old_wt = 1.0
+        elif cur == cur:
+            w = cur
+        self.bars += 1
+        self.value = w
+        return w
+
+
+class RMAState:
+    """Incremental Wilder RMA: update(x) -> value, identical to rma() (0 before bar period-1)."""
+
+    def __init__(self, period):
+        self.period = int(period)
+        self.value = 0.0
+        self.bars = 0
+        self._seed = []
+
+    def update(self, x):
+        x = float(x)
+        if self.bars < self.period:
+            self._seed.append(x)
+            if self.bars == self.period - 1:
+                self.value = float(np.mean(self._seed))
+                self._seed = None
+        else:
+            self.value = (self.value * (self.period - 1) + x) / self.period
+        self.bars += 1
+        return self.value
+
+
+class ATRState:
+    """Incremental ATR (RMA of true range): update(high, low, close) -> value, identical to calc_atr()."""
+
+    def __init__(self, period=5):
+        self.rma = RMAState(period)
+        self._close = None
+
+    def update(self, high, low, close):
+        h, l, pc = float(high), float(low), self._close
+        # same operand order as true_range()
+        tr = h - l if pc is None else max(max(h - l, abs(h - pc)), abs(l - pc))
+        self._close = float(close)
+        return self.rma.update(tr)
+
+
+class RollingMeanState:
+    """
+    Incremental pd.Series.rolling(window).mean() (NaN until window values), with
+    pandas' own running sum: Kahan-compensated add / remove, sign counts and the
+    constant-run shortcut, so the values match bit for bit.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self._buf = deque()
+        self._nobs = 0; self._sum = 0.0; self._neg = 0
+        self._comp_add = 0.0; self._comp_remove = 0.0
+        self._same = 0; self._prev = math.nan
+
+    def update(self, x):
+        x = float(x)
+        if len(self._buf) == self.window:
+            v = self._buf.popleft()
+            if v == v:
+                self._nobs -= 1
+                y = -v - self._comp_remove; t = self._sum + y
+                self._comp_remove = t - self._sum - y; self._sum = t
+                if math.copysign(1.0, v) < 0: self._neg -= 1
+        self._buf.append(x)
+        if x == x:
+            self._nobs += 1
+            y = x - self._comp_add; t = self._sum + y
+            self._comp_add = t - self._sum - y; self._sum = t
+            if math.copysign(1.0, x) < 0: self._neg += 1
+            self._same = self._same + 1 if x == self._prev else 1
+            self._prev = x
+        if self._nobs < self.window or self._nobs == 0:
+            return math.nan
+        result = self._sum / self._nobs
+        if self._same >= self._nobs: result = self._prev
+        elif self._neg == 0 and result < 0: result = 0.0
+        elif self._neg == self._nobs and result > 0: result = 0.0
+        return result
+
+
+class SupertrendState:
+    """
+    Incremental Supertrend: update(high, low, close) -> (trend, flip, atr), identical
+    to calc_supertrend() / supertrend_batch() (flip +2 = st_buy, -2 = st_sell; atr is
+    the SMA ATR, NaN during warm-up).
+    """
+
+    def __init__(self, atr_period=10, multiplier=3.0):
+        self.multiplier = float(multiplier)
+        self._atr = RollingMeanState(atr_period)
+        self.bars = 0
+        self.trend = 1
+        self.up = self.dn = math.nan
+        self._close = math.nan
+
+    def update(self, high, low, close):
+        h, l, c = float(high), float(low), float(close)
+        if self.bars == 0:
+            tr = h - l
+        else:
+            pc = self._close
+            tr = max(max(h - l, abs(h - pc)), abs(l - pc))
+        atr = self._atr.update(tr)
+        a = tr if atr != atr else atr
+        src = (h + l) / 2
+        up = src - self.multiplier * a
+        dn = src + self.multiplier * a
+        flip = 0
+        if self.bars > 0:
+            prev_up, prev_dn, pc = self.up, self.dn, self._close
+            if pc > prev_up and prev_up > up: up = prev_up
+            if pc < prev_dn and prev_dn < dn: dn = prev_dn
+            t = self.trend
+            if t == -1 and c > prev_dn: t = 1
+            elif t == 1 and c < prev_up: t = -1
+            flip = t - self.trend
+            self.trend = t
+        self.up, self.dn, self._close = up, dn, c
+        self.bars += 1
+        return self.trend, flip, atr
+
+
+class TrailingStopState:
+    """
+    Incremental ATR trailing stop (PineScript logic, nLoss = keyvalue * RMA ATR) for
+    several keyvalues: update(high, low, close) -> ([stop per keyvalue], atr), identical
+    to alpha_trend_master.atr_trailing_stops() row by row. The first stop is 0.
+    """
+
+    def __init__(self, keyvalues=(50.0,), atr_period=5):
+        self.keyvalues = [float(k) for k in keyvalues]
+        self.atr = ATRState(atr_period)
+        self.stops = None
+        self._close = None
+
+    def update(self, high, low, close):
+        atr = self.atr.update(high, low, close)
+        c, pc = float(close), self._close
+        if pc is None:
+            stops = [0.0] * len(self.keyvalues)
+        else:
+            stops = []
+            for kv, prev_stop in zip(self.keyvalues, self.stops):
+                nl = kv * atr
+                if c > prev_stop and pc > prev_stop:
+                    v = c - nl; stop = v if v > prev_stop else prev_stop
+                elif c < prev_stop and pc < prev_stop:
+                    v = c + nl; stop = v if v < prev_stop else prev_stop
+                elif c > prev_stop:
+                    stop = c - nl
+                else:
+                    stop = c + nl
+                stops.append(stop)
+        self.stops, self._close = stops, c
+        return stops, atr
@@ -0,0 +1,213 @@
+"""
+Trade Metrics
+=============
+Summary statistics straight from engine TRADE_DTYPE arrays (no DataFrames, no
+per-trade Python loops):
+
+  - counts / sums per config and per direction with np.bincount, so
+    batch_metrics() handles many configs' trade sets in one call
+  - max drawdown on the compounded equity path via np.maximum.accumulate
+    (same running order as the old loops: equity0 + pnl_1 + pnl_2 ...)
+  - longest losing streak from the run lengths of pnl <= 0
+  - yearly / monthly breakdowns grouped on the entry timestamp
+  - risk-adjusted set from the bar-aligned equity path (risk_metrics): open
+    positions marked to market on every bar's close, annualised Sharpe / Sortino
+    of those per-bar returns, CAGR, bar-level MDD, Calmar (CAGR / bar-level MDD),
+    exposure (share of bars in a position) and ulcer index
+
+summarize() returns the dict the scripts' analyze() used to build
+(label/total/wr/lc/sc/lwr/swr/pf/pnl/eq/mdd/ah/max_consec_loss/aw/al/exits,
+the risk_metrics keys, plus avg_adx / yearly / monthly_* on request). PF is
+999 when there are no losing trades.
+"""
+
+import numpy as np
+import pandas as pd
+
+from engine import EXIT_REASONS, INITIAL_EQUITY, TRADE_DTYPE
+from signals import LONG, SHORT
+
+PF_NO_LOSS = 999
+YEAR_NS = 365.25 * 86400 * 1e9
+
+
+def _profit_factor(win_sum, loss_sum, n_loss):
+    return win_sum / abs(loss_sum) if n_loss > 0 and loss_sum != 0 else PF_NO_LOSS
+
+
+def drawdown_streak(pnl, equity0=INITIAL_EQUITY):
+    """(max drawdown % of the running peak, longest run of pnl <= 0) for one trade sequence."""
+    if len(pnl) == 0:
+        return 0.0, 0
+    run = np.cumsum(np.r_[equity0, pnl])[1:]
+    peak = np.maximum.accumulate(np.r_[equity0, run])[1:]
+    dd = np.where(peak > 0, (peak - run) / np.where(peak > 0, peak, 1.0) * 100, 0.0)
+    edges = np.flatnonzero(np.diff(np.r_[0, (pnl <= 0).view(np.int8), 0]))
+    streak = int((edges[1::2] - edges[::2]).max()) if len(edges) else 0
+    return max(0.0, float(dd.max())), streak
+
+
+def batch_metrics(trade_sets, equity0=INITIAL_EQUITY):
+    """
+    Core metrics for many trade arrays at once -> dict of per-set arrays:
+    total, wins, wr, pf, pnl, mdd, max_consec_loss, lc, sc, lwr, swr, aw, al, ah.
+    """
+    k = len(trade_sets)
+    sizes = np.array([len(t) for t in trade_sets], dtype=np.int64)
+    trades = np.concatenate(trade_sets) if k else np.empty(0, dtype=TRADE_DTYPE)
+    g = np.repeat(np.arange(k), sizes)
+    pnl = trades['pnl']
+    win = pnl > 0
+
+    def count(mask):
+        return np.bincount(g[mask], minlength=k)
+
+    def total_of(mask, values):
+        return np.bincount(g[mask], weights=values[mask], minlength=k)
+
+    n_win = count(win); n_loss = sizes - n_win
+    win_sum = total_of(win, pnl); loss_sum = total_of(~win, pnl)
+    is_long = trades['direction'] == LONG; is_short = trades['direction'] == SHORT
+    lc = count(is_long); sc = count(is_short)
+    l_win = count(is_long & win); s_win = count(is_short & win)
+    hold = (trades['exit_bar'] - trades['entry_bar']).astype(float)
+
+    safe = np.maximum(sizes, 1)
+    out = {
+        'total': sizes, 'wins': n_win,
+        'wr': n_win / safe * 100,
+        'pf': np.array([_profit_factor(w, l, n) for w, l, n in zip(win_sum, loss_sum, n_loss)], dtype=float),
+        'pnl': np.array([t['pnl'].sum() for t in trade_sets]),
+        'lc': lc, 'sc': sc,
+        'lwr': np.where(lc > 0, l_win / np.maximum(lc, 1) * 100, 0.0),
+        'swr': np.where(sc > 0, s_win / np.maximum(sc, 1) * 100, 0.0),
+        'aw': np.where(n_win > 0, win_sum / np.maximum(n_win, 1), 0.0),
+        'al': np.where(n_loss > 0, np.abs(loss_sum / np.maximum(n_loss, 1)), 0.0),
+        'ah': np.bincount(g, weights=hold, minlength=k) / safe,
+    }
+    paths = [drawdown_streak(t['pnl'], equity0) for t in trade_sets]
+    out['mdd'] = np.array([p[0] for p in paths])
+    out['max_consec_loss'] = np.array([p[1] for p in paths], dtype=np.int64)
+    return out
+
+
+def _groups(trades, keys):
+    # per-period trades / wins / pnl / longs / shorts / win & loss sums
+    uniq, g = np.unique(keys, return_inverse=True)
+    m = len(uniq); pnl = trades['pnl']; win = pnl > 0
+    cnt = np.bincount(g, minlength=m)
+    n_win = np.bincount(g[win], minlength=m)
+    return uniq, {
+        'trades': cnt, 'wins': n_win,
+        'pnl': np.bincount(g, weights=pnl, minlength=m),
+        'win_sum': np.bincount(g[win], weights=pnl[win], minlength=m),
+        'loss_sum': np.bincount(g[~win], weights=pnl[~win], minlength=m),
+        'longs': np.bincount(g[trades['direction'] == LONG], minlength=m),
+        'shorts': np.bincount(g[trades['direction'] == SHORT], minlength=m),
+    }
+
+
+def yearly_breakdown(trades, entry_ts):
+    """{year: {trades, wr, pf, pnl, longs, shorts}} grouped on the entry year."""
+    years = entry_ts.astype('datetime64[Y]').astype(np.int64) + 1970
+    uniq, s = _groups(trades, years)
+    return {int(yr): {'trades': int(s['trades'][i]), 'wr': s['wins'][i] / s['trades'][i] * 100,
+                      'pf': _profit_factor(s['win_sum'][i], s['loss_sum'][i], s['trades'][i] - s['wins'][i]),
+                      'pnl': s['pnl'][i], 'longs': int(s['longs'][i]), 'shorts': int(s['shorts'][i])}
+            for i, yr in enumerate(uniq)}
+
+
+def monthly_breakdown(trades, entry_ts):
+    """(monthly pnl, monthly trade count) as Series on a monthly PeriodIndex."""
+    months = entry_ts.astype('datetime64[M]')
+    uniq, s = _groups(trades, months)
+    index = pd.PeriodIndex(uniq, freq='M')
+    return pd.Series(s['pnl'], index=index), pd.Series(s['trades'], index=index)
+
+
+def bar_equity(c, trades, equity0=INITIAL_EQUITY):
+    """
+    Equity on every bar's close: realised equity plus the open position marked to
+    market (size * (close - entry) * direction, less the entry fee) from the entry
+    bar up to the bar before the exit; each exit bar carries the trade's realised equity.
+    """
+    n = len(c)
+    pos = np.zeros(n, dtype=np.int64)
+    pos[trades['exit_bar']] = np.arange(1, len(trades) + 1)
+    eq = np.r_[equity0, trades['equity']][np.maximum.accumulate(pos)]
+    held = trades['exit_bar'] - trades['entry_bar']
+    if held.sum() == 0:
+        return eq
+    # entry fee: the trade's total fee (gross - pnl) split pro rata to notional
+    ep, xp, size, d = trades['entry_price'], trades['exit_price'], trades['size'], trades['direction']
+    fees = d * (xp - ep) * size - trades['pnl']
+    entry_fee = fees * ep / (ep + xp)
+    k = np.repeat(np.arange(len(trades)), held)
+    bars = trades['entry_bar'][k] + np.arange(len(k)) - np.repeat(np.cumsum(held) - held, held)
+    eq[bars] = np.maximum(eq[bars] + d[k] * size[k] * (c[bars] - ep[k]) - entry_fee[k], 0.0)
+    return eq
+
+
+def risk_metrics(df, trades, equity0=INITIAL_EQUITY):
+    """
+    sharpe, sortino (annualised, per-bar returns), cagr %, bar_mdd %, calmar, exposure %,
+    ulcer (RMS drawdown %) from the marked-to-market bar equity. Ratios are 0 where undefined (flat equity,
+    no drawdown, less than two bars).
+    """
+    ts = df['timestamp'].values.astype('datetime64[ns]').view(np.int64)
+    n = len(ts)
+    out = {'sharpe': 0.0, 'sortino': 0.0, 'cagr': 0.0, 'bar_mdd': 0.0, 'calmar': 0.0, 'exposure': 0.0,
+           'ulcer': 0.0}
+    if n < 2:
+        return out
+    eq = bar_equity(df['close'].values.astype(float), trades, equity0)
+    ret = np.zeros(n - 1)
+    alive = eq[:-1] > 0
+    ret[alive] = eq[1:][alive] / eq[:-1][alive] - 1
+    bars_per_year = YEAR_NS / np.median(np.diff(ts))
+    years = (ts[-1] - ts[0]) / YEAR_NS
+
+    sd = ret.std()
+    downside = np.sqrt(np.mean(np.minimum(ret, 0.0) ** 2))
+    peak = np.maximum.accumulate(np.r_[equity0, eq])[1:]
+    dd = (peak - eq) / peak * 100
+    mdd = dd.max()
+    out['sharpe'] = ret.mean() / sd * np.sqrt(bars_per_year) if sd > 0 else 0.0
+    out['sortino'] = ret.mean() / downside * np.sqrt(bars_per_year) if downside > 0 else 0.0
+    out['cagr'] = ((eq[-1] / equity0) ** (1 / years) - 1) * 100 if years > 0 else 0.0
+    out['bar_mdd'] = mdd
+    out['calmar'] = out['cagr'] / mdd if mdd > 0 else 0.0
+    out['exposure'] = (trades['exit_bar'] - trades['entry_bar']).sum() / (n - 1) * 100
+    out['ulcer'] = np.sqrt(np.mean(dd ** 2))
+    return out
+
+
+def summarize(df, trades, label="", signals=None, yearly=False, monthly=False,
+              equity0=INITIAL_EQUITY):
+    """
+    analyze()-style stats dict for one backtest ({} if there are no trades).
+    signals: adds avg_adx (mean signal ADX at entry).
+    """
+    if len(trades) == 0:
+        return {}
+    m = {k: v[0] for k, v in batch_metrics([trades], equity0).items()}
+    reasons, counts = np.unique(trades['exit_reason'], return_counts=True)
+    order = np.argsort(-counts, kind='stable')
+    s = {'label': label, 'total': int(m['total']), 'wr': m['wr'], 'lc': int(m['lc']), 'sc': int(m['sc']),
+         'lwr': m['lwr'], 'swr': m['swr'], 'pf': m['pf'], 'pnl': m['pnl'], 'eq': equity0 + m['pnl'],
+         'mdd': m['mdd'], 'ah': m['ah'], 'max_consec_loss': int(m['max_consec_loss']),
+         'exits': {EXIT_REASONS[reasons[i]]: int(counts[i]) for i in order},
+         'aw': m['aw'], 'al': m['al']}
+    s.update(risk_metrics(df, trades, equity0))
+    if signals is not None:
+        s['avg_adx'] = np.mean(signals['adx'][trades['sig']])
+    entry_ts = df['timestamp'].values.astype('datetime64[ns]')[trades['entry_bar']]
+    if yearly:
+        s['yearly'] = yearly_breakdown(trades, entry_ts)
+    if monthly:
+        monthly_pnl, monthly_count = monthly_breakdown(trades, entry_ts)
+        s['profitable_months'] = int((monthly_pnl > 0).sum())
+        s['total_months_traded'] = len(monthly_pnl)
+        s['monthly_pnl'] = monthly_pnl
+        s['monthly_count'] = monthly_count
+    return s
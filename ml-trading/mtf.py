@@ -0,0 +1,107 @@
+"""
+Multi-Timeframe Alignment
+=========================
+Maps higher-timeframe (HTF) series onto lower-timeframe (LTF) bars.
+
+Resampled bars are labelled by their open time, so there are two alignments:
+  - align='close' (look-ahead safe): an HTF bar's values are visible from the
+    first LTF bar that closes at or after the HTF bar's close (+ lag, an
+    optional confirmation delay such as '5min')
+  - align='open' (legacy): visible from the HTF bar's open time, i.e. a daily
+    EMA computed from the day's close is already seen at 00:00 that day
+
+htf_index() finds, for every LTF bar, the most recent visible HTF bar (-1 if
+none) with one searchsorted pass. The index is cached per (LTF frame, HTF
+frame, alignment) so every further mapping on the same pair is a single
+fancy-index; map_htf_to_ltf() maps any number of HTF columns at once.
+
+Bar lengths are taken from the smallest timestamp step of each frame.
+
+bar_ranges() goes the other way: the rows of a finer frame (the M5 source)
+that make up each bar of a resampled frame, e.g. to replay the inside of one
+2H bar.
+
+Usage:
+  ema200 = indicator(df_1d, 'ema', 200)
+  htf_ema, htf_close = map_htf_to_ltf(df_2h, df_1d, ema200, 'close')
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import dataset_fingerprint
+
+INDEX_LRU_SIZE = 32
+
+_index_lru = OrderedDict()
+
+
+def _ts_ns(df):
+    return np.ascontiguousarray(df['timestamp'].values.astype('datetime64[ns]').view('int64'))
+
+
+def _bar_ns(ts):
+    steps = np.diff(ts)
+    steps = steps[steps > 0]
+    return int(steps.min()) if len(steps) else 0
+
+
+def htf_index(df_ltf, df_htf, align='close', lag=None):
+    """idx[i] = last HTF bar visible at LTF bar i (see module docstring), -1 if none (read-only)."""
+    if align not in ('close', 'open'):
+        raise ValueError(f"unknown HTF alignment: {align}")
+    lag_ns = pd.Timedelta(lag or 0).value
+    key = (dataset_fingerprint(df_ltf), dataset_fingerprint(df_htf), align, lag_ns)
+    if key in _index_lru:
+        _index_lru.move_to_end(key)
+        return _index_lru[key]
+    ltf_ts, htf_ts = _ts_ns(df_ltf), _ts_ns(df_htf)
+    if align == 'close':
+        # HTF close (+ lag) must be at or before the LTF bar's close
+        htf_ts = htf_ts + (_bar_ns(htf_ts) + lag_ns)
+        ltf_ts = ltf_ts + _bar_ns(ltf_ts)
+    else:
+        ltf_ts = ltf_ts - lag_ns
+    idx = np.searchsorted(htf_ts, ltf_ts, side='right') - 1
+    idx.setflags(write=False)
+    _index_lru[key] = idx
+    while len(_index_lru) > INDEX_LRU_SIZE:
+        _index_lru.popitem(last=False)
+    return idx
+
+
+def map_htf_to_ltf(df_ltf, df_htf, *columns, align='close', lag=None):
+    """
+    Map HTF columns (column names of df_htf or HTF-length arrays) to LTF bars.
+    LTF bars before the first visible HTF bar get NaN. Returns one array per
+    column (a single array if only one column is given).
+    """
+    idx = htf_index(df_ltf, df_htf, align, lag)
+    m = len(df_htf)
+    # extra NaN column at the end: idx == -1 picks it up
+    vals = np.full((len(columns), m + 1), np.nan)
+    for k, col in enumerate(columns):
+        vals[k, :m] = df_htf[col].values if isinstance(col, str) else col
+    out = vals[:, idx]
+    return out[0] if len(columns) == 1 else tuple(out)
+
+
+def bar_ranges(df, df_fine):
+    """
+    (start, end): df_fine rows [start[i], end[i]) lie inside bar i of df, i.e.
+    [open, open + bar length). Cached like htf_index (read-only).
+    """
+    key = ('ranges', dataset_fingerprint(df), dataset_fingerprint(df_fine))
+    if key in _index_lru:
+        _index_lru.move_to_end(key)
+        return _index_lru[key]
+    ts, fine_ts = _ts_ns(df), _ts_ns(df_fine)
+    start = np.searchsorted(fine_ts, ts, side='left')
+    end = np.searchsorted(fine_ts, ts + _bar_ns(ts), side='left')
+    start.setflags(write=False); end.setflags(write=False)
+    _index_lru[key] = (start, end)
+    while len(_index_lru) > INDEX_LRU_SIZE:
+        _index_lru.popitem(last=False)
+    return start, end
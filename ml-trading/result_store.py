@@ -0,0 +1,152 @@
+"""
+Backtest Result Store
+=====================
+Content-addressed on-disk store for sweep cells (SQLite, data/cache/results.sqlite).
+
+Key = sha1 of (dataset fingerprint, strategy, params, code version):
+  - dataset fingerprint: sha1 of the OHLCV frames the sweep runs on
+  - params: the cfg fields the result depends on (result_params: display label
+    and batching hints like exit_grid / keyvalues dropped, sl_m / tp_m as sl / tp),
+    so growing a grid or renaming a label keeps the stored cells
+  - code version: sha1 of the strategy module + engine/indicator/signal sources,
+    so any code change invalidates old results automatically
+
+Each row keeps the signal count, summary stats (analyze() output), equity curve
+and trades. cached_sweep() wraps sweep.run_sweep: stored cells come back
+instantly and only new configs are simulated.
+
+Sweep tasks used with cached_sweep return (n_signals, summary, equity_curve, trades).
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import time
+
+from indicator_cache import dataset_fingerprint
+from sweep import run_sweep
+
+STORE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'cache', 'results.sqlite')
+CORE_MODULES = ('data_store', 'engine', 'exit_index', 'htf_filters', 'indicator_cache', 'indicators',
+                'metrics', 'mtf', 'signals')
+# cfg keys that only name or batch a cell (the simulated result is the same without them)
+NON_RESULT_KEYS = ('label', 'exit_grid', 'keyvalues')
+PARAM_ALIASES = {'sl_m': 'sl', 'tp_m': 'tp'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    strategy TEXT NOT NULL,
+    params TEXT NOT NULL,
+    data_fp TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    created REAL NOT NULL,
+    n_signals INTEGER,
+    summary BLOB,
+    equity BLOB,
+    trades BLOB
+)
+"""
+
+
+def code_version(module_names):
+    # hashed by file name, so a script run as __main__ shares results with the CLI
+    paths = {(sys.modules.get(m) or __import__(m)).__file__ for m in module_names}
+    sha = hashlib.sha1()
+    for path in sorted(paths, key=os.path.basename):
+        with open(path, 'rb') as f:
+            sha.update(os.path.basename(path).encode()); sha.update(f.read())
+    return sha.hexdigest()
+
+
+def frames_fingerprint(frames):
+    sha = hashlib.sha1()
+    for name in sorted(frames):
+        sha.update(name.encode()); sha.update(dataset_fingerprint(frames[name]).encode())
+    return sha.hexdigest()
+
+
+def result_params(params):
+    """The cfg fields a cell's result depends on, with the scripts' and the CLI's names unified."""
+    out = {}
+    for k, v in params.items():
+        if k in NON_RESULT_KEYS:
+            continue
+        k = PARAM_ALIASES.get(k, k)
+        out[k] = float(v) if k in ('sl', 'tp') else v
+    return out
+
+
+def result_key(data_fp, strategy, params, version):
+    payload = json.dumps([data_fp, strategy, result_params(params), version], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path=None):
+        self.path = path or STORE_PATH
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(_SCHEMA)
+        self.conn.commit()
+
+    def get(self, key):
+        """(n_signals, summary, equity_curve, trades) or None"""
+        row = self.conn.execute(
+            "SELECT n_signals, summary, equity, trades FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1]), pickle.loads(row[2]), pickle.loads(row[3])
+
+    def put(self, key, strategy, params, data_fp, version, result):
+        n_signals, summary, equity, trades = result
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, strategy, json.dumps(result_params(params), sort_keys=True, default=str), data_fp, version,
+             time.time(), int(n_signals), pickle.dumps(summary), pickle.dumps(equity),
+             pickle.dumps(trades)))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def _relabel(result, params):
+    # a stored cell may have been run under another label (other grid / the CLI)
+    if result is None or not result[1] or 'label' not in params:
+        return result
+    n_signals, summary, equity, trades = result
+    return n_signals, {**summary, 'label': params['label']}, equity, trades
+
+
+def cached_sweep(task, grid, frames, strategy, workers=None, store=None):
+    """
+    run_sweep() with the result store in front: yields (index, params, result) in
+    grid order; only cells missing from the store are simulated (in parallel).
+    """
+    own_store = store is None
+    store = store or ResultStore()
+    data_fp = frames_fingerprint(frames)
+    version = code_version(CORE_MODULES + (task.__module__,))
+    keys = [result_key(data_fp, strategy, params, version) for params in grid]
+    results = [_relabel(store.get(k), params) for k, params in zip(keys, grid)]
+    todo = [i for i, r in enumerate(results) if r is None]
+
+    try:
+        next_idx = 0
+        for j, params, result in run_sweep(task, [grid[i] for i in todo], frames, workers=workers):
+            i = todo[j]
+            store.put(keys[i], strategy, params, data_fp, version, result)
+            results[i] = result
+            while next_idx < len(grid) and results[next_idx] is not None:
+                yield next_idx, grid[next_idx], results[next_idx]
+                next_idx += 1
+        while next_idx < len(grid):
+            yield next_idx, grid[next_idx], results[next_idx]
+            next_idx += 1
+    finally:
+        if own_store:
+            store.close()
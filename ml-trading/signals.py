@@ -0,0 +1,58 @@
+"""
+Signal Arrays
+=============
+Signal generators build LONG/SHORT boolean masks with NumPy and return one
+compact structured array instead of a list of dicts:
+
+  bar            int64    entry bar index
+  direction      int8     LONG = 1, SHORT = -1
+  price          float64  close at the signal bar (entry price)
+  atr            float64  ATR at the signal bar
+  adx            float64  ADX at the signal bar (NaN if the strategy has none)
+  trailing_stop  float64  ATR trailing stop (NaN if the strategy has none)
+
+Timestamps are not stored: df['timestamp'].values[sigs['bar']] when needed.
+"""
+
+import numpy as np
+
+LONG = 1
+SHORT = -1
+
+SIGNAL_DTYPE = np.dtype([
+    ('bar', np.int64), ('direction', np.int8), ('price', np.float64),
+    ('atr', np.float64), ('adx', np.float64), ('trailing_stop', np.float64),
+])
+
+
+def build_signals(long_mask, short_mask, start_bar, price, atr, adx=None, trailing_stop=None):
+    """
+    Structured signal array from per-bar masks (bars < start_bar are ignored).
+    LONG wins if both masks are set on the same bar, like the if/elif of the old loops.
+    """
+    active = np.arange(len(price)) >= start_bar
+    long_mask = np.asarray(long_mask, dtype=bool) & active
+    short_mask = np.asarray(short_mask, dtype=bool) & active & ~long_mask
+    bars = np.flatnonzero(long_mask | short_mask)
+
+    sigs = np.empty(len(bars), dtype=SIGNAL_DTYPE)
+    sigs['bar'] = bars
+    sigs['direction'] = np.where(long_mask[bars], LONG, SHORT)
+    sigs['price'] = price[bars]
+    sigs['atr'] = atr[bars]
+    sigs['adx'] = adx[bars] if adx is not None else np.nan
+    sigs['trailing_stop'] = trailing_stop[bars] if trailing_stop is not None else np.nan
+    return sigs
+
+
+def direction_label(d):
+    return 'LONG' if d == LONG else 'SHORT'
+
+
+def signals_to_dicts(sigs, df):
+    """Legacy list-of-dicts view (bar/direction/price/atr/adx/trailing_stop/timestamp)."""
+    ts = df['timestamp'].values
+    return [{'bar': int(s['bar']), 'direction': direction_label(s['direction']),
+             'price': s['price'], 'atr': s['atr'], 'adx': s['adx'],
+             'trailing_stop': s['trailing_stop'], 'timestamp': ts[s['bar']]}
+            for s in sigs]
@@ -0,0 +1,444 @@
+"""
+Streaming Strategy Engine
+=========================
+Runs the strategies bar by bar on a feed of M5 rows (paper trading / alerts)
+instead of over whole DataFrames:
+
+  BarAggregator        M5 rows -> bars of one resample frequency, emitted as soon
+                       as the bar's last M5 slot arrives (or the next bar starts)
+  SupertrendStrategy   Supertrend + EMA fast/slow + ADX (+ HTF filter config),
+                       as generate_signals / generate_signals_mtf
+  AlphaTrendStrategy   ATR trailing stop cross + EMA filter, as generate_signals_alpha
+  StreamEngine         routes each M5 row to the shared aggregators and strategies
+
+Every indicator is an O(1) state update (indicators.EMAState, SupertrendState,
+ADXState, TrailingStopState) doing the same floating-point
+operations as the batch kernels, so a replay of the M5 history produces
+bit-identical signal arrays (same bar numbering as load_resampled frames).
+
+HTF filter configs ({'type': 'direction', 'htf': '1D', 'ema_period': 200}, 'and' /
+'or' ...) are fed by their own aggregators; an HTF bar's masks become visible
+once the bar has closed (+ 'lag'), like align='close'. align='open' looks ahead
+into the running HTF bar and cannot be streamed.
+
+replay() times every M5 row (time.perf_counter_ns) and latency_summary() reports
+mean / p50 / p95 / p99 / max per row and per bar close.
+
+Usage:
+  engine = StreamEngine()
+  engine.add('st_2h', SupertrendStrategy(adx_threshold=20), '2h')
+  for ts_ns, o, h, l, c, v in feed:
+      for name, sig in engine.on_row(ts_ns, o, h, l, c, v): alert(name, sig)
+
+  python streaming.py [M5 csv]     # replay parity vs the batch generators + latency
+"""
+
+import math
+import os
+import sys
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_arrays
+from indicators import ADXState, EMAState, SupertrendState, TrailingStopState
+from signals import LONG, SHORT, SIGNAL_DTYPE
+
+DATA_M5 = os.path.join(os.path.dirname(__file__), 'data', 'BTCUSDT_M5.csv')
+DAY_NS = 86400 * 10**9
+
+# frame names used by the scripts / sweep specs -> resample frequency
+TIMEFRAMES = {'M30': '30min', '1H': '1h', '1.5H': '90min', '2H': '2h', '4H': '4h', '1D': '1D'}
+
+Bar = namedtuple('Bar', 'ts open high low close volume end')
+
+
+class BarAggregator:
+    """
+    M5 rows -> OHLCV bars of one pandas resample frequency (bins counted from
+    midnight, empty bins skipped), identical to resample_ohlcv on the same rows.
+    """
+
+    def __init__(self, freq, base='5min'):
+        self.freq = freq
+        self.step = pd.Timedelta(freq).value
+        self.base = pd.Timedelta(base).value
+        self._origin = None
+        self._bar = None
+
+    def roll(self, ts):
+        """Close the open bar if ts falls past it -> Bar or None (call before add)."""
+        if self._bar is not None and ts >= self._bar[6]:
+            return self._close()
+        return None
+
+    def add(self, ts, o, h, l, c, v):
+        """Add one row -> the Bar if this row fills the bar's last M5 slot, else None."""
+        b = self._bar
+        if b is None:
+            if self._origin is None:
+                self._origin = ts - ts % DAY_NS
+            start = ts - (ts - self._origin) % self.step
+            self._bar = b = [start, o, h, l, c, v, start + self.step]
+        else:
+            if h > b[2]: b[2] = h
+            if l < b[3]: b[3] = l
+            b[4] = c; b[5] += v
+        if ts + self.base >= b[6]:
+            return self._close()
+        return None
+
+    def _close(self):
+        bar = Bar(*self._bar)
+        self._bar = None
+        return bar
+
+
+# ---------------------------------------------------------------------------
+# HTF filters
+# ---------------------------------------------------------------------------
+
+class _StreamHTF:
+    """One HTF mask (htf_filters leaf) fed bar by bar; masks visible from bar close + lag."""
+
+    def __init__(self, htf, lag_ns):
+        self.htf, self.lag_ns = htf, lag_ns
+        self._pending = deque()
+        self._current = (False, False)
+
+    def leaves(self):
+        return [self]
+
+    def on_htf_bar(self, bar):
+        self._pending.append((bar.end + self.lag_ns, self.masks(bar.close)))
+
+    def visible(self, t):
+        """(long_ok, short_ok) of the last HTF bar visible at time t."""
+        while self._pending and self._pending[0][0] <= t:
+            self._current = self._pending.popleft()[1]
+        return self._current
+
+
+class _StreamDirection(_StreamHTF):
+    def __init__(self, htf, lag_ns, ema_period):
+        super().__init__(htf, lag_ns)
+        self.ema = EMAState(ema_period)
+
+    def masks(self, c):
+        e = self.ema.update(c)
+        return c > e, c < e
+
+
+class _StreamTrendAlign(_StreamHTF):
+    def __init__(self, htf, lag_ns, ema_period, slope_bars=5):
+        super().__init__(htf, lag_ns)
+        self.ema = EMAState(ema_period)
+        self._hist = deque(maxlen=slope_bars + 1)
+
+    def masks(self, c):
+        e = self.ema.update(c)
+        self._hist.append(e)
+        lagged = self._hist[0] if len(self._hist) == self._hist.maxlen else math.nan
+        return (c > e) and (e > lagged), (c < e) and (e < lagged)
+
+
+class _StreamDualEMA(_StreamHTF):
+    def __init__(self, htf, lag_ns, ema_period, ema_period2):
+        super().__init__(htf, lag_ns)
+        self.ema1, self.ema2 = EMAState(ema_period), EMAState(ema_period2)
+
+    def masks(self, c):
+        e1, e2 = self.ema1.update(c), self.ema2.update(c)
+        return e1 > e2, e1 < e2
+
+
+class _StreamTripleEMA(_StreamHTF):
+    def __init__(self, htf, lag_ns, fast=50, slow=200):
+        super().__init__(htf, lag_ns)
+        self.ema_fast, self.ema_slow = EMAState(fast), EMAState(slow)
+
+    def masks(self, c):
+        ok = not math.isnan(self.ema_fast.update(c))
+        e = self.ema_slow.update(c)
+        return ok and c > e, ok and c < e
+
+
+class _StreamCombine:
+    def __init__(self, parts, combine):
+        self.parts, self.combine = parts, combine
+
+    def leaves(self):
+        return [leaf for p in self.parts for leaf in p.leaves()]
+
+    def visible(self, t):
+        masks = [p.visible(t) for p in self.parts]
+        return self.combine(m[0] for m in masks), self.combine(m[1] for m in masks)
+
+
+def stream_filter(cfg, lag_ns=None):
+    """
+    Dict HTF filter config (see htf_filters.filter_from_config) -> streaming filter,
+    None for type 'none'. Leaves are fed through on_htf_bar() by the engine.
+    """
+    if lag_ns is None:
+        if cfg.get('align', 'close') != 'close':
+            raise ValueError("streaming HTF filters need align='close' ('open' looks ahead)")
+        lag_ns = pd.Timedelta(cfg.get('lag') or 0).value
+    kind = cfg.get('type', 'none')
+    if kind == 'none':
+        return None
+    if kind in ('and', 'or'):
+        parts = [stream_filter(c, lag_ns) for c in cfg['filters']]
+        if kind == 'or' and None in parts:
+            return None            # OR with an always-ok filter
+        parts = [p for p in parts if p is not None]
+        return _StreamCombine(parts, all if kind == 'and' else any) if parts else None
+    htf = cfg['htf']
+    if kind == 'direction':
+        return _StreamDirection(htf, lag_ns, cfg['ema_period'])
+    if kind == 'trend_align':
+        return _StreamTrendAlign(htf, lag_ns, cfg['ema_period'], cfg.get('slope_bars', 5))
+    if kind == 'dual_ema':
+        return _StreamDualEMA(htf, lag_ns, cfg['ema_period'], cfg['ema_period2'])
+    if kind == 'triple_ema':
+        return _StreamTripleEMA(htf, lag_ns)
+    raise ValueError(f"unknown HTF filter type: {kind}")
+
+
+# ---------------------------------------------------------------------------
+# Strategies
+# ---------------------------------------------------------------------------
+
+class StreamStrategy:
+    """
+    Base class: on_bar(bar) -> SIGNAL_DTYPE-compatible tuple or None. self.bars is
+    the index of the next bar, so signal bars match the batch frame's rows.
+    """
+    htf_filter = None
+
+    def htf_leaves(self):
+        return self.htf_filter.leaves() if self.htf_filter is not None else []
+
+    def _signal(self, direction, price, atr, adx=math.nan, trailing_stop=math.nan):
+        return (self.bars - 1, direction, price, atr, adx, trailing_stop)
+
+
+class SupertrendStrategy(StreamStrategy):
+    """Supertrend flip + EMA fast/slow + ADX threshold (+ HTF filter config)."""
+
+    def __init__(self, atr_period=10, multiplier=3.0, ema_fast=20, ema_slow=50,
+                 adx_period=14, adx_threshold=None, htf_filter=None):
+        self.st = SupertrendState(atr_period, multiplier)
+        self.ema_fast, self.ema_slow = EMAState(ema_fast), EMAState(ema_slow)
+        self.adx = ADXState(adx_period)
+        self.adx_threshold = adx_threshold
+        self.htf_filter = stream_filter(htf_filter) if htf_filter is not None else None
+        self.start_bar = max(ema_slow, atr_period, adx_period*2) + 1
+        self.bars = 0
+
+    def on_bar(self, bar):
+        _, flip, atr = self.st.update(bar.high, bar.low, bar.close)
+        ef, es = self.ema_fast.update(bar.close), self.ema_slow.update(bar.close)
+        adx = float(self.adx.update(bar.high, bar.low, bar.close)[0])
+        self.bars += 1
+        if self.bars <= self.start_bar or flip == 0:
+            return None
+        if self.adx_threshold is not None and adx < self.adx_threshold:
+            return None
+        long_ok, short_ok = (self.htf_filter.visible(bar.end) if self.htf_filter is not None
+                             else (True, True))
+        if flip > 0 and ef > es and long_ok:
+            return self._signal(LONG, bar.close, atr, adx)
+        if flip < 0 and ef < es and short_ok:
+            return self._signal(SHORT, bar.close, atr, adx)
+        return None
+
+
+class AlphaTrendStrategy(StreamStrategy):
+    """Close crossing the ATR trailing stop (keyvalue * RMA ATR) + EMA filter."""
+
+    def __init__(self, keyvalue=50.0, atr_period=5, ema_period=1000):
+        self.trailing = TrailingStopState((keyvalue,), atr_period)
+        self.ema = EMAState(ema_period)
+        self.start_bar = max(ema_period, atr_period) + 10
+        self.bars = 0
+        self._close = self._stop = math.nan
+
+    def on_bar(self, bar):
+        c, pc, prev_stop = bar.close, self._close, self._stop
+        stops, atr = self.trailing.update(bar.high, bar.low, c)
+        stop = stops[0]
+        e = self.ema.update(c)
+        self._close, self._stop = c, stop
+        self.bars += 1
+        if self.bars <= self.start_bar:
+            return None
+        if c > stop and pc <= prev_stop and c > e:
+            return self._signal(LONG, c, atr, trailing_stop=stop)
+        if c < stop and pc >= prev_stop and c < e:
+            return self._signal(SHORT, c, atr, trailing_stop=stop)
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Engine / replay
+# ---------------------------------------------------------------------------
+
+class StreamEngine:
+    """
+    Routes M5 rows to one shared BarAggregator per frequency. HTF bars are handed
+    to the filters before entry-timeframe bars, so a strategy sees every HTF bar
+    that closed at or before its own bar close.
+    """
+
+    def __init__(self, timeframes=None):
+        self.timeframes = dict(TIMEFRAMES, **(timeframes or {}))
+        self.strategies = {}
+        self._aggs = {}            # freq -> BarAggregator
+        self._on_bar = {}          # freq -> [(name, strategy)]
+        self._on_htf = {}          # freq -> [filter leaf]
+        self._order = []
+        self.bars_closed = 0
+
+    def _agg(self, freq):
+        if freq not in self._aggs:
+            self._aggs[freq] = BarAggregator(freq)
+            self._on_bar[freq] = []; self._on_htf[freq] = []
+            # largest frequency first: HTF bars are routed before LTF bars
+            self._order = sorted(self._aggs.values(), key=lambda a: -a.step)
+        return freq
+
+    def add(self, name, strategy, freq):
+        """Register a strategy on entry frequency freq (e.g. '2h' or '2H')."""
+        self.strategies[name] = strategy
+        self._on_bar[self._agg(self.timeframes.get(freq, freq))].append((name, strategy))
+        for leaf in strategy.htf_leaves():
+            self._on_htf[self._agg(self.timeframes.get(leaf.htf, leaf.htf))].append(leaf)
+        return strategy
+
+    def _dispatch(self, bar, freq, out):
+        for leaf in self._on_htf[freq]:
+            leaf.on_htf_bar(bar)
+        for name, strategy in self._on_bar[freq]:
+            sig = strategy.on_bar(bar)
+            if sig is not None:
+                out.append((name, sig))
+        if self._on_bar[freq]:
+            self.bars_closed += 1
+
+    def on_row(self, ts, o, h, l, c, v):
+        """Feed one M5 row (ts: epoch ns of the row open) -> [(strategy name, signal tuple)]."""
+        out = []
+        for agg in self._order:
+            bar = agg.roll(ts)
+            if bar is not None:
+                self._dispatch(bar, agg.freq, out)
+        for agg in self._order:
+            bar = agg.add(ts, o, h, l, c, v)
+            if bar is not None:
+                self._dispatch(bar, agg.freq, out)
+        return out
+
+
+def replay(engine, path=DATA_M5, start=None, end=None):
+    """
+    Feed the M5 history (rows with start <= timestamp <= end) through engine.
+    Returns ({name: SIGNAL_DTYPE array}, per-row latency ns, per-row bar-close flag).
+    """
+    arrays = load_arrays(path)
+    ts = arrays['timestamp']
+    lo = 0 if start is None else int(np.searchsorted(ts, pd.Timestamp(start).value, side='left'))
+    hi = len(ts) if end is None else int(np.searchsorted(ts, pd.Timestamp(end).value, side='right'))
+    rows = zip(ts[lo:hi].tolist(), *(arrays[col][lo:hi].tolist()
+                                     for col in ('open', 'high', 'low', 'close', 'volume')))
+    found = {name: [] for name in engine.strategies}
+    latency = np.empty(hi - lo, dtype=np.int64)
+    closed = np.zeros(hi - lo, dtype=bool)
+    clock = time.perf_counter_ns
+    for i, row in enumerate(rows):
+        before = engine.bars_closed
+        t0 = clock()
+        for name, sig in engine.on_row(*row):
+            found[name].append(sig)
+        latency[i] = clock() - t0
+        closed[i] = engine.bars_closed != before
+    return ({name: np.array(sigs, dtype=SIGNAL_DTYPE) for name, sigs in found.items()},
+            latency, closed)
+
+
+def latency_summary(latency, closed=None):
+    """{'rows', 'rows_per_s', 'mean_us', 'p50_us', 'p95_us', 'p99_us', 'max_us'} (+ 'bar_*' for bar closes)."""
+    def stats(ns, prefix=''):
+        us = ns / 1e3
+        if len(us) == 0:
+            return {f'{prefix}rows': 0}
+        p50, p95, p99 = np.percentile(us, [50, 95, 99])
+        return {f'{prefix}rows': len(us), f'{prefix}mean_us': us.mean(), f'{prefix}p50_us': p50,
+                f'{prefix}p95_us': p95, f'{prefix}p99_us': p99, f'{prefix}max_us': us.max()}
+    out = stats(latency)
+    out['rows_per_s'] = len(latency) / (latency.sum() / 1e9) if latency.sum() > 0 else 0.0
+    if closed is not None:
+        out.update(stats(latency[closed], 'bar_'))
+    return out
+
+
+def check_parity(path=DATA_M5):
+    """Replay the M5 history through streaming strategies and compare with the batch generators."""
+    from data_store import load_resampled
+    from alpha_trend_master import generate_signals_alpha
+    from supertrend_ema_freq_optimize import generate_signals
+    from supertrend_mtf_ema import generate_signals_mtf
+
+    d_ema200 = {'type': 'direction', 'htf': '1D', 'ema_period': 200}
+    align_4h = {'type': 'and', 'filters': [{'type': 'trend_align', 'htf': '4H', 'ema_period': 50},
+                                           {'type': 'dual_ema', 'htf': '1D', 'ema_period': 20,
+                                            'ema_period2': 50}]}
+    cases = {
+        'st_2h_adx20': (SupertrendStrategy(adx_threshold=20), '2h',
+                        lambda f: generate_signals(f['2H'], adx_threshold=20)[0]),
+        'st_90m': (SupertrendStrategy(), '90min',
+                   lambda f: generate_signals(f['1.5H'])[0]),
+        'mtf_2h_d_ema200': (SupertrendStrategy(adx_threshold=20, htf_filter=d_ema200), '2h',
+                            lambda f: generate_signals_mtf(f['2H'], None, d_ema200, adx_threshold=20,
+                                                           frames=f)[0]),
+        'mtf_1h_4h_align': (SupertrendStrategy(htf_filter=align_4h), '1h',
+                            lambda f: generate_signals_mtf(f['1H'], None, align_4h, frames=f)[0]),
+        'alpha_m30_kv50': (AlphaTrendStrategy(50.0, 5, 1000), '30min',
+                           lambda f: generate_signals_alpha(f['M30'], 50.0, 5, 1000)[0]),
+    }
+    engine = StreamEngine()
+    for name, (strategy, freq, _) in cases.items():
+        engine.add(name, strategy, freq)
+    streamed, latency, closed = replay(engine, path)
+
+    frames = {name: load_resampled(path, freq) for name, freq in TIMEFRAMES.items()}
+    ok = True
+    for name, (_, _, batch) in cases.items():
+        expected = batch(frames)
+        same = expected.tobytes() == streamed[name].tobytes()
+        ok &= same
+        print(f"  {name:<18} batch {len(expected):>5}  stream {len(streamed[name]):>5}  "
+              f"{'identical' if same else 'MISMATCH'}")
+    return ok, latency_summary(latency, closed)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else DATA_M5
+    print("=" * 70)
+    print("STREAMING REPLAY - parity with the batch signal generators")
+    print("=" * 70)
+    ok, lat = check_parity(path)
+    print(f"\n  rows {lat['rows']:,}  ({lat['rows_per_s']:,.0f} rows/s)")
+    print(f"  per row:       mean {lat['mean_us']:.1f}us  p50 {lat['p50_us']:.1f}us  "
+          f"p95 {lat['p95_us']:.1f}us  p99 {lat['p99_us']:.1f}us  max {lat['max_us']:.0f}us")
+    if lat.get('bar_rows'):
+        print(f"  per bar close: mean {lat['bar_mean_us']:.1f}us  p50 {lat['bar_p50_us']:.1f}us  "
+              f"p95 {lat['bar_p95_us']:.1f}us  p99 {lat['bar_p99_us']:.1f}us  max {lat['bar_max_us']:.0f}us")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
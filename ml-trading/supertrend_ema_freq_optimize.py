@@ -13,7 +13,6 @@ Trade Frequency Optimization Backtest
 """
 
 import numpy as np
-import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
@@ -21,194 +20,75 @@ import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_store import indicator_dir, load_m5, load_resampled
+from indicator_cache import emas, indicator, persist_to
+from engine import equity_curve, run_backtest, run_backtest_risks
+from metrics import batch_metrics, summarize
+from signals import build_signals
+from result_store import cached_sweep
+
+TARGET_RISKS = np.arange(1, 101) / 200  # 0.5% .. 50% for the target search
 DATA_M5 = os.path.join(os.path.dirname(__file__), 'data', 'BTCUSDT_M5.csv')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'backtest_results')
 
 
-def resample_ohlcv(df_5m, freq='2h'):
-    df = df_5m.copy()
-    df.index = pd.DatetimeIndex(df['timestamp'])
-    ohlcv = df.resample(freq).agg({
-        'open': 'first', 'high': 'max', 'low': 'min',
-        'close': 'last', 'volume': 'sum',
-    }).dropna()
-    ohlcv['timestamp'] = ohlcv.index
-    return ohlcv.reset_index(drop=True)
-
-
-def calc_supertrend(df, atr_period=10, multiplier=3.0):
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    c = df['close'].values.astype(float)
-    n = len(c)
-    tr = np.zeros(n)
-    tr[0] = h[0] - l[0]
-    for i in range(1, n):
-        tr[i] = max(h[i] - l[i], abs(h[i] - c[i-1]), abs(l[i] - c[i-1]))
-    atr = pd.Series(tr).rolling(atr_period).mean().values
-    src = (h + l) / 2
-    up = np.zeros(n); dn = np.zeros(n)
-    trend = np.ones(n, dtype=int)
-    up[0] = src[0] - multiplier * (atr[0] if not np.isnan(atr[0]) else tr[0])
-    dn[0] = src[0] + multiplier * (atr[0] if not np.isnan(atr[0]) else tr[0])
-    for i in range(1, n):
-        a = atr[i] if not np.isnan(atr[i]) else tr[i]
-        up[i] = src[i] - multiplier * a
-        if c[i-1] > up[i-1]: up[i] = max(up[i], up[i-1])
-        dn[i] = src[i] + multiplier * a
-        if c[i-1] < dn[i-1]: dn[i] = min(dn[i], dn[i-1])
-        if trend[i-1] == -1 and c[i] > dn[i-1]: trend[i] = 1
-        elif trend[i-1] == 1 and c[i] < up[i-1]: trend[i] = -1
-        else: trend[i] = trend[i-1]
-    st_buy = np.zeros(n, dtype=bool); st_sell = np.zeros(n, dtype=bool)
-    for i in range(1, n):
-        if trend[i] == 1 and trend[i-1] == -1: st_buy[i] = True
-        elif trend[i] == -1 and trend[i-1] == 1: st_sell[i] = True
-    return trend, up, dn, st_buy, st_sell, atr
-
-
-def calc_ema(values, period):
-    return pd.Series(values).ewm(span=period, adjust=False).mean().values
-
-
-def calc_adx(df, period=14):
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    c = df['close'].values.astype(float)
-    n = len(c)
-    tr = np.zeros(n); tr[0] = h[0] - l[0]
-    for i in range(1, n):
-        tr[i] = max(h[i] - l[i], abs(h[i] - c[i-1]), abs(l[i] - c[i-1]))
-    plus_dm = np.zeros(n); minus_dm = np.zeros(n)
-    for i in range(1, n):
-        up_move = h[i] - h[i-1]; down_move = l[i-1] - l[i]
-        if up_move > down_move and up_move > 0: plus_dm[i] = up_move
-        if down_move > up_move and down_move > 0: minus_dm[i] = down_move
-    atr_s = np.zeros(n); plus_dm_s = np.zeros(n); minus_dm_s = np.zeros(n)
-    if period < n:
-        atr_s[period] = np.sum(tr[1:period+1])
-        plus_dm_s[period] = np.sum(plus_dm[1:period+1])
-        minus_dm_s[period] = np.sum(minus_dm[1:period+1])
-    for i in range(period+1, n):
-        atr_s[i] = atr_s[i-1] - (atr_s[i-1]/period) + tr[i]
-        plus_dm_s[i] = plus_dm_s[i-1] - (plus_dm_s[i-1]/period) + plus_dm[i]
-        minus_dm_s[i] = minus_dm_s[i-1] - (minus_dm_s[i-1]/period) + minus_dm[i]
-    plus_di = np.zeros(n); minus_di = np.zeros(n)
-    for i in range(period, n):
-        if atr_s[i] > 0:
-            plus_di[i] = 100*plus_dm_s[i]/atr_s[i]; minus_di[i] = 100*minus_dm_s[i]/atr_s[i]
-    dx = np.zeros(n)
-    for i in range(period, n):
-        di_sum = plus_di[i]+minus_di[i]
-        if di_sum > 0: dx[i] = 100*abs(plus_di[i]-minus_di[i])/di_sum
-    adx = np.zeros(n); start = period*2
-    if start < n:
-        adx[start] = np.mean(dx[period+1:start+1])
-        for i in range(start+1, n): adx[i] = (adx[i-1]*(period-1)+dx[i])/period
-    return adx, plus_di, minus_di
-
-
 def generate_signals(df, atr_period=10, multiplier=3.0, ema_fast=20, ema_slow=50,
                      adx_period=14, adx_threshold=None):
     c = df['close'].values.astype(float)
-    n = len(c)
-    trend, up, dn, st_buy, st_sell, atr = calc_supertrend(df, atr_period, multiplier)
-    ema_f = calc_ema(c, ema_fast); ema_s = calc_ema(c, ema_slow)
-    adx_values, _, _ = calc_adx(df, adx_period)
-    signals = []
+    trend, up, dn, st_buy, st_sell, atr = indicator(df, 'supertrend', atr_period, multiplier)
+    ema_f, ema_s = emas(df, ema_fast, ema_slow)
+    adx_values, _, _ = indicator(df, 'adx', adx_period)
+    adx_ok = ~(adx_values < adx_threshold) if adx_threshold is not None else True
+    long_mask = st_buy & (ema_f > ema_s) & adx_ok
+    short_mask = st_sell & (ema_f < ema_s) & adx_ok
     start_bar = max(ema_slow, atr_period, adx_period*2) + 1
-    for i in range(start_bar, n):
-        if st_buy[i] and ema_f[i] > ema_s[i]:
-            if adx_threshold is not None and adx_values[i] < adx_threshold: continue
-            signals.append({'bar':i,'direction':'LONG','price':c[i],'atr':atr[i],
-                           'adx':adx_values[i],'timestamp':df['timestamp'].iloc[i]})
-        elif st_sell[i] and ema_f[i] < ema_s[i]:
-            if adx_threshold is not None and adx_values[i] < adx_threshold: continue
-            signals.append({'bar':i,'direction':'SHORT','price':c[i],'atr':atr[i],
-                           'adx':adx_values[i],'timestamp':df['timestamp'].iloc[i]})
+    signals = build_signals(long_mask, short_mask, start_bar, c, atr, adx=adx_values)
     return signals, atr
 
 
-def backtest_fixed(df, signals, sl_m=2.0, tp_m=6.0, fee=0.0006, max_hold=60, risk=0.02):
-    c = df['close'].values.astype(float)
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    n = len(c)
-    trades = []; equity = 10000.0
-    eq_curve = [{'bar':0,'equity':equity,'timestamp':df['timestamp'].iloc[0]}]
-    i = 0
-    while i < len(signals):
-        sig = signals[i]; eb=sig['bar']; ep=sig['price']; d=sig['direction']; a=sig['atr']
-        if np.isnan(a) or a<=0: i+=1; continue
-        sl = ep-a*sl_m if d=='LONG' else ep+a*sl_m
-        tp = ep+a*tp_m if d=='LONG' else ep-a*tp_m
-        rk = abs(ep-sl)
-        if rk<=0 or rk/ep>0.05: i+=1; continue
-        ps = (equity*risk)/rk; ec = ep*ps*fee
-        xb=xp=xr=None
-        for bar in range(eb+1, min(eb+max_hold, n)):
-            if d=='LONG':
-                if l[bar]<=sl: xb,xp,xr=bar,sl,'SL'; break
-                if h[bar]>=tp: xb,xp,xr=bar,tp,'TP'; break
-            else:
-                if h[bar]>=sl: xb,xp,xr=bar,sl,'SL'; break
-                if l[bar]<=tp: xb,xp,xr=bar,tp,'TP'; break
-        if xb is None: xb=min(eb+max_hold-1,n-1); xp=c[xb]; xr='TIME'
-        xc = xp*ps*fee
-        pnl = ((xp-ep) if d=='LONG' else (ep-xp))*ps - ec - xc
-        equity += pnl
-        if equity<=0: equity=0
-        eq_curve.append({'bar':xb,'equity':equity,'timestamp':df['timestamp'].iloc[min(xb,n-1)]})
-        trades.append({'entry_time':sig['timestamp'],'exit_time':df['timestamp'].iloc[min(xb,n-1)],
-                       'direction':d,'entry_price':ep,'exit_price':xp,'pnl':pnl,
-                       'exit_reason':xr,'hold_bars':xb-eb,'adx_at_entry':sig.get('adx',0)})
-        if equity<=0: break
-        while i+1<len(signals) and signals[i+1]['bar']<=xb: i+=1
-        i+=1
-    return trades, eq_curve, equity
-
-
-def analyze(trades, label=""):
-    if not trades: return {}
-    df_t = pd.DataFrame(trades)
-    total = len(df_t)
-    wins = df_t[df_t['pnl']>0]; losses = df_t[df_t['pnl']<=0]
-    longs = df_t[df_t['direction']=='LONG']; shorts = df_t[df_t['direction']=='SHORT']
-    wr = len(wins)/total*100
-    pf = wins['pnl'].sum()/abs(losses['pnl'].sum()) if len(losses)>0 and losses['pnl'].sum()!=0 else 999
-    tp_val = df_t['pnl'].sum()
-    mdd=0; pk=10000; run=10000
-    for p in df_t['pnl']:
-        run+=p
-        if run>pk: pk=run
-        dd=(pk-run)/pk*100 if pk>0 else 0
-        if dd>mdd: mdd=dd
-    lwr = len(longs[longs['pnl']>0])/len(longs)*100 if len(longs)>0 else 0
-    swr = len(shorts[shorts['pnl']>0])/len(shorts)*100 if len(shorts)>0 else 0
-    mc=0; cc=0
-    for p in df_t['pnl']:
-        if p<=0: cc+=1; mc=max(mc,cc)
-        else: cc=0
-    aw = wins['pnl'].mean() if len(wins)>0 else 0
-    al = abs(losses['pnl'].mean()) if len(losses)>0 else 0
-
-    # monthly breakdown
-    df_t['month'] = pd.to_datetime(df_t['entry_time']).dt.to_period('M')
-    monthly_pnl = df_t.groupby('month')['pnl'].sum()
-    monthly_count = df_t.groupby('month').size()
-    profitable_months = (monthly_pnl > 0).sum()
-    total_months_traded = len(monthly_pnl)
-
-    return {'label':label,'total':total,'wr':wr,'lc':len(longs),'sc':len(shorts),
-            'lwr':lwr,'swr':swr,'pf':pf,'pnl':tp_val,'eq':10000+tp_val,'mdd':mdd,
-            'ah':df_t['hold_bars'].mean(),'max_consec_loss':mc,
-            'exits':df_t['exit_reason'].value_counts().to_dict(),
-            'aw':aw,'al':al,'avg_adx':df_t['adx_at_entry'].mean(),
-            'monthly_avg_trades': total / 24,
-            'profitable_months': profitable_months,
-            'total_months_traded': total_months_traded,
-            'monthly_pnl': monthly_pnl,
-            'monthly_count': monthly_count}
+def backtest_fixed(df, signals, sl_m=2.0, tp_m=6.0, fee=0.0006, max_hold=60, risk=0.02, exit_grid=None,
+                   intrabar=None):
+    trades, equity = run_backtest(df, signals, 'atr', sl_m, tp_m, fee=fee,
+                                  max_hold=max_hold, risk=risk, max_risk=0.05, exit_grid=exit_grid,
+                                  intrabar=intrabar)
+    return trades, equity_curve(df, trades), equity
+
+
+def analyze(df, trades, signals, label=""):
+    s = summarize(df, trades, label, signals=signals, monthly=True)
+    if s:
+        s['monthly_avg_trades'] = s['total'] / 24
+    return s
+
+
+def config_signals(frames, cfg):
+    df_tf = frames[cfg['tf']]
+    sigs, _ = generate_signals(df_tf, 10, 3.0, 20, 50,
+                               adx_period=14, adx_threshold=cfg['adx_threshold'])
+    return df_tf, sigs
+
+
+def config_exits(cfg):
+    """(exit mode, sl, tp, max_risk) a cell is backtested with"""
+    return 'atr', cfg['sl_m'], cfg['tp_m'], 0.05
+
+
+def run_config(frames, cfg):
+    """Sweep task: one TF x ADX x SL/TP cell -> (signal count, stats, equity curve, trades)"""
+    df_tf, sigs = config_signals(frames, cfg)
+    trades, eq, _ = backtest_fixed(df_tf, sigs, sl_m=cfg['sl_m'], tp_m=cfg['tp_m'],
+                                   max_hold=cfg['max_hold'], risk=0.02, exit_grid=cfg.get('exit_grid'),
+                                   intrabar=frames.get('M5'))
+    return len(sigs), analyze(df_tf, trades, sigs, cfg['label']), eq, trades
+
+
+def risk_scaling(frames, cfg, risks):
+    """One sweep cell re-simulated at every risk fraction in one engine pass -> batch_metrics dict"""
+    df_tf, sigs = config_signals(frames, cfg)
+    mode, sl, tp, max_risk = config_exits(cfg)
+    trade_sets, _ = run_backtest_risks(df_tf, sigs, risks, mode, sl, tp,
+                                       max_hold=cfg['max_hold'], max_risk=max_risk, intrabar=frames.get('M5'))
+    return batch_metrics(trade_sets)
 
 
 def plot_equity(eq_dict, output_dir, filename, title):
@@ -300,9 +180,9 @@ def plot_risk_comparison(top_results, output_dir):
 
     labels = [r['label'] for r in top_results[:8]]
     pnl_2pct = [r['pnl'] / 24 for r in top_results[:8]]  # monthly
-    pnl_5pct = [r['pnl'] * 2.5 / 24 for r in top_results[:8]]
+    pnl_5pct = [r['pnl_5pct'] / 24 for r in top_results[:8]]
     mdd_2pct = [r['mdd'] for r in top_results[:8]]
-    mdd_5pct = [r['mdd'] * 2.5 for r in top_results[:8]]
+    mdd_5pct = [r['mdd_5pct'] for r in top_results[:8]]
 
     x = np.arange(len(labels))
     width = 0.35
@@ -339,19 +219,15 @@ def main():
     print("Period: 2024-2025 | Capital: $10,000 | Fee: 0.06%/side")
     print("=" * 130)
 
-    df_m5 = pd.read_csv(DATA_M5)
-    df_m5['timestamp'] = pd.to_datetime(df_m5['timestamp'])
-
     # ============================================================
     # Phase 1: Resample all timeframes
     # ============================================================
     print("\n[Phase 1] Resampling timeframes...")
+    persist_to(indicator_dir(DATA_M5))
 
     tf_data = {}
     for tf_name, freq, max_hold in [('1H', '1h', 120), ('1.5H', '90min', 80), ('2H', '2h', 60)]:
-        df_tf = resample_ohlcv(df_m5, freq)
-        mask = (df_tf['timestamp'] >= '2024-01-01') & (df_tf['timestamp'] <= '2025-12-31')
-        df_tf = df_tf[mask].reset_index(drop=True)
+        df_tf = load_resampled(DATA_M5, freq, start='2024-01-01', end='2025-12-31')
         tf_data[tf_name] = {'df': df_tf, 'max_hold': max_hold}
         print(f"  {tf_name}: {len(df_tf):,} bars (max_hold={max_hold})")
 
@@ -382,6 +258,7 @@ def main():
 
     all_results = []
     all_eq = {}
+    all_cfg = {}
     total_configs = len(tf_data) * len(adx_thresholds) * len(sl_tp_configs)
 
     print(f"  Total configurations: {total_configs}\n")
@@ -390,32 +267,34 @@ def main():
     print(header)
     print("  " + "-" * 120)
 
+    # the SL/TP pairs of one TF x ADX signal set share one outcome matrix
+    exit_grid = [(sl_m, tp_m) for sl_m, tp_m, _ in sl_tp_configs]
+    grid = []
     for tf_name, tf_info in tf_data.items():
-        df_tf = tf_info['df']
-        max_hold = tf_info['max_hold']
-
         for adx_th in adx_thresholds:
             for sl_m, tp_m, rr_label in sl_tp_configs:
                 adx_label = f"ADX>{adx_th}" if adx_th else "NoADX"
-                label = f"{tf_name} {adx_label} SL{sl_m}/TP{tp_m} ({rr_label})"
-
-                sigs, _ = generate_signals(df_tf, 10, 3.0, 20, 50,
-                                           adx_period=14, adx_threshold=adx_th)
-                trades, eq, _ = backtest_fixed(df_tf, sigs, sl_m=sl_m, tp_m=tp_m,
-                                               max_hold=max_hold, risk=0.02)
-                s = analyze(trades, label)
-
-                if s:
-                    all_results.append(s)
-                    all_eq[label] = eq
-                    pf_str = f"{s['pf']:>5.2f}" if s['pf'] < 100 else "  INF"
-                    monthly = s['pnl'] / 24
-                    t_per_mo = s['total'] / 24
-                    print(f"  {label:<45s} {len(sigs):>4d} {s['total']:>4d} {s['wr']:>4.1f}% {pf_str} "
-                          f"${s['pnl']:>8,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} "
-                          f"{t_per_mo:>5.1f} ${monthly:>5.0f} {s['ah']:>4.0f}b")
-                else:
-                    print(f"  {label:<45s} {len(sigs):>4d}  -> No trades")
+                grid.append({'label': f"{tf_name} {adx_label} SL{sl_m}/TP{tp_m} ({rr_label})",
+                             'tf': tf_name, 'max_hold': tf_info['max_hold'],
+                             'adx_threshold': adx_th, 'sl_m': sl_m, 'tp_m': tp_m,
+                             'exit_grid': exit_grid})
+
+    frames = {tf_name: tf_info['df'] for tf_name, tf_info in tf_data.items()}
+    frames['M5'] = load_m5(DATA_M5)  # settles bars that touch both SL and TP
+    for _, cfg, (n_sigs, s, eq, _) in cached_sweep(run_config, grid, frames, 'supertrend'):
+        label = cfg['label']
+        if s:
+            all_results.append(s)
+            all_eq[label] = eq
+            all_cfg[label] = cfg
+            pf_str = f"{s['pf']:>5.2f}" if s['pf'] < 100 else "  INF"
+            monthly = s['pnl'] / 24
+            t_per_mo = s['total'] / 24
+            print(f"  {label:<45s} {n_sigs:>4d} {s['total']:>4d} {s['wr']:>4.1f}% {pf_str} "
+                  f"${s['pnl']:>8,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} "
+                  f"{t_per_mo:>5.1f} ${monthly:>5.0f} {s['ah']:>4.0f}b")
+        else:
+            print(f"  {label:<45s} {n_sigs:>4d}  -> No trades")
 
     # ============================================================
     # Phase 3: Rankings
@@ -452,6 +331,15 @@ def main():
         print(f"  {i:>5d} {s['label']:<45s} {s['total']:>4d} {t_per_mo:>5.1f} {s['pf']:>5.2f} "
               f"${monthly:>5.0f} {s['mdd']:>5.1f}% {s['wr']:>4.1f}%")
 
+    # --- Rank by risk-adjusted return (bar-level equity, compounding) ---
+    print("\n--- TOP 15 BY SHARPE (mark-to-market per-bar returns, annualised) ---")
+    print(f"  {'#':>3s} {'Strategy':<45s} {'Sharpe':>6s} {'Sortino':>7s} {'Calmar':>6s} {'CAGR%':>6s} {'BarDD%':>6s} {'Ulcer':>5s} {'Expo%':>5s}")
+    print("  " + "-" * 101)
+    by_sharpe = sorted(valid, key=lambda x: x['sharpe'], reverse=True)
+    for i, s in enumerate(by_sharpe[:15], 1):
+        print(f"  {i:>3d} {s['label']:<45s} {s['sharpe']:>6.2f} {s['sortino']:>7.2f} {s['calmar']:>6.2f} "
+              f"{s['cagr']:>5.1f}% {s['bar_mdd']:>5.1f}% {s['ulcer']:>5.1f} {s['exposure']:>4.1f}%")
+
     # --- Rank by EFFICIENCY SCORE ---
     # Score = (Monthly PnL) / (MDD) * sqrt(trades/month)
     # Higher = better balance of returns, risk, and frequency
@@ -471,8 +359,10 @@ def main():
     for i, s in enumerate(by_eff[:15], 1):
         monthly = s['pnl'] / 24
         t_per_mo = s['total'] / 24
-        monthly_5pct = monthly * 2.5
-        mdd_5pct = s['mdd'] * 2.5
+        at5 = risk_scaling(frames, all_cfg[s['label']], [0.05])
+        s['pnl_5pct'], s['mdd_5pct'] = at5['pnl'][0], at5['mdd'][0]
+        monthly_5pct = s['pnl_5pct'] / 24
+        mdd_5pct = s['mdd_5pct']
         marker = " >> " if i <= 5 else "    "
         print(f"  {marker}{i:>2d} {s['label']:<45s} {s['eff_score']:>7.2f} {s['total']:>4d} {t_per_mo:>5.1f} {s['pf']:>5.2f} "
               f"${monthly:>5.0f} {s['mdd']:>5.1f}% ${monthly_5pct:>6.0f} {mdd_5pct:>5.1f}%")
@@ -484,19 +374,19 @@ def main():
     print("PHASE 4: RISK SCALING - Top 5 Strategies")
     print("=" * 130)
 
+    # exact compounding per risk (one engine pass per strategy), not the 2% result scaled
+    risk_pcts = [2, 3, 5, 7, 10]
     top5 = by_eff[:5]
     for s in top5:
-        monthly_base = s['pnl'] / 24
+        m = risk_scaling(frames, all_cfg[s['label']], [r / 100 for r in risk_pcts])
         print(f"\n  {s['label']}")
         print(f"  {'Risk%':>8s} {'Monthly$':>10s} {'Annual$':>10s} {'Annual%':>8s} {'MDD':>7s} {'Trades':>7s}")
         print(f"  {'-'*55}")
-        for risk_pct in [2, 3, 5, 7, 10]:
-            mult = risk_pct / 2.0
-            mo = monthly_base * mult
+        for j, risk_pct in enumerate(risk_pcts):
+            mo = m['pnl'][j] / 24
             annual = mo * 12
             annual_pct = annual / 10000 * 100
-            mdd = s['mdd'] * mult
-            print(f"  {risk_pct:>7d}% ${mo:>9.0f} ${annual:>9.0f} {annual_pct:>7.1f}% {mdd:>6.1f}% {s['total']:>7d}")
+            print(f"  {risk_pct:>7d}% ${mo:>9.0f} ${annual:>9.0f} {annual_pct:>7.1f}% {m['mdd'][j]:>6.1f}% {m['total'][j]:>7d}")
 
     # ============================================================
     # Phase 5: Target analysis - how to reach 20%+ monthly
@@ -511,10 +401,14 @@ def main():
         monthly_2pct = s['pnl'] / 24
         if monthly_2pct <= 0: continue
 
-        # What risk% needed for $2000/month?
-        needed_mult = 2000 / monthly_2pct
-        needed_risk = 2.0 * needed_mult
-        resulting_mdd = s['mdd'] * needed_mult
+        # Smallest risk% on the grid that reaches $2000/month (exact re-simulation)
+        m = risk_scaling(frames, all_cfg[s['label']], TARGET_RISKS)
+        hit = np.flatnonzero(m['pnl'] / 24 >= 2000)
+        if len(hit) == 0:
+            print(f"  {s['label']:<45s} Need Risk:  n/a  (target not reached up to {TARGET_RISKS[-1]*100:.0f}% risk)")
+            continue
+        needed_risk = TARGET_RISKS[hit[0]] * 100
+        resulting_mdd = m['mdd'][hit[0]]
 
         feasible = "OK" if resulting_mdd < 20 else "HIGH MDD" if resulting_mdd < 35 else "DANGEROUS"
 
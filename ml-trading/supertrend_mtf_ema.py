@@ -15,12 +15,12 @@ Multi-Timeframe EMA Trend Filter Backtest
 3. 필터 모드:
    - Direction Only: 상위TF EMA 위=롱만, 아래=숏만
    - Trend Alignment: 상위TF EMA 방향 + 기울기 확인
+   - 상위TF 값은 해당 봉 마감 이후에만 사용 (look-ahead 방지, filter 'align')
 
 전체 기간: 2022-01 ~ 2026-02 (4년+)
 연도별 분석 포함
 """
 
-import numpy as np
 import pandas as pd
 import matplotlib
 matplotlib.use('Agg')
@@ -29,316 +29,97 @@ import os
 import warnings
 warnings.filterwarnings('ignore')
 
+from data_store import indicator_dir, load_m5, load_resampled
+from indicator_cache import emas, indicator, persist_to
+from htf_filters import HTFFilter, filter_from_config
+from engine import equity_curve, run_backtest, run_backtest_risks
+from metrics import batch_metrics, summarize
+from signals import build_signals
+from result_store import cached_sweep
+
 DATA_M5 = os.path.join(os.path.dirname(__file__), 'data', 'BTCUSDT_M5.csv')
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), 'backtest_results')
 
 
-def resample_ohlcv(df_5m, freq='2h'):
-    df = df_5m.copy()
-    df.index = pd.DatetimeIndex(df['timestamp'])
-    ohlcv = df.resample(freq).agg({
-        'open': 'first', 'high': 'max', 'low': 'min',
-        'close': 'last', 'volume': 'sum',
-    }).dropna()
-    ohlcv['timestamp'] = ohlcv.index
-    return ohlcv.reset_index(drop=True)
-
-
-def calc_supertrend(df, atr_period=10, multiplier=3.0):
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    c = df['close'].values.astype(float)
-    n = len(c)
-    tr = np.zeros(n); tr[0] = h[0] - l[0]
-    for i in range(1, n):
-        tr[i] = max(h[i] - l[i], abs(h[i] - c[i-1]), abs(l[i] - c[i-1]))
-    atr = pd.Series(tr).rolling(atr_period).mean().values
-    src = (h + l) / 2
-    up = np.zeros(n); dn = np.zeros(n)
-    trend = np.ones(n, dtype=int)
-    up[0] = src[0] - multiplier * (atr[0] if not np.isnan(atr[0]) else tr[0])
-    dn[0] = src[0] + multiplier * (atr[0] if not np.isnan(atr[0]) else tr[0])
-    for i in range(1, n):
-        a = atr[i] if not np.isnan(atr[i]) else tr[i]
-        up[i] = src[i] - multiplier * a
-        if c[i-1] > up[i-1]: up[i] = max(up[i], up[i-1])
-        dn[i] = src[i] + multiplier * a
-        if c[i-1] < dn[i-1]: dn[i] = min(dn[i], dn[i-1])
-        if trend[i-1] == -1 and c[i] > dn[i-1]: trend[i] = 1
-        elif trend[i-1] == 1 and c[i] < up[i-1]: trend[i] = -1
-        else: trend[i] = trend[i-1]
-    st_buy = np.zeros(n, dtype=bool); st_sell = np.zeros(n, dtype=bool)
-    for i in range(1, n):
-        if trend[i] == 1 and trend[i-1] == -1: st_buy[i] = True
-        elif trend[i] == -1 and trend[i-1] == 1: st_sell[i] = True
-    return trend, up, dn, st_buy, st_sell, atr
-
-
-def calc_ema(values, period):
-    return pd.Series(values).ewm(span=period, adjust=False).mean().values
-
-
-def calc_adx(df, period=14):
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    c = df['close'].values.astype(float)
-    n = len(c)
-    tr = np.zeros(n); tr[0] = h[0] - l[0]
-    for i in range(1, n):
-        tr[i] = max(h[i] - l[i], abs(h[i] - c[i-1]), abs(l[i] - c[i-1]))
-    plus_dm = np.zeros(n); minus_dm = np.zeros(n)
-    for i in range(1, n):
-        up_move = h[i] - h[i-1]; down_move = l[i-1] - l[i]
-        if up_move > down_move and up_move > 0: plus_dm[i] = up_move
-        if down_move > up_move and down_move > 0: minus_dm[i] = down_move
-    atr_s = np.zeros(n); plus_dm_s = np.zeros(n); minus_dm_s = np.zeros(n)
-    if period < n:
-        atr_s[period] = np.sum(tr[1:period+1])
-        plus_dm_s[period] = np.sum(plus_dm[1:period+1])
-        minus_dm_s[period] = np.sum(minus_dm[1:period+1])
-    for i in range(period+1, n):
-        atr_s[i] = atr_s[i-1] - (atr_s[i-1]/period) + tr[i]
-        plus_dm_s[i] = plus_dm_s[i-1] - (plus_dm_s[i-1]/period) + plus_dm[i]
-        minus_dm_s[i] = minus_dm_s[i-1] - (minus_dm_s[i-1]/period) + minus_dm[i]
-    plus_di = np.zeros(n); minus_di = np.zeros(n)
-    for i in range(period, n):
-        if atr_s[i] > 0:
-            plus_di[i] = 100*plus_dm_s[i]/atr_s[i]; minus_di[i] = 100*minus_dm_s[i]/atr_s[i]
-    dx = np.zeros(n)
-    for i in range(period, n):
-        di_sum = plus_di[i]+minus_di[i]
-        if di_sum > 0: dx[i] = 100*abs(plus_di[i]-minus_di[i])/di_sum
-    adx = np.zeros(n); start = period*2
-    if start < n:
-        adx[start] = np.mean(dx[period+1:start+1])
-        for i in range(start+1, n): adx[i] = (adx[i-1]*(period-1)+dx[i])/period
-    return adx, plus_di, minus_di
-
-
-def map_htf_to_ltf(df_ltf, htf_timestamps, htf_values):
-    """Map higher timeframe values to lower timeframe bars"""
-    result = np.full(len(df_ltf), np.nan)
-    htf_ts = pd.DatetimeIndex(htf_timestamps)
-    ltf_ts = pd.DatetimeIndex(df_ltf['timestamp'])
-
-    htf_idx = 0
-    for i in range(len(df_ltf)):
-        # Find the most recent HTF bar that closed before/at this LTF bar
-        while htf_idx < len(htf_ts) - 1 and htf_ts[htf_idx + 1] <= ltf_ts[i]:
-            htf_idx += 1
-        if htf_ts[htf_idx] <= ltf_ts[i]:
-            result[i] = htf_values[htf_idx]
-    return result
-
-
 def generate_signals_mtf(df_ltf, df_htf_list, filter_config,
                           atr_period=10, multiplier=3.0, ema_fast=20, ema_slow=50,
-                          adx_period=14, adx_threshold=None):
+                          adx_period=14, adx_threshold=None, frames=None):
     """
     Generate signals with multi-timeframe EMA filter.
 
-    filter_config: dict with keys:
-        'type': 'direction' or 'trend_align' or 'dual_ema' or 'none'
-        'htf_df': higher TF dataframe
+    filter_config: htf_filters.HTFFilter, or dict with keys:
+        'type': 'direction' or 'trend_align' or 'dual_ema' or 'triple_ema' or
+                'and' / 'or' (sub-configs under 'filters') or 'none'
+        'htf_df': higher TF dataframe (or 'htf': name in frames)
         'ema_period': EMA period on HTF
         'ema_period2': second EMA period (for dual_ema)
         'slope_bars': bars to check slope (for trend_align)
+        'align': 'close' (default, HTF bar usable once it has closed) or
+                 'open' (legacy, leaks the HTF bar's close into its own period)
+        'lag': extra confirmation delay after the HTF close, e.g. '5min'
     """
     c = df_ltf['close'].values.astype(float)
-    n = len(c)
-    trend, up, dn, st_buy, st_sell, atr = calc_supertrend(df_ltf, atr_period, multiplier)
-    ema_f = calc_ema(c, ema_fast)
-    ema_s = calc_ema(c, ema_slow)
-    adx_values, _, _ = calc_adx(df_ltf, adx_period)
-
-    # Calculate HTF EMA filter
-    filter_type = filter_config.get('type', 'none')
-    htf_long_ok = np.ones(n, dtype=bool)
-    htf_short_ok = np.ones(n, dtype=bool)
-
-    if filter_type != 'none':
-        htf_df = filter_config['htf_df']
-        htf_close = htf_df['close'].values.astype(float)
-
-        if filter_type == 'direction':
-            # Price above HTF EMA = long only, below = short only
-            ema_p = filter_config['ema_period']
-            htf_ema = calc_ema(htf_close, ema_p)
-            # Map to LTF
-            ltf_htf_ema = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema)
-            ltf_htf_close = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_close)
-
-            for i in range(n):
-                if np.isnan(ltf_htf_ema[i]) or np.isnan(ltf_htf_close[i]):
-                    htf_long_ok[i] = False
-                    htf_short_ok[i] = False
-                else:
-                    htf_long_ok[i] = ltf_htf_close[i] > ltf_htf_ema[i]
-                    htf_short_ok[i] = ltf_htf_close[i] < ltf_htf_ema[i]
-
-        elif filter_type == 'trend_align':
-            # Price above HTF EMA + EMA slope is up = long, opposite = short
-            ema_p = filter_config['ema_period']
-            slope_bars = filter_config.get('slope_bars', 5)
-            htf_ema = calc_ema(htf_close, ema_p)
-            ltf_htf_ema = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema)
-            ltf_htf_close = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_close)
-
-            # Also need lagged EMA for slope
-            htf_ema_lagged = np.roll(htf_ema, slope_bars)
-            htf_ema_lagged[:slope_bars] = np.nan
-            ltf_htf_ema_lag = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema_lagged)
-
-            for i in range(n):
-                if np.isnan(ltf_htf_ema[i]) or np.isnan(ltf_htf_close[i]) or np.isnan(ltf_htf_ema_lag[i]):
-                    htf_long_ok[i] = False
-                    htf_short_ok[i] = False
-                else:
-                    ema_rising = ltf_htf_ema[i] > ltf_htf_ema_lag[i]
-                    ema_falling = ltf_htf_ema[i] < ltf_htf_ema_lag[i]
-                    price_above = ltf_htf_close[i] > ltf_htf_ema[i]
-                    price_below = ltf_htf_close[i] < ltf_htf_ema[i]
-                    htf_long_ok[i] = price_above and ema_rising
-                    htf_short_ok[i] = price_below and ema_falling
-
-        elif filter_type == 'dual_ema':
-            # HTF EMA fast > EMA slow = long, opposite = short (Golden/Dead cross)
-            ema_p1 = filter_config['ema_period']   # fast (e.g., 50)
-            ema_p2 = filter_config['ema_period2']   # slow (e.g., 200)
-            htf_ema1 = calc_ema(htf_close, ema_p1)
-            htf_ema2 = calc_ema(htf_close, ema_p2)
-            ltf_htf_ema1 = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema1)
-            ltf_htf_ema2 = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema2)
-            ltf_htf_close = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_close)
-
-            for i in range(n):
-                if np.isnan(ltf_htf_ema1[i]) or np.isnan(ltf_htf_ema2[i]):
-                    htf_long_ok[i] = False
-                    htf_short_ok[i] = False
-                else:
-                    htf_long_ok[i] = ltf_htf_ema1[i] > ltf_htf_ema2[i]  # golden cross state
-                    htf_short_ok[i] = ltf_htf_ema1[i] < ltf_htf_ema2[i]  # dead cross state
-
-        elif filter_type == 'triple_ema':
-            # Price > EMA50 > EMA100 > EMA200 = strong uptrend (long only)
-            # Price < EMA50 < EMA100 < EMA200 = strong downtrend (short only)
-            htf_ema50 = calc_ema(htf_close, 50)
-            htf_ema100 = calc_ema(htf_close, 100)
-            htf_ema200 = calc_ema(htf_close, 200)
-            ltf_50 = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema50)
-            ltf_100 = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema100)
-            ltf_200 = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_ema200)
-            ltf_c = map_htf_to_ltf(df_ltf, htf_df['timestamp'], htf_close)
-
-            for i in range(n):
-                if np.isnan(ltf_50[i]) or np.isnan(ltf_200[i]) or np.isnan(ltf_c[i]):
-                    htf_long_ok[i] = False
-                    htf_short_ok[i] = False
-                else:
-                    # Relaxed: price above EMA200 = long ok
-                    htf_long_ok[i] = ltf_c[i] > ltf_200[i]
-                    htf_short_ok[i] = ltf_c[i] < ltf_200[i]
-
-    signals = []
+    trend, up, dn, st_buy, st_sell, atr = indicator(df_ltf, 'supertrend', atr_period, multiplier)
+    ema_f, ema_s = emas(df_ltf, ema_fast, ema_slow)
+    adx_values, _, _ = indicator(df_ltf, 'adx', adx_period)
+
+    # HTF filter masks (NumPy, cached per HTF frame + params)
+    if isinstance(filter_config, HTFFilter):
+        flt, align, lag = filter_config, 'close', None
+    else:
+        flt = filter_from_config(filter_config, frames)
+        align, lag = filter_config.get('align', 'close'), filter_config.get('lag')
+    htf_long_ok, htf_short_ok = flt.masks(df_ltf, align, lag)
+
+    adx_ok = ~(adx_values < adx_threshold) if adx_threshold is not None else True
+    long_mask = st_buy & (ema_f > ema_s) & adx_ok & htf_long_ok
+    short_mask = st_sell & (ema_f < ema_s) & adx_ok & htf_short_ok
     start_bar = max(ema_slow, atr_period, adx_period*2) + 1
-    for i in range(start_bar, n):
-        if st_buy[i] and ema_f[i] > ema_s[i]:
-            if adx_threshold is not None and adx_values[i] < adx_threshold: continue
-            if not htf_long_ok[i]: continue
-            signals.append({'bar':i,'direction':'LONG','price':c[i],'atr':atr[i],
-                           'adx':adx_values[i],'timestamp':df_ltf['timestamp'].iloc[i]})
-        elif st_sell[i] and ema_f[i] < ema_s[i]:
-            if adx_threshold is not None and adx_values[i] < adx_threshold: continue
-            if not htf_short_ok[i]: continue
-            signals.append({'bar':i,'direction':'SHORT','price':c[i],'atr':atr[i],
-                           'adx':adx_values[i],'timestamp':df_ltf['timestamp'].iloc[i]})
+    signals = build_signals(long_mask, short_mask, start_bar, c, atr, adx=adx_values)
     return signals, atr
 
 
-def backtest_fixed(df, signals, sl_m=2.0, tp_m=6.0, fee=0.0006, max_hold=60, risk=0.02):
-    c = df['close'].values.astype(float)
-    h = df['high'].values.astype(float)
-    l = df['low'].values.astype(float)
-    n = len(c)
-    trades = []; equity = 10000.0
-    eq_curve = [{'bar':0,'equity':equity,'timestamp':df['timestamp'].iloc[0]}]
-    i = 0
-    while i < len(signals):
-        sig = signals[i]; eb=sig['bar']; ep=sig['price']; d=sig['direction']; a=sig['atr']
-        if np.isnan(a) or a<=0: i+=1; continue
-        sl = ep-a*sl_m if d=='LONG' else ep+a*sl_m
-        tp = ep+a*tp_m if d=='LONG' else ep-a*tp_m
-        rk = abs(ep-sl)
-        if rk<=0 or rk/ep>0.05: i+=1; continue
-        ps = (equity*risk)/rk; ec = ep*ps*fee
-        xb=xp=xr=None
-        for bar in range(eb+1, min(eb+max_hold, n)):
-            if d=='LONG':
-                if l[bar]<=sl: xb,xp,xr=bar,sl,'SL'; break
-                if h[bar]>=tp: xb,xp,xr=bar,tp,'TP'; break
-            else:
-                if h[bar]>=sl: xb,xp,xr=bar,sl,'SL'; break
-                if l[bar]<=tp: xb,xp,xr=bar,tp,'TP'; break
-        if xb is None: xb=min(eb+max_hold-1,n-1); xp=c[xb]; xr='TIME'
-        xc = xp*ps*fee
-        pnl = ((xp-ep) if d=='LONG' else (ep-xp))*ps - ec - xc
-        equity += pnl
-        if equity<=0: equity=0
-        eq_curve.append({'bar':xb,'equity':equity,'timestamp':df['timestamp'].iloc[min(xb,n-1)]})
-        trades.append({'entry_time':sig['timestamp'],'exit_time':df['timestamp'].iloc[min(xb,n-1)],
-                       'direction':d,'entry_price':ep,'exit_price':xp,'pnl':pnl,
-                       'exit_reason':xr,'hold_bars':xb-eb,'adx_at_entry':sig.get('adx',0)})
-        if equity<=0: break
-        while i+1<len(signals) and signals[i+1]['bar']<=xb: i+=1
-        i+=1
-    return trades, eq_curve, equity
-
-
-def analyze(trades, label=""):
-    if not trades: return {}
-    df_t = pd.DataFrame(trades)
-    total = len(df_t)
-    wins = df_t[df_t['pnl']>0]; losses = df_t[df_t['pnl']<=0]
-    longs = df_t[df_t['direction']=='LONG']; shorts = df_t[df_t['direction']=='SHORT']
-    wr = len(wins)/total*100
-    pf = wins['pnl'].sum()/abs(losses['pnl'].sum()) if len(losses)>0 and losses['pnl'].sum()!=0 else 999
-    tp_val = df_t['pnl'].sum()
-    mdd=0; pk=10000; run=10000
-    for p in df_t['pnl']:
-        run+=p
-        if run>pk: pk=run
-        dd=(pk-run)/pk*100 if pk>0 else 0
-        if dd>mdd: mdd=dd
-    lwr = len(longs[longs['pnl']>0])/len(longs)*100 if len(longs)>0 else 0
-    swr = len(shorts[shorts['pnl']>0])/len(shorts)*100 if len(shorts)>0 else 0
-    mc=0; cc=0
-    for p in df_t['pnl']:
-        if p<=0: cc+=1; mc=max(mc,cc)
-        else: cc=0
-    aw = wins['pnl'].mean() if len(wins)>0 else 0
-    al = abs(losses['pnl'].mean()) if len(losses)>0 else 0
-
-    # yearly breakdown
-    df_t['year'] = pd.to_datetime(df_t['entry_time']).dt.year
-    yearly = {}
-    for yr, grp in df_t.groupby('year'):
-        yr_wins = grp[grp['pnl']>0]
-        yr_losses = grp[grp['pnl']<=0]
-        yr_pf = yr_wins['pnl'].sum()/abs(yr_losses['pnl'].sum()) if len(yr_losses)>0 and yr_losses['pnl'].sum()!=0 else 999
-        yearly[yr] = {
-            'trades': len(grp),
-            'wr': len(yr_wins)/len(grp)*100 if len(grp)>0 else 0,
-            'pf': yr_pf,
-            'pnl': grp['pnl'].sum(),
-            'longs': len(grp[grp['direction']=='LONG']),
-            'shorts': len(grp[grp['direction']=='SHORT']),
-        }
-
-    return {'label':label,'total':total,'wr':wr,'lc':len(longs),'sc':len(shorts),
-            'lwr':lwr,'swr':swr,'pf':pf,'pnl':tp_val,'eq':10000+tp_val,'mdd':mdd,
-            'ah':df_t['hold_bars'].mean(),'max_consec_loss':mc,
-            'aw':aw,'al':al,'avg_adx':df_t['adx_at_entry'].mean(),
-            'yearly': yearly}
+def backtest_fixed(df, signals, sl_m=2.0, tp_m=6.0, fee=0.0006, max_hold=60, risk=0.02, intrabar=None):
+    trades, equity = run_backtest(df, signals, 'atr', sl_m, tp_m, fee=fee,
+                                  max_hold=max_hold, risk=risk, max_risk=0.05, intrabar=intrabar)
+    return trades, equity_curve(df, trades), equity
+
+
+def analyze(df, trades, signals, label=""):
+    return summarize(df, trades, label, signals=signals, yearly=True)
+
+
+def config_signals(frames, cfg):
+    entry_df = frames[cfg['entry_tf']]
+    sigs, _ = generate_signals_mtf(
+        entry_df, None, cfg['filter'],
+        atr_period=10, multiplier=3.0, ema_fast=20, ema_slow=50,
+        adx_period=14, adx_threshold=cfg['adx_threshold'], frames=frames
+    )
+    return entry_df, sigs
+
+
+def config_exits(cfg):
+    """(exit mode, sl, tp, max_risk) a config is backtested with"""
+    return 'atr', cfg.get('sl_m', 1.5), cfg.get('tp_m', 6.0), 0.05
+
+
+def run_config(frames, cfg):
+    """Sweep task: one entry TF x ADX x HTF filter (x SL/TP) config -> (signal count, stats, equity curve, trades)"""
+    entry_df, sigs = config_signals(frames, cfg)
+    trades, eq, _ = backtest_fixed(entry_df, sigs,
+                                   sl_m=cfg.get('sl_m', 1.5), tp_m=cfg.get('tp_m', 6.0),
+                                   max_hold=cfg['max_hold'], risk=0.02, intrabar=frames.get('M5'))
+    return len(sigs), analyze(entry_df, trades, sigs, cfg['label']), eq, trades
+
+
+def risk_scaling(frames, cfg, risks):
+    """One config re-simulated at every risk fraction in one engine pass -> batch_metrics dict"""
+    entry_df, sigs = config_signals(frames, cfg)
+    mode, sl, tp, max_risk = config_exits(cfg)
+    trade_sets, _ = run_backtest_risks(entry_df, sigs, risks, mode, sl, tp,
+                                       max_hold=cfg['max_hold'], max_risk=max_risk, intrabar=frames.get('M5'))
+    return batch_metrics(trade_sets)
 
 
 def print_yearly(s):
@@ -393,19 +174,18 @@ def main():
     print("Goal: Filter out counter-trend trades using higher TF EMAs")
     print("=" * 140)
 
-    df_m5 = pd.read_csv(DATA_M5)
-    df_m5['timestamp'] = pd.to_datetime(df_m5['timestamp'])
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     # ============================================================
     # Resample all needed timeframes
     # ============================================================
     print("\n[Phase 1] Resampling timeframes...")
+    persist_to(indicator_dir(DATA_M5))
 
-    df_90m = resample_ohlcv(df_m5, '90min')
-    df_2h = resample_ohlcv(df_m5, '2h')
-    df_4h = resample_ohlcv(df_m5, '4h')
-    df_1d = resample_ohlcv(df_m5, '1D')
+    df_90m = load_resampled(DATA_M5, '90min')
+    df_2h = load_resampled(DATA_M5, '2h')
+    df_4h = load_resampled(DATA_M5, '4h')
+    df_1d = load_resampled(DATA_M5, '1D')
 
     # Full period (use all available data, no filtering)
     print(f"  90min: {len(df_90m):,} bars")
@@ -422,14 +202,14 @@ def main():
     configs = []
 
     # For each entry TF (1.5H, 2H)
-    for entry_tf_name, entry_df, max_hold in [('1.5H', df_90m, 80), ('2H', df_2h, 60)]:
+    for entry_tf_name, max_hold in [('1.5H', 80), ('2H', 60)]:
         for adx_th in [None, 20]:
             adx_label = f"ADX>{adx_th}" if adx_th else "NoADX"
 
             # Baseline: no HTF filter
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} NoFilter",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
                 'filter': {'type': 'none'}
             })
@@ -437,78 +217,78 @@ def main():
             # HTF Filter: Daily EMA200 direction
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} D-EMA200",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'direction', 'htf_df': df_1d, 'ema_period': 200}
+                'filter': {'type': 'direction', 'htf': '1D', 'ema_period': 200}
             })
 
             # HTF Filter: Daily EMA50 direction
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} D-EMA50",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'direction', 'htf_df': df_1d, 'ema_period': 50}
+                'filter': {'type': 'direction', 'htf': '1D', 'ema_period': 50}
             })
 
             # HTF Filter: 4H EMA200 direction
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} 4H-EMA200",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'direction', 'htf_df': df_4h, 'ema_period': 200}
+                'filter': {'type': 'direction', 'htf': '4H', 'ema_period': 200}
             })
 
             # HTF Filter: 4H EMA100 direction
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} 4H-EMA100",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'direction', 'htf_df': df_4h, 'ema_period': 100}
+                'filter': {'type': 'direction', 'htf': '4H', 'ema_period': 100}
             })
 
             # HTF Filter: Daily EMA200 + slope (trend alignment)
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} D-EMA200+slope",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'trend_align', 'htf_df': df_1d, 'ema_period': 200, 'slope_bars': 5}
+                'filter': {'type': 'trend_align', 'htf': '1D', 'ema_period': 200, 'slope_bars': 5}
             })
 
             # HTF Filter: Daily EMA50/200 dual (Golden/Dead cross)
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} D-GoldenCross",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'dual_ema', 'htf_df': df_1d, 'ema_period': 50, 'ema_period2': 200}
+                'filter': {'type': 'dual_ema', 'htf': '1D', 'ema_period': 50, 'ema_period2': 200}
             })
 
             # HTF Filter: 4H EMA50/200 dual
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} 4H-GoldenCross",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'dual_ema', 'htf_df': df_4h, 'ema_period': 50, 'ema_period2': 200}
+                'filter': {'type': 'dual_ema', 'htf': '4H', 'ema_period': 50, 'ema_period2': 200}
             })
 
             # HTF Filter: Daily triple EMA (50/100/200) - relaxed version
             configs.append({
                 'label': f"{entry_tf_name} {adx_label} D-TripleEMA",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': adx_th,
-                'filter': {'type': 'triple_ema', 'htf_df': df_1d}
+                'filter': {'type': 'triple_ema', 'htf': '1D'}
             })
 
     # SL/TP variations for best filters
     for sl_m, tp_m, rr_label in [(1.5, 6.0, "SL1.5/TP6"), (2.0, 6.0, "SL2/TP6"),
                                    (1.5, 7.5, "SL1.5/TP7.5"), (2.0, 8.0, "SL2/TP8")]:
-        for entry_tf_name, entry_df, max_hold in [('1.5H', df_90m, 80), ('2H', df_2h, 60)]:
+        for entry_tf_name, max_hold in [('1.5H', 80), ('2H', 60)]:
             # Only test with Daily EMA200 (most likely winner) + ADX>20
             configs.append({
                 'label': f"{entry_tf_name} ADX>20 D-EMA200 {rr_label}",
-                'entry_df': entry_df, 'max_hold': max_hold,
+                'entry_tf': entry_tf_name, 'max_hold': max_hold,
                 'adx_threshold': 20,
                 'sl_m': sl_m, 'tp_m': tp_m,
-                'filter': {'type': 'direction', 'htf_df': df_1d, 'ema_period': 200}
+                'filter': {'type': 'direction', 'htf': '1D', 'ema_period': 200}
             })
 
     print(f"  Total configs: {len(configs)}\n")
@@ -518,34 +298,24 @@ def main():
     # ============================================================
     all_results = []
     all_eq = {}
+    all_cfg = {}
 
     header = f"  {'#':>3s} {'Strategy':<48s} {'Sigs':>4s} {'Trds':>4s} {'WR%':>5s} {'PF':>6s} {'P&L':>10s} {'MDD%':>6s} {'Strk':>4s} {'L':>3s} {'S':>3s}"
     print(header)
     print("  " + "-" * 110)
 
-    for idx, cfg in enumerate(configs):
-        sl_m = cfg.get('sl_m', 1.5)
-        tp_m = cfg.get('tp_m', 6.0)
-
-        sigs, _ = generate_signals_mtf(
-            cfg['entry_df'], None, cfg['filter'],
-            atr_period=10, multiplier=3.0, ema_fast=20, ema_slow=50,
-            adx_period=14, adx_threshold=cfg['adx_threshold']
-        )
-
-        trades, eq, _ = backtest_fixed(cfg['entry_df'], sigs,
-                                        sl_m=sl_m, tp_m=tp_m,
-                                        max_hold=cfg['max_hold'], risk=0.02)
-        s = analyze(trades, cfg['label'])
-
+    # M5 source bars settle exits where one bar touches both SL and TP
+    frames = {'1.5H': df_90m, '2H': df_2h, '4H': df_4h, '1D': df_1d, 'M5': load_m5(DATA_M5)}
+    for idx, cfg, (n_sigs, s, eq, _) in cached_sweep(run_config, configs, frames, 'supertrend_mtf'):
         if s:
             all_results.append(s)
             all_eq[cfg['label']] = eq
+            all_cfg[cfg['label']] = cfg
             pf_str = f"{s['pf']:>5.2f}" if s['pf'] < 100 else "   INF"
-            print(f"  {idx+1:>3d} {s['label']:<48s} {len(sigs):>4d} {s['total']:>4d} {s['wr']:>4.1f}% {pf_str} "
+            print(f"  {idx+1:>3d} {s['label']:<48s} {n_sigs:>4d} {s['total']:>4d} {s['wr']:>4.1f}% {pf_str} "
                   f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d} {s['lc']:>3d} {s['sc']:>3d}")
         else:
-            print(f"  {idx+1:>3d} {cfg['label']:<48s} {len(sigs):>4d}  -> No trades")
+            print(f"  {idx+1:>3d} {cfg['label']:<48s} {n_sigs:>4d}  -> No trades")
 
     # ============================================================
     # Rankings
@@ -568,6 +338,15 @@ def main():
         if all_profitable:
             print(f"     *** ALL YEARS PROFITABLE ***")
 
+    # --- Rank by risk-adjusted return (bar-level equity, compounding) ---
+    print("\n--- TOP 15 BY SHARPE (mark-to-market per-bar returns, annualised) ---")
+    print(f"  {'#':>3s} {'Strategy':<48s} {'Sharpe':>6s} {'Sortino':>7s} {'Calmar':>6s} {'CAGR%':>6s} {'BarDD%':>6s} {'Ulcer':>5s} {'Expo%':>5s}")
+    print("  " + "-" * 104)
+    by_sharpe = sorted(valid, key=lambda x: x['sharpe'], reverse=True)
+    for i, s in enumerate(by_sharpe[:15], 1):
+        print(f"  {i:>3d} {s['label']:<48s} {s['sharpe']:>6.2f} {s['sortino']:>7.2f} {s['calmar']:>6.2f} "
+              f"{s['cagr']:>5.1f}% {s['bar_mdd']:>5.1f}% {s['ulcer']:>5.1f} {s['exposure']:>4.1f}%")
+
     # --- Rank by consistency (all years profitable) ---
     print("\n\n--- STRATEGIES WITH ALL YEARS PROFITABLE ---")
     consistent = []
@@ -611,19 +390,19 @@ def main():
     print("PHASE 4: RISK SCALING FOR BEST STRATEGIES")
     print("=" * 140)
 
+    # exact compounding per risk (one engine pass per strategy), not the 2% result scaled
+    risk_pcts = [2, 3, 5]
     best = by_pnl[:5] if by_pnl else []
     for s in best:
-        monthly_base = s['pnl'] / 48
+        m = risk_scaling(frames, all_cfg[s['label']], [r / 100 for r in risk_pcts])
         print(f"\n  {s['label']}")
         print(f"  {'Risk%':>8s} {'Monthly$':>10s} {'Annual$':>10s} {'Annual%':>8s} {'MDD':>7s}")
         print(f"  {'-'*50}")
-        for risk_pct in [2, 3, 5]:
-            mult = risk_pct / 2.0
-            mo = monthly_base * mult
+        for j, risk_pct in enumerate(risk_pcts):
+            mo = m['pnl'][j] / 48
             annual = mo * 12
             annual_pct = annual / 10000 * 100
-            mdd = s['mdd'] * mult
-            print(f"  {risk_pct:>7d}% ${mo:>9.0f} ${annual:>9.0f} {annual_pct:>7.1f}% {mdd:>6.1f}%")
+            print(f"  {risk_pct:>7d}% ${mo:>9.0f} ${annual:>9.0f} {annual_pct:>7.1f}% {m['mdd'][j]:>6.1f}%")
 
     # ============================================================
     # Charts
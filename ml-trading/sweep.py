@@ -0,0 +1,106 @@
+"""
+Parallel Parameter Sweep Runner
+===============================
+Fans a declarative parameter grid out over a process pool.
+
+  - grid: list of param dicts (param_grid() builds the cartesian product)
+  - frames: {name: OHLCV DataFrame}; the arrays are copied once into
+    multiprocessing shared memory and every worker maps them back as
+    zero-copy DataFrames (nothing is pickled per task)
+  - task: top-level function task(frames, params) -> result
+  - results stream back as they finish; ordered=True (default) yields them
+    in grid order, ordered=False in completion order
+
+workers=1 runs everything in-process (no pool), handy for debugging.
+
+Usage:
+  grid = param_grid(tf=['1H', '2H'], adx=[None, 20], sl_tp=[(1.5, 6.0), (2.0, 6.0)])
+  for idx, params, result in run_sweep(run_config, grid, {'1H': df_1h, '2H': df_2h}):
+      ...
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+FRAME_COLS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+_worker_frames = None
+_worker_shm = []
+
+
+def param_grid(**axes):
+    """Cartesian product of the axes, in the given key/value order."""
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*axes.values())]
+
+
+def _share_frames(frames):
+    blocks, specs = [], []
+    for name, df in frames.items():
+        n = len(df)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(FRAME_COLS) * n * 8))
+        buf = np.ndarray((len(FRAME_COLS), n), dtype=np.float64, buffer=shm.buf)
+        buf[0].view(np.int64)[:] = df['timestamp'].values.astype('datetime64[ns]').view('int64')
+        for k, col in enumerate(FRAME_COLS[1:], 1):
+            buf[k] = df[col].values.astype(float)
+        blocks.append(shm)
+        specs.append((name, shm.name, n))
+    return blocks, specs
+
+
+def _attach_frames(specs):
+    frames, handles = {}, []
+    for name, shm_name, n in specs:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        handles.append(shm)
+        buf = np.ndarray((len(FRAME_COLS), n), dtype=np.float64, buffer=shm.buf)
+        data = {'timestamp': buf[0].view(np.int64).view('datetime64[ns]')}
+        for k, col in enumerate(FRAME_COLS[1:], 1):
+            data[col] = buf[k]
+        frames[name] = pd.DataFrame(data, copy=False)
+    return frames, handles
+
+
+def _init_worker(specs):
+    global _worker_frames, _worker_shm
+    _worker_frames, _worker_shm = _attach_frames(specs)
+
+
+def _run_task(task, idx, params):
+    return idx, task(_worker_frames, params)
+
+
+def run_sweep(task, grid, frames, workers=None, ordered=True):
+    """Yields (index, params, result) for every grid cell; see module docstring."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(grid) <= 1:
+        for idx, params in enumerate(grid):
+            yield idx, params, task(frames, params)
+        return
+
+    blocks, specs = _share_frames(frames)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(grid)),
+                                 initializer=_init_worker, initargs=(specs,)) as pool:
+            futures = [pool.submit(_run_task, task, idx, params) for idx, params in enumerate(grid)]
+            pending = {}
+            next_idx = 0
+            for fut in as_completed(futures):
+                idx, result = fut.result()
+                if not ordered:
+                    yield idx, grid[idx], result
+                    continue
+                pending[idx] = result
+                while next_idx in pending:
+                    yield next_idx, grid[next_idx], pending.pop(next_idx)
+                    next_idx += 1
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,250 @@
+"""
+Declarative Sweep CLI
+=====================
+Runs a parameter sweep described in a YAML / TOML / JSON spec file instead of
+the grids hard-coded in each script's main():
+
+  python ml-trading/sweep_cli.py sweep ml-trading/sweeps/freq_optimize.toml
+  python ml-trading/sweep_cli.py sweep spec.yaml --no-charts --workers 8
+  python ml-trading/sweep_cli.py walkforward ml-trading/sweeps/walk_forward_freq.toml
+
+Spec keys:
+  strategy       supertrend | supertrend_mtf | alpha_trend
+  data           M5 csv path (default: data/BTCUSDT_M5.csv next to this file)
+  start, end     optional date range applied to the resampled bars
+  timeframes     {name: {freq, max_hold}}  entry timeframes
+  htf_timeframes {name: {freq}}            extra frames referenced by MTF filters ('htf': name)
+  grid           {axis: [values]}  adx_threshold / filter / keyvalue / ema_period
+  exits          {mode: atr | pct, sl_tp: [[sl, tp], ...]}  (supertrend / supertrend_mtf: atr only)
+  intrabar       settle bars touching both SL and TP from the M5 rows (default true)
+  charts         true/false (overridden by --no-charts)
+  walk_forward   {train, test, step, anchored, objective, min_trades} for the
+                 walkforward command (see walk_forward.py); windows follow the
+                 first entry timeframe
+
+Cells already in the result store (same data, strategy, params and code
+version) are not re-simulated, so growing a grid only costs the new cells.
+Indicator series are persisted next to the data cache (indicator_cache.persist_to),
+so after appending M5 rows they only step over the new bars.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import matplotlib
+matplotlib.use('Agg')
+
+from data_store import indicator_dir, load_m5, load_resampled
+from indicator_cache import persist_to
+from result_store import (CORE_MODULES, ResultStore, cached_sweep, code_version,
+                          frames_fingerprint, result_key)
+from sweep import param_grid
+from walk_forward import print_report, walk_forward, windows
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_M5 = os.path.join(HERE, 'data', 'BTCUSDT_M5.csv')
+OUTPUT_DIR = os.path.join(HERE, 'backtest_results')
+
+
+def load_spec(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("YAML specs need PyYAML (pip install pyyaml); or use a .toml/.json spec")
+        with open(path) as f:
+            return yaml.safe_load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def _none(v):
+    # TOML has no null: "none" / "" stand for "no threshold"
+    return None if v in ('none', 'None', '') else v
+
+
+def _filter_label(flt):
+    if not flt or flt.get('type', 'none') == 'none':
+        return 'NoFilter'
+    if 'label' in flt:
+        return flt['label']
+    periods = '/'.join(str(flt[k]) for k in ('ema_period', 'ema_period2') if k in flt)
+    return f"{flt.get('htf', '')}-{flt['type']}{periods}"
+
+
+def _supertrend_cfg(cell):
+    adx = _none(cell.get('adx_threshold'))
+    return {'tf': cell['tf'], 'max_hold': cell['max_hold'], 'adx_threshold': adx,
+            'sl_m': cell['sl'], 'tp_m': cell['tp'], 'exit_grid': cell['exit_grid']}
+
+
+def _supertrend_mtf_cfg(cell):
+    cfg = _supertrend_cfg(cell)
+    cfg['entry_tf'] = cfg.pop('tf')
+    del cfg['exit_grid']  # run_config resolves each cell's exits on its own
+    cfg['filter'] = {k: v for k, v in (cell.get('filter') or {'type': 'none'}).items() if k != 'label'}
+    return cfg
+
+
+def _alpha_trend_cfg(cell):
+    cfg = {'tf': cell['tf'], 'max_hold': cell['max_hold'],
+           'keyvalue': cell.get('keyvalue', 50.0), 'ema_period': cell.get('ema_period', 1000),
+           'mode': cell['mode'], 'sl': cell['sl'], 'tp': cell['tp'], 'exit_grid': cell['exit_grid']}
+    if 'keyvalues' in cell:
+        cfg['keyvalues'] = cell['keyvalues']
+    return cfg
+
+
+# strategy -> (module with run_config/plot function, plot function name, cell -> run_config cfg,
+#              supported exit modes)
+STRATEGIES = {
+    'supertrend': ('supertrend_ema_freq_optimize', 'plot_equity', _supertrend_cfg, ('atr',)),
+    'supertrend_mtf': ('supertrend_mtf_ema', 'plot_results', _supertrend_mtf_cfg, ('atr',)),
+    'alpha_trend': ('alpha_trend_master', 'plot_equity', _alpha_trend_cfg, ('atr', 'pct')),
+}
+
+
+def build_cells(spec):
+    """
+    Spec -> list of generic cells (tf, max_hold, grid axes..., mode, sl, tp, label).
+    Like the scripts' grids, every cell carries its sibling SL/TP pairs (exit_grid: one
+    outcome pass per signal set) and the keyvalue axis (keyvalues: one trailing-stop pass).
+    """
+    exits = spec.get('exits', {})
+    mode = exits.get('mode', 'atr')
+    sl_tp = [tuple(x) for x in exits.get('sl_tp', [[1.5, 6.0]])]
+    axes = spec.get('grid', {})
+    batch = {'exit_grid': sl_tp}
+    if 'keyvalue' in axes:
+        batch['keyvalues'] = tuple(axes['keyvalue'])
+    cells = []
+    for tf_name, tf in spec['timeframes'].items():
+        for combo in param_grid(**axes) if axes else [{}]:
+            for sl, tp in sl_tp:
+                cell = {'tf': tf_name, 'max_hold': tf['max_hold'], **combo,
+                        'mode': mode, 'sl': sl, 'tp': tp, **batch}
+                parts = [tf_name]
+                for k, v in combo.items():
+                    parts.append(_filter_label(v) if k == 'filter' else f"{k}={_none(v)}")
+                parts.append(f"SL{sl}/TP{tp}")
+                cell['label'] = ' '.join(parts)
+                cells.append(cell)
+    return cells
+
+
+def _strategy(spec):
+    strategy = spec['strategy']
+    if strategy not in STRATEGIES:
+        sys.exit(f"unknown strategy '{strategy}' (choose from {', '.join(STRATEGIES)})")
+    mod_name, plot_name, to_cfg, modes = STRATEGIES[strategy]
+    mode = spec.get('exits', {}).get('mode', 'atr')
+    if mode not in modes:
+        sys.exit(f"exits.mode '{mode}' is not supported by {strategy} (choose from {', '.join(modes)})")
+    return strategy, mod_name, __import__(mod_name), plot_name, to_cfg
+
+
+def load_frames(spec):
+    """Resampled frames of the spec's timeframes (+ 'M5' for intrabar exits)."""
+    data = spec.get('data', DATA_M5)
+    if not os.path.isabs(data):
+        data = os.path.join(HERE, data)
+    start, end = spec.get('start'), spec.get('end')
+
+    persist_to(indicator_dir(data))
+    frames = {}
+    for name, tf in {**spec.get('htf_timeframes', {}), **spec['timeframes']}.items():
+        frames[name] = load_resampled(data, tf['freq'], start=start, end=end)
+        print(f"  {name}: {len(frames[name]):,} bars")
+    if spec.get('intrabar', True):
+        frames['M5'] = load_m5(data)
+    return frames
+
+
+def run_spec(spec, workers=None, charts=True, top=15):
+    strategy, mod_name, module, plot_name, to_cfg = _strategy(spec)
+    frames = load_frames(spec)
+
+    cells = build_cells(spec)
+    grid = [{**to_cfg(cell), 'label': cell['label']} for cell in cells]
+    store = ResultStore()
+    data_fp = frames_fingerprint(frames)
+    version = code_version(CORE_MODULES + (mod_name,))
+    n_cached = sum(store.get(result_key(data_fp, strategy, cfg, version)) is not None for cfg in grid)
+    print(f"\n  {len(cells)} configs: {n_cached} cached, {len(cells) - n_cached} to run\n")
+    results = [r for _, _, r in cached_sweep(module.run_config, grid, frames, strategy,
+                                             workers=workers, store=store)]
+    store.close()
+
+    header = f"  {'Strategy':<55s} {'Sigs':>4s} {'Trds':>4s} {'WR%':>5s} {'PF':>6s} {'P&L':>10s} {'MDD%':>6s} {'Strk':>4s}"
+    print(header)
+    print("  " + "-" * 100)
+    ranked = []
+    for cell, (n_sigs, s, eq, _) in zip(cells, results):
+        if not s:
+            print(f"  {cell['label']:<55s} {n_sigs:>4d}  -> No trades"); continue
+        ranked.append((s, eq))
+        pf_str = f"{s['pf']:>5.2f}" if s['pf'] < 100 else "   INF"
+        print(f"  {cell['label']:<55s} {n_sigs:>4d} {s['total']:>4d} {s['wr']:>4.1f}% {pf_str} "
+              f"${s['pnl']:>9,.0f} {s['mdd']:>5.1f}% {s['max_consec_loss']:>4d}")
+
+    ranked.sort(key=lambda x: x[0]['pnl'], reverse=True)
+    print(f"\n  --- TOP {top} BY P&L ---")
+    for i, (s, _) in enumerate(ranked[:top], 1):
+        print(f"  {i:>3d} {s['label']:<55s} PF:{s['pf']:.2f}  P&L:${s['pnl']:,.0f}  MDD:{s['mdd']:.1f}%")
+
+    if charts and ranked:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        name = os.path.splitext(os.path.basename(spec.get('_path', strategy)))[0]
+        plot = getattr(module, plot_name)
+        fpath = plot({s['label']: eq for s, eq in ranked[:8]}, OUTPUT_DIR, f'sweep_{name}_top.png',
+                     f"Sweep {name}: Top Strategies")
+        print(f"\n  Top equity: {fpath}")
+    return cells, results
+
+
+def run_walk_forward(spec):
+    """Walk-forward optimization of the spec's grid (spec['walk_forward'] options)."""
+    _, _, module, _, to_cfg = _strategy(spec)
+    frames = load_frames(spec)
+    wf = spec.get('walk_forward', {})
+    grid = [{**to_cfg(cell), 'label': cell['label']} for cell in build_cells(spec)]
+    bounds = windows(frames[next(iter(spec['timeframes']))], wf.get('train', '365D'), wf.get('test', '90D'),
+                     step=wf.get('step'), anchored=wf.get('anchored', False))
+    print(f"\n  {len(grid)} configs x {len(bounds)} windows (train {wf.get('train', '365D')}, "
+          f"test {wf.get('test', '90D')}{', anchored' if wf.get('anchored') else ''})\n")
+    report = walk_forward(module, grid, frames, bounds, objective=wf.get('objective', 'pnl'),
+                          min_trades=wf.get('min_trades', 5))
+    print_report(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a declarative backtest sweep")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('sweep', help="run the grid described in a spec file")
+    p.add_argument('spec', help="YAML / TOML / JSON spec")
+    p.add_argument('--workers', type=int, default=None, help="process count (default: all cores)")
+    p.add_argument('--no-charts', action='store_true', help="skip chart rendering")
+    p.add_argument('--top', type=int, default=15)
+    p = sub.add_parser('walkforward', help="walk-forward optimization of the spec's grid")
+    p.add_argument('spec', help="YAML / TOML / JSON spec")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    spec['_path'] = args.spec
+    if args.command == 'walkforward':
+        run_walk_forward(spec)
+        return
+    run_spec(spec, workers=args.workers, charts=spec.get('charts', True) and not args.no_charts,
+             top=args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Regression test: engine.run_backtest against frozen copies of the Python loops it
+replaced (backtest_fixed / backtest_fixed_pct / backtest_atr_based), on a seeded
+synthetic OHLC series.
+
+  python -m pytest -q ml-trading/test_engine.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import EXIT_REASONS, run_backtest
+from signals import LONG, build_signals
+
+SL_TP = {'atr': [(2.0, 6.0), (1.5, 7.5), (1.0, 5.0)],
+         'pct': [(0.05, 0.15), (0.02, 0.10), (0.03, 0.09)]}
+
+
+def _baseline(df, signals, mode, sl_v, tp_v, fee=0.0006, max_hold=60, risk=0.02, max_risk=0.05):
+    """The pre-engine loops; mode 'pct' is backtest_fixed_pct, 'atr' backtest_atr_based / backtest_fixed."""
+    c = df['close'].values.astype(float)
+    h = df['high'].values.astype(float)
+    l = df['low'].values.astype(float)
+    n = len(c)
+    trades = []; equity = 10000.0
+    i = 0
+    while i < len(signals):
+        sig = signals[i]; eb=int(sig['bar']); ep=sig['price']; d='LONG' if sig['direction']==LONG else 'SHORT'
+        if mode == 'pct':
+            if ep * sl_v <= 0: i+=1; continue
+            sl = ep*(1-sl_v) if d=='LONG' else ep*(1+sl_v)
+            tp = ep*(1+tp_v) if d=='LONG' else ep*(1-tp_v)
+        else:
+            a = sig['atr']
+            if np.isnan(a) or a<=0: i+=1; continue
+            sl = ep-a*sl_v if d=='LONG' else ep+a*sl_v
+            tp = ep+a*tp_v if d=='LONG' else ep-a*tp_v
+        rk = abs(ep-sl)
+        if rk<=0 or rk/ep>max_risk: i+=1; continue
+        ps = (equity*risk)/rk; ec = ep*ps*fee
+        xb=xp=xr=None
+        for bar in range(eb+1, min(eb+max_hold, n)):
+            if d=='LONG':
+                if l[bar]<=sl: xb,xp,xr=bar,sl,'SL'; break
+                if h[bar]>=tp: xb,xp,xr=bar,tp,'TP'; break
+            else:
+                if h[bar]>=sl: xb,xp,xr=bar,sl,'SL'; break
+                if l[bar]<=tp: xb,xp,xr=bar,tp,'TP'; break
+        if xb is None: xb=min(eb+max_hold-1,n-1); xp=c[xb]; xr='TIME'
+        xc = xp*ps*fee
+        pnl = ((xp-ep) if d=='LONG' else (ep-xp))*ps - ec - xc
+        equity += pnl
+        if equity<=0: equity=0
+        trades.append({'exit_bar':xb,'pnl':pnl,'exit_reason':xr})
+        if equity<=0: break
+        while i+1<len(signals) and signals[i+1]['bar']<=xb: i+=1
+        i+=1
+    return trades, equity
+
+
+@pytest.fixture(scope='module')
+def market():
+    rng = np.random.default_rng(7)
+    n = 6000
+    c = 30000.0 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    o = np.r_[c[0], c[:-1]]
+    h = np.maximum(o, c) * (1 + rng.exponential(0.002, n))
+    l = np.minimum(o, c) * (1 - rng.exponential(0.002, n))
+    df = pd.DataFrame({'timestamp': pd.date_range('2022-01-01', periods=n, freq='30min'),
+                       'open': o, 'high': h, 'low': l, 'close': c, 'volume': 1.0})
+    atr = c * rng.uniform(0.002, 0.03, n)
+    atr[rng.random(n) < 0.02] = np.nan
+    atr[rng.random(n) < 0.01] = 0.0
+    pick = rng.random(n) < 0.03
+    up = rng.random(n) < 0.5
+    sigs = build_signals(pick & up, pick & ~up, 20, c, atr)
+    return df, sigs
+
+
+@pytest.mark.parametrize('mode', ['atr', 'pct'])
+@pytest.mark.parametrize('max_risk', [0.05, 0.10])
+@pytest.mark.parametrize('max_hold', [1, 60, 500])
+@pytest.mark.parametrize('grid', [False, True])
+def test_engine_matches_python_loops(market, mode, max_risk, max_hold, grid):
+    df, sigs = market
+    for sl, tp in SL_TP[mode]:
+        expected, equity = _baseline(df, sigs, mode, sl, tp, max_hold=max_hold, max_risk=max_risk)
+        trades, eq = run_backtest(df, sigs, mode=mode, sl=sl, tp=tp, max_hold=max_hold,
+                                  max_risk=max_risk, exit_grid=SL_TP[mode] if grid else None)
+        assert len(trades) == len(expected) > 0
+        assert trades['exit_bar'].tolist() == [t['exit_bar'] for t in expected]
+        assert [EXIT_REASONS[r] for r in trades['exit_reason']] == [t['exit_reason'] for t in expected]
+        assert trades['pnl'].tolist() == [t['pnl'] for t in expected]
+        assert eq == equity
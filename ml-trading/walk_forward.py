@@ -0,0 +1,194 @@
+"""
+Walk-Forward Optimization
+=========================
+Rolling in-sample / out-of-sample evaluation of the scripts' grids
+(TF x ADX x SL/TP, keyvalue x SL/TP, HTF filter x ...) instead of picking
+the best cell from one full-period run:
+
+  1. windows() lays train / test windows over time (train length, test length,
+     step; anchored=True grows the train window from the first bar instead of
+     sliding it); each frame maps them to bar ranges with searchsorted
+  2. every cell's signals come from the full-history frames once (the script's
+     config_signals, shared indicator registry - indicators only look back, so
+     a window never sees later bars through them) and its exits are resolved
+     once per signal set for all of that set's SL/TP pairs (engine.exit_outcomes)
+  3. per window, every cell is replayed on the bars of the train slice: signals
+     in [lo, hi), exits after bar hi - 1 closed on it, i.e. the same trades as a
+     backtest on the frame cut at hi. batch_metrics ranks the cells and the
+     best one (objective among cells with >= min_trades) is replayed on the
+     following test slice
+  4. the out-of-sample slices are chained (each test starts from the previous
+     one's equity) into one OOS track record
+
+Only the sequential position / equity pass runs per (window, cell), so
+hundreds of windows cost little more than the full-period sweep itself.
+
+Usage:
+  import supertrend_ema_freq_optimize as freq
+  wins = windows(frames['2H'], train='365D', test='90D')
+  report = walk_forward(freq, grid, frames, wins, objective='pnl', min_trades=5)
+  print_report(report)
+
+  python ml-trading/sweep_cli.py walkforward ml-trading/sweeps/walk_forward_freq.toml
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from engine import EXIT_TIME, INITIAL_EQUITY, TRADE_DTYPE, exit_outcomes, simulate
+from indicator_cache import dataset_fingerprint
+from metrics import batch_metrics
+
+YEAR_NS = 365.25 * 86400 * 1e9
+
+
+def _ts(df):
+    return df['timestamp'].values.astype('datetime64[ns]').view(np.int64)
+
+
+def windows(df, train, test, step=None, anchored=False):
+    """
+    [(train_start, test_start, test_end)] epoch-ns bounds (end exclusive) over df's
+    time span; step defaults to test (back-to-back test windows). The last test
+    window may be shorter.
+    """
+    ts = _ts(df)
+    if len(ts) == 0:
+        return []
+    train_ns, test_ns = pd.Timedelta(train).value, pd.Timedelta(test).value
+    step_ns = pd.Timedelta(step).value if step is not None else test_ns
+    first, stop = int(ts[0]), int(ts[-1]) + 1
+    out = []
+    k = 0
+    while first + train_ns + k * step_ns < stop:
+        test_start = first + train_ns + k * step_ns
+        train_start = first if anchored else test_start - train_ns
+        out.append((train_start, test_start, min(test_start + test_ns, stop)))
+        k += 1
+    return out
+
+
+def prepare_cells(module, grid, frames):
+    """
+    Signals + exit outcomes of every grid cell on the full-history frames. The
+    SL/TP pairs of cells sharing a signal set are resolved in one outcome pass.
+    """
+    cells, groups = [], {}
+    for cfg in grid:
+        df, sigs = module.config_signals(frames, cfg)
+        mode, sl, tp, max_risk = module.config_exits(cfg)
+        key = (dataset_fingerprint(df), hashlib.sha1(np.ascontiguousarray(sigs).tobytes()).hexdigest(),
+               mode, int(cfg['max_hold']))
+        pairs = groups.setdefault(key, [])
+        if (float(sl), float(tp)) not in pairs:
+            pairs.append((float(sl), float(tp)))
+        cells.append({'cfg': cfg, 'df': df, 'sigs': sigs, 'key': key, 'pair': (float(sl), float(tp)),
+                      'max_risk': max_risk})
+    for cell in cells:
+        pairs = groups[cell['key']]
+        sl_px, tp_px, valid, x_bar, x_price, x_reason = exit_outcomes(
+            cell['df'], cell['sigs'], cell['key'][2], pairs, cell['key'][3], frames.get('M5'))
+        j = pairs.index(cell['pair'])
+        df = cell['df']
+        cell.update(ts=_ts(df), h=df['high'].values.astype(float), l=df['low'].values.astype(float),
+                    c=df['close'].values.astype(float), max_hold=cell['key'][3],
+                    sl_px=sl_px[:, j], tp_px=tp_px[:, j], valid=valid[:, j],
+                    x_bar=x_bar[:, j], x_price=x_price[:, j], x_reason=x_reason[:, j])
+    return cells
+
+
+def replay(cell, start, end, equity0=INITIAL_EQUITY, risk=0.02, fee=0.0006):
+    """
+    A cell's trades on the bars opening in [start, end) (epoch ns): signals in
+    the range, exits past its last bar closed there (TIME). Returns (trades, equity).
+    """
+    lo, hi = np.searchsorted(cell['ts'], [start, end])
+    a, b = np.searchsorted(cell['sigs']['bar'], [lo, hi])
+    if a == b:
+        return np.empty(0, dtype=TRADE_DTYPE), equity0
+    x_bar, x_price, x_reason = cell['x_bar'][a:b], cell['x_price'][a:b], cell['x_reason'][a:b]
+    # invalid signals have x_bar 0 and are never entered
+    late = x_bar >= hi
+    c = cell['c'][:hi]
+    trades, equity = simulate(
+        cell['h'][:hi], cell['l'][:hi], c, cell['sigs'][a:b],
+        cell['sl_px'][a:b], cell['tp_px'][a:b], cell['valid'][a:b], fee=fee,
+        max_hold=cell['max_hold'], risk=risk, max_risk=cell['max_risk'], equity0=equity0,
+        outcomes=(np.where(late, hi - 1, x_bar), np.where(late, c[hi - 1], x_price),
+                  np.where(late, EXIT_TIME, x_reason).astype(np.int8)))
+    trades['sig'] += a
+    return trades, equity
+
+
+def _score(metrics, objective):
+    return np.asarray(objective(metrics) if callable(objective) else metrics[objective], dtype=float)
+
+
+def walk_forward(module, grid, frames, bounds, objective='pnl', min_trades=5, risk=0.02,
+                 equity0=INITIAL_EQUITY):
+    """
+    module: a strategy script (config_signals / config_exits); grid: its cell cfgs
+    (with 'label' and 'max_hold'); bounds: windows(). objective: batch_metrics key or
+    metrics -> scores. Returns {'windows': [...], 'oos': metrics dict, 'equity',
+    'is_annual', 'oos_annual', 'wfe'}.
+    """
+    cells = prepare_cells(module, grid, frames)
+    equity = equity0
+    rows, oos_trades = [], []
+    for train_start, test_start, test_end in bounds:
+        runs = [replay(cell, train_start, test_start, equity0, risk) for cell in cells]
+        m = batch_metrics([t for t, _ in runs], equity0)
+        score = np.where(m['total'] >= min_trades, _score(m, objective), -np.inf)
+        row = {'train': (train_start, test_start), 'test': (test_start, test_end), 'label': None}
+        if len(cells) and np.isfinite(score.max()):
+            best = int(np.argmax(score))
+            trades, end_equity = replay(cells[best], test_start, test_end, equity, risk)
+            oos = {k: v[0] for k, v in batch_metrics([trades], equity).items()}
+            row.update(label=cells[best]['cfg']['label'], cfg=cells[best]['cfg'], score=score[best],
+                       is_metrics={k: v[best] for k, v in m.items()}, oos=oos, equity0=equity,
+                       trades=trades)
+            oos_trades.append(trades)
+            equity = end_equity
+        rows.append(row)
+        if equity <= 0:
+            break
+
+    chosen = [r for r in rows if r['label'] is not None]
+    is_annual = [r['is_metrics']['pnl'] / equity0 * 100 / ((r['train'][1] - r['train'][0]) / YEAR_NS)
+                 for r in chosen]
+    oos_annual = [r['oos']['pnl'] / r['equity0'] * 100 / ((r['test'][1] - r['test'][0]) / YEAR_NS)
+                  for r in chosen]
+    all_oos = np.concatenate(oos_trades) if oos_trades else np.empty(0, dtype=TRADE_DTYPE)
+    is_mean = float(np.mean(is_annual)) if is_annual else 0.0
+    oos_mean = float(np.mean(oos_annual)) if oos_annual else 0.0
+    return {'windows': rows, 'oos': {k: v[0] for k, v in batch_metrics([all_oos], equity0).items()},
+            'equity': equity, 'is_annual': is_mean, 'oos_annual': oos_mean,
+            'wfe': oos_mean / is_mean if is_mean > 0 else 0.0}
+
+
+def _day(t):
+    return pd.Timestamp(t).strftime('%Y-%m-%d')
+
+
+def print_report(report):
+    print(f"  {'Train':<23s} {'Test':<23s} {'Winner (in-sample)':<45s} {'IS P&L':>9s} "
+          f"{'OOS Trd':>7s} {'OOS P&L':>9s} {'OOS PF':>6s} {'Equity':>10s}")
+    print("  " + "-" * 141)
+    for r in report['windows']:
+        train = f"{_day(r['train'][0])}~{_day(r['train'][1])}"
+        test = f"{_day(r['test'][0])}~{_day(r['test'][1])}"
+        if r['label'] is None:
+            print(f"  {train:<23s} {test:<23s} {'-> no cell with enough trades':<45s}")
+            continue
+        o = r['oos']
+        pf_str = "     -" if o['total'] == 0 else f"{o['pf']:>6.2f}" if o['pf'] < 100 else "   INF"
+        print(f"  {train:<23s} {test:<23s} {r['label']:<45s} ${r['is_metrics']['pnl']:>8,.0f} "
+              f"{o['total']:>7d} ${o['pnl']:>8,.0f} {pf_str} ${r['equity0'] + o['pnl']:>9,.0f}")
+    o = report['oos']
+    pf_str = f"{o['pf']:.2f}" if o['pf'] < 100 else "INF"
+    print(f"\n  OOS total: {o['total']} trades  WR:{o['wr']:.1f}%  PF:{pf_str}  P&L:${o['pnl']:,.0f}  "
+          f"MDD:{o['mdd']:.1f}%  Final:${report['equity']:,.0f}")
+    print(f"  Annualised return: in-sample {report['is_annual']:.1f}%  out-of-sample "
+          f"{report['oos_annual']:.1f}%  (walk-forward efficiency {report['wfe']:.2f})")